@@ -0,0 +1,739 @@
+"""Offline benchmarks for the download pipeline
+
+Serves synthetic progressive files, HLS playlists and DASH manifests from a
+local HTTP server with configurable latency, per-connection bandwidth and
+error injection, and drives main.py's real job path (get_video_info,
+download_video, the progress hooks, post-processing and history) against it
+through yt-dlp's generic extractor. No network access is needed.
+
+    python benchmark.py --json before.json
+    python benchmark.py --json after.json --compare before.json
+"""
+import argparse
+import contextlib
+import importlib
+import json
+import math
+import os
+import platform
+import queue
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCHMARK_FORMAT = 1  # bump when the JSON layout changes
+SECTIONS = ('metadata', 'throughput', 'cancel', 'history')
+KINDS = ('progressive', 'hls', 'dash')
+PATTERN_SIZE = 1024 * 1024  # synthetic media repeats this many pseudo-random bytes
+SEND_BLOCK = 16384
+FRAGMENT_SECONDS = 4  # nominal duration of one HLS / DASH fragment
+STALL_AFTER = 256 * 1024  # bytes a response sends before an injected stall
+JOB_TIMEOUT = 600
+CANCEL_DELAY = 0.5  # seconds of transfer before a cancellation is requested
+
+app = None  # main.py, imported once the working directory is in place
+
+# Media server
+class ServerProfile:
+    """Network conditions the media server simulates; changed between scenarios"""
+
+    def __init__(self, latency=0.0, bandwidth=0, error_rate=0.0, stall=0.0, seed=0):
+        self.latency = latency  # seconds before each response
+        self.bandwidth = bandwidth  # bytes/s per connection, 0 = unlimited
+        self.error_rate = error_rate  # share of media requests that fail
+        self.stall = stall  # seconds each media response hangs after STALL_AFTER bytes
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def override(self, **changes):
+        saved = {name: getattr(self, name) for name in changes}
+        for name, value in changes.items():
+            setattr(self, name, value)
+        try:
+            yield self
+        finally:
+            for name, value in saved.items():
+                setattr(self, name, value)
+
+    def injected_error(self):
+        """None, 'status' for an HTTP 503 or 'drop' for a connection closed half way"""
+        with self.lock:
+            if self.error_rate <= 0 or self.random.random() >= self.error_rate:
+                return None
+            return self.random.choice(('status', 'drop'))
+
+class MediaServer(ThreadingHTTPServer):
+    """Loopback HTTP server for synthetic media
+
+    /progressive/<name>.mp4           one file with byte range support
+    /hls/<name>.m3u8                  master playlist with a single 720p variant
+    /hls/<name>/media.m3u8            its media playlist
+    /hls/<name>/seg-<n>.ts            fragments
+    /dash/<name>.mpd                  manifest with one muxed representation
+    /dash/<name>/init.mp4, seg-<n>.m4s
+    """
+    daemon_threads = True
+
+    def __init__(self, profile, file_size, fragments, seed=0):
+        super().__init__(('127.0.0.1', 0), MediaRequestHandler)
+        self.profile = profile
+        self.file_size = file_size
+        self.fragments = fragments
+        self.fragment_size = max(1, file_size // fragments)
+        pattern = random.Random(seed).randbytes(PATTERN_SIZE)
+        self.pattern = memoryview(pattern + pattern)  # any PATTERN_SIZE window is one slice
+        self.stats_lock = threading.Lock()
+        self.stats = {'requests': 0, 'bytes_sent': 0, 'errors_injected': 0, 'stalls': 0}
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def url(self, kind, name):
+        ext = {'progressive': 'mp4', 'hls': 'm3u8', 'dash': 'mpd'}[kind]
+        return f'{self.base_url}/{kind}/{name}.{ext}'
+
+    def media_size(self, kind):
+        """Bytes a client transfers for one item of the given kind"""
+        if kind == 'progressive':
+            return self.file_size
+        return self.fragment_size * self.fragments
+
+    def data(self, offset, length):
+        start = offset % PATTERN_SIZE
+        return self.pattern[start:start + length]
+
+    def count(self, **values):
+        with self.stats_lock:
+            for name, value in values.items():
+                self.stats[name] += value
+
+    def handle_error(self, request, client_address):
+        # Clients hang up mid-response all the time here: cancellations, probes, timeouts
+        if not isinstance(sys.exc_info()[1], OSError):
+            super().handle_error(request, client_address)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True, name='MediaServer').start()
+        return self
+
+class MediaRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.handle_media(head=True)
+
+    def do_GET(self):
+        self.handle_media(head=False)
+
+    def handle_media(self, head):
+        server = self.server
+        profile = server.profile
+        server.count(requests=1)
+        if profile.latency:
+            time.sleep(profile.latency)
+
+        path = self.path.split('?', 1)[0]
+        match = re.fullmatch(r'/(progressive|hls|dash)/([\w.-]+?)(?:\.(mp4|m3u8|mpd)|/(media\.m3u8|init\.mp4|seg-(\d+)\.(?:ts|m4s)))', path)
+        if match is None:
+            return self.send_text(404, 'text/plain', 'Not found', head)
+        kind, name, ext, member, fragment = match.groups()
+
+        if kind == 'progressive' and ext == 'mp4':
+            return self.send_media('video/mp4', 0, server.file_size, head)
+        if kind == 'hls' and ext == 'm3u8':
+            return self.send_text(200, 'application/vnd.apple.mpegurl', hls_master_playlist(name), head)
+        if kind == 'hls' and member == 'media.m3u8':
+            return self.send_text(200, 'application/vnd.apple.mpegurl', hls_media_playlist(server.fragments), head)
+        if kind == 'dash' and ext == 'mpd':
+            return self.send_text(200, 'application/dash+xml', dash_manifest(name, server.fragments), head)
+        if kind == 'dash' and member == 'init.mp4':
+            return self.send_media('video/mp4', 0, 1024, head)
+        if fragment is not None and 0 <= int(fragment) - (kind == 'dash') < server.fragments:
+            index = int(fragment) - (kind == 'dash')  # DASH numbers from 1
+            content_type = 'video/mp2t' if kind == 'hls' else 'video/iso.segment'
+            return self.send_media(content_type, index * server.fragment_size, server.fragment_size, head, fragment=True)
+        return self.send_text(404, 'text/plain', 'Not found', head)
+
+    def send_text(self, status, content_type, text, head):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def send_media(self, content_type, offset, size, head, fragment=False):
+        start, end = 0, size - 1
+        status = 200
+        byte_range = self.headers.get('Range')
+        if byte_range:
+            match = re.fullmatch(r'bytes=(\d+)-(\d*)', byte_range.strip())
+            if match is None or int(match[1]) >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            start = int(match[1])
+            end = min(int(match[2]), size - 1) if match[2] else size - 1
+            status = 206
+
+        # Fragments and resumed ranges can fail; the first request for a file always succeeds
+        error = self.server.profile.injected_error() if not head and (fragment or start > 0) else None
+        if error is not None:
+            self.server.count(errors_injected=1)
+        if error == 'status':
+            return self.send_text(503, 'text/plain', 'Injected failure', head)
+
+        length = end - start + 1
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(length))
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+        if not head:
+            self.stream(offset + start, length // 2 if error == 'drop' else length)
+            if error == 'drop':
+                self.close_connection = True
+
+    def stream(self, offset, length):
+        profile = self.server.profile
+        sent = 0
+        began = time.perf_counter()
+        stalled = False
+        try:
+            while sent < length:
+                if profile.stall and not stalled and sent >= STALL_AFTER:
+                    stalled = True
+                    self.server.count(stalls=1)
+                    time.sleep(profile.stall)
+                block = min(SEND_BLOCK, length - sent)
+                self.wfile.write(self.server.data(offset + sent, block))
+                sent += block
+                if profile.bandwidth:
+                    delay = began + sent / profile.bandwidth - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+        except OSError:
+            # The client went away: cancelled, timed out or done with a probe
+            self.close_connection = True
+        finally:
+            self.server.count(bytes_sent=sent)
+
+def hls_master_playlist(name):
+    return ('#EXTM3U\n'
+            '#EXT-X-STREAM-INF:BANDWIDTH=2500000,RESOLUTION=1280x720,CODECS="avc1.64001f,mp4a.40.2"\n'
+            f'{name}/media.m3u8\n')
+
+def hls_media_playlist(fragments):
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3', f'#EXT-X-TARGETDURATION:{FRAGMENT_SECONDS}',
+             '#EXT-X-MEDIA-SEQUENCE:0', '#EXT-X-PLAYLIST-TYPE:VOD']
+    for index in range(fragments):
+        lines += [f'#EXTINF:{FRAGMENT_SECONDS}.0,', f'seg-{index}.ts']
+    lines.append('#EXT-X-ENDLIST')
+    return '\n'.join(lines) + '\n'
+
+def dash_manifest(name, fragments):
+    return f'''<?xml version="1.0" encoding="UTF-8"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" profiles="urn:mpeg:dash:profile:isoff-on-demand:2011"
+     mediaPresentationDuration="PT{fragments * FRAGMENT_SECONDS}S" minBufferTime="PT2S">
+  <Period>
+    <AdaptationSet mimeType="video/mp4" segmentAlignment="true">
+      <Representation id="720p" codecs="avc1.64001f,mp4a.40.2" width="1280" height="720" bandwidth="2500000">
+        <SegmentTemplate timescale="1" duration="{FRAGMENT_SECONDS}" startNumber="1"
+                         initialization="{name}/init.mp4" media="{name}/seg-$Number$.m4s"/>
+      </Representation>
+    </AdaptationSet>
+  </Period>
+</MPD>
+'''
+
+# Instrumentation
+class EventRecorder:
+    """Subscribes to the events main.py pushes to the UI and records when each job reaches a state"""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.cond = threading.Condition()
+        self.first_progress = {}  # download_id -> perf_counter of the first 'downloading' update
+        self.terminal = {}  # download_id -> (status, perf_counter, data)
+        self.batches = 0
+        self.updates = 0
+
+    def start(self):
+        with app.event_lock:
+            app.event_subscribers.append(self.queue)
+        threading.Thread(target=self.run, daemon=True, name='EventRecorder').start()
+        return self
+
+    def run(self):
+        while True:
+            name, args = self.queue.get()
+            now = time.perf_counter()
+            with self.cond:
+                if name == 'update_progress_batch':
+                    self.batches += 1
+                    for download_id, data in args[0].items():
+                        self.record(download_id, data, now)
+                elif name == 'update_progress':
+                    self.record(args[0], args[1], now)
+                self.cond.notify_all()
+
+    def record(self, download_id, data, now):
+        self.updates += 1
+        status = data.get('status')
+        if status == 'downloading':
+            self.first_progress.setdefault(download_id, now)
+        elif status in app.TERMINAL_PROGRESS_STATES:
+            self.terminal[download_id] = (status, now, data)
+
+    def reset_counts(self):
+        with self.cond:
+            self.batches = self.updates = 0
+
+    def wait(self, predicate, timeout):
+        with self.cond:
+            if not self.cond.wait_for(predicate, timeout):
+                raise TimeoutError('Timed out waiting for download events')
+
+    def wait_for_terminal(self, download_ids, timeout=JOB_TIMEOUT):
+        self.wait(lambda: all(i in self.terminal for i in download_ids), timeout)
+        with self.cond:
+            return {i: self.terminal[i] for i in download_ids}
+
+    def wait_for_progress(self, download_id, timeout=JOB_TIMEOUT):
+        self.wait(lambda: download_id in self.first_progress or download_id in self.terminal, timeout)
+
+class HookTimer:
+    """Times the application's progress hooks as yt-dlp's downloaders call them"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.calls = 0
+            self.seconds = 0.0
+            self.slowest = 0.0
+
+    def install(self):
+        ydl_class = app.load_yt_dlp().YoutubeDL
+        original = ydl_class.add_progress_hook
+        timer = self
+
+        def add_progress_hook(self, hook):
+            def timed_hook(status):
+                started = time.perf_counter()
+                try:
+                    return hook(status)
+                finally:
+                    timer.record(time.perf_counter() - started)
+            return original(self, timed_hook)
+
+        ydl_class.add_progress_hook = add_progress_hook
+        return self
+
+    def record(self, elapsed):
+        with self.lock:
+            self.calls += 1
+            self.seconds += elapsed
+            self.slowest = max(self.slowest, elapsed)
+
+class WorkerTracker:
+    """Records when a download worker lets go of a job"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.returned = {}  # download_id -> perf_counter
+
+    def install(self):
+        original = app.run_download
+
+        def run_download(job):
+            try:
+                return original(job)
+            finally:
+                with self.cond:
+                    self.returned[job.download_id] = time.perf_counter()
+                    self.cond.notify_all()
+
+        app.run_download = run_download
+        return self
+
+    def wait_for(self, download_id, timeout=JOB_TIMEOUT):
+        with self.cond:
+            if not self.cond.wait_for(lambda: download_id in self.returned, timeout):
+                raise TimeoutError(f'Worker never released {download_id}')
+            return self.returned[download_id]
+
+def summarize(seconds):
+    """count / mean / p50 / p95 / max of a list of durations, in milliseconds"""
+    if not seconds:
+        return {'count': 0}
+    values = sorted(s * 1000 for s in seconds)
+    return {
+        'count': len(values),
+        'mean_ms': round(statistics.fmean(values), 3),
+        'p50_ms': round(statistics.median(values), 3),
+        'p95_ms': round(values[math.ceil(len(values) * 0.95) - 1], 3),
+        'max_ms': round(values[-1], 3),
+    }
+
+# Scenarios
+class Benchmark:
+    def __init__(self, args, server, workdir):
+        self.args = args
+        self.server = server
+        self.download_path = os.path.join(workdir, 'downloads')
+        self.events = EventRecorder().start()
+        self.hooks = HookTimer().install()
+        self.workers = WorkerTracker().install()
+        self.run_id = uuid.uuid4().hex[:6]
+
+    def configure(self, **settings):
+        config = app.thaw_config(app.load_config())
+        config.update(settings)
+        app.save_config(config)
+
+    def name(self, label):
+        """Unique media name, so output files and cached metadata never collide across runs"""
+        return f'{label}-{self.run_id}-{uuid.uuid4().hex[:6]}'
+
+    def clear_downloads(self):
+        shutil.rmtree(self.download_path, ignore_errors=True)
+
+    def choose_format(self, url):
+        """The format_id the UI would offer for the best quality"""
+        result = app.get_video_info(url)
+        if not result['success']:
+            raise RuntimeError(f"get_video_info failed for {url}: {result['technical_error']}")
+        return result['formats'][-1]['format_id']
+
+    def start_job(self, url, format_id):
+        download_id = f'bench-{uuid.uuid4().hex[:12]}'
+        app.download_video(url, 'video', '1080', download_id, format_id=format_id)
+        return download_id
+
+    def partial_files(self):
+        if not os.path.isdir(self.download_path):
+            return 0
+        return sum(1 for name in os.listdir(self.download_path) if name.endswith(('.part', '.ytdl', '.segments')) or '.part-Frag' in name)
+
+    def metadata(self):
+        """get_video_info latency on a metadata cache miss and on a hit"""
+        results = {}
+        for kind in self.args.kinds:
+            # Untimed first call, so yt-dlp's lazy extractor imports are not counted
+            app.get_video_info(self.server.url(kind, self.name('warmup')))
+            url = self.server.url(kind, self.name('meta'))
+            cold, warm = [], []
+            for _ in range(self.args.metadata_runs):
+                app.invalidate_video_info(url)
+                started = time.perf_counter()
+                result = app.get_video_info(url)
+                cold.append(time.perf_counter() - started)
+                if not result['success']:
+                    raise RuntimeError(f"get_video_info failed for {url}: {result['technical_error']}")
+                started = time.perf_counter()
+                app.get_video_info(url)
+                warm.append(time.perf_counter() - started)
+            results[kind] = {'cold': summarize(cold), 'warm': summarize(warm)}
+            report(f"metadata  {kind:<12} cold p50 {results[kind]['cold']['p50_ms']:8.1f} ms   "
+                   f"warm p50 {results[kind]['warm']['p50_ms']:6.2f} ms")
+        return results
+
+    def throughput(self):
+        """Aggregate throughput of a fixed batch of jobs at each worker pool size, with hook and UI event costs"""
+        results = {}
+        for kind in self.args.kinds:
+            results[kind] = {}
+            for concurrency in self.args.concurrency:
+                self.configure(max_concurrent_downloads=concurrency)
+                self.clear_downloads()
+                urls = [self.server.url(kind, self.name(f'{kind}-c{concurrency}')) for _ in range(self.args.jobs)]
+                formats = [self.choose_format(url) for url in urls]
+
+                self.hooks.reset()
+                self.events.reset_counts()
+                started = time.perf_counter()
+                download_ids = [self.start_job(url, format_id) for url, format_id in zip(urls, formats)]
+                outcomes = self.events.wait_for_terminal(download_ids)
+                elapsed = time.perf_counter() - started
+
+                failed = [data.get('technical_error') or status for status, _, data in outcomes.values() if status != 'completed']
+                total_bytes = self.server.media_size(kind) * (len(download_ids) - len(failed))
+                job_seconds = [finished - started for _, finished, _ in outcomes.values()]
+                mb = total_bytes / (1024 * 1024)
+                result = {
+                    'jobs': len(download_ids),
+                    'failed': len(failed),
+                    'bytes': total_bytes,
+                    'seconds': round(elapsed, 3),
+                    'mb_per_s': round(mb / elapsed, 3) if elapsed else 0,
+                    'job_completion': summarize(job_seconds),
+                    'progress': {
+                        'hook_calls': self.hooks.calls,
+                        'hook_ms': round(self.hooks.seconds * 1000, 3),
+                        'hook_mean_us': round(self.hooks.seconds / self.hooks.calls * 1e6, 2) if self.hooks.calls else 0,
+                        'hook_max_us': round(self.hooks.slowest * 1e6, 2),
+                        'hook_calls_per_mb': round(self.hooks.calls / mb, 2) if mb else 0,
+                        'ui_batches': self.events.batches,
+                        'ui_updates': self.events.updates,
+                    },
+                }
+                results[kind][str(concurrency)] = result
+                report(f"transfer  {kind:<12} x{concurrency:<3} {result['mb_per_s']:8.2f} MB/s   "
+                       f"{result['progress']['hook_calls']:6d} hooks @ {result['progress']['hook_mean_us']:7.1f} us   "
+                       f"{result['progress']['ui_batches']:4d} UI batches" + (f"   {len(failed)} FAILED: {failed[0]}" if failed else ''))
+        self.clear_downloads()
+        return results
+
+    def cancel_once(self, kind, stalled):
+        url = self.server.url(kind, self.name(f'cancel-{kind}'))
+        stalls = self.server.stats['stalls']
+        download_id = self.start_job(url, self.choose_format(url))
+        self.events.wait_for_progress(download_id)
+        if stalled:
+            deadline = time.monotonic() + JOB_TIMEOUT
+            while self.server.stats['stalls'] == stalls and time.monotonic() < deadline:
+                time.sleep(0.01)
+        time.sleep(CANCEL_DELAY)
+
+        requested = time.perf_counter()
+        app.cancel_download(download_id)
+        outcome = self.events.wait_for_terminal([download_id])[download_id]
+        released = self.workers.wait_for(download_id)
+        return outcome[0], outcome[1] - requested, released - requested
+
+    def cancel(self):
+        """Time from cancel_download to the 'cancelled' event and to the worker going idle"""
+        scenarios = {
+            # Data keeps arriving, so the next progress hook notices the cancellation
+            'streaming': {'kind': 'progressive', 'bandwidth': 256 * 1024, 'stall': 0},
+            'streaming_hls': {'kind': 'hls', 'bandwidth': 256 * 1024, 'stall': 0},
+            # Every response hangs mid-body, so no hook runs until a socket read times out
+            'stalled': {'kind': 'progressive', 'bandwidth': 256 * 1024, 'stall': self.args.stall},
+        }
+        self.configure(max_concurrent_downloads=1)
+        results = {}
+        for label, scenario in scenarios.items():
+            if scenario['kind'] not in self.args.kinds:
+                continue
+            self.clear_downloads()
+            event, idle, statuses = [], [], []
+            with self.server.profile.override(bandwidth=scenario['bandwidth'], stall=scenario['stall']):
+                for _ in range(self.args.cancel_runs):
+                    status, to_event, to_idle = self.cancel_once(scenario['kind'], bool(scenario['stall']))
+                    statuses.append(status)
+                    event.append(to_event)
+                    idle.append(to_idle)
+            results[label] = {
+                'to_event': summarize(event),
+                'to_idle': summarize(idle),
+                'not_cancelled': sum(1 for s in statuses if s != 'cancelled'),
+                'partial_files_left': self.partial_files(),
+            }
+            report(f"cancel    {label:<16} event p50 {results[label]['to_event']['p50_ms']:8.1f} ms   "
+                   f"idle max {results[label]['to_idle']['max_ms']:8.1f} ms   "
+                   f"{results[label]['partial_files_left']} partial files left")
+        self.clear_downloads()
+        return results
+
+    def history(self):
+        """add_to_history, page and count latency as the history table grows"""
+        app.delete_all_history()
+        insert = f"INSERT INTO history ({', '.join(app.HISTORY_COLUMNS)}) VALUES ({', '.join('?' * len(app.HISTORY_COLUMNS))})"
+        rows = 0
+        results = {}
+        for size in sorted(self.args.history_sizes):
+            # Filler rows go straight to SQLite; only the measured writes use add_to_history
+            filler = [(f'Benchmark clip {i}', f'{self.server.base_url}/progressive/clip-{i}.mp4', f'clip-{i}', '',
+                       60, datetime.now().isoformat(), '1080p video', 1048576) for i in range(rows, size)]
+            with app.history_db_lock:
+                db = app.get_history_db()
+                with db:
+                    db.executemany(insert, filler)
+            rows = max(rows, size)
+
+            writes, pages, counts, searches = [], [], [], []
+            for i in range(self.args.history_writes):
+                info = {'title': f'Benchmark write {i}', 'webpage_url': f'{self.server.base_url}/progressive/write-{i}.mp4',
+                        'id': f'write-{i}', 'duration': 60, 'format_selected': '1080p video', 'filesize': 1048576}
+                started = time.perf_counter()
+                app.add_to_history(info, '')
+                writes.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                app.get_history(0, 100)
+                pages.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                app.get_history_count()
+                counts.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                app.get_history(0, 100, f'clip {i}')
+                searches.append(time.perf_counter() - started)
+            rows += self.args.history_writes
+
+            results[str(size)] = {'add': summarize(writes), 'page': summarize(pages),
+                                  'count': summarize(counts), 'search': summarize(searches)}
+            report(f"history   {size:>8} rows   add p50 {results[str(size)]['add']['p50_ms']:7.2f} ms   "
+                   f"page p50 {results[str(size)]['page']['p50_ms']:7.2f} ms   "
+                   f"search p50 {results[str(size)]['search']['p50_ms']:7.2f} ms")
+        app.delete_all_history()
+        return results
+
+# Reporting
+def report(line):
+    # sys.stdout itself is silenced while the scenarios run
+    print(line, file=sys.__stdout__, flush=True)
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=10,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'yt_dlp': app.load_yt_dlp().version.__version__,
+        'ffmpeg': shutil.which('ffmpeg') is not None,
+        'commit': commit,
+    }
+
+def flatten(value, prefix=''):
+    """Dotted paths to every number in a results tree"""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from flatten(item, f'{prefix}.{key}' if prefix else str(key))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix, value
+
+def compare(baseline, results):
+    """Print every metric present in both runs with its relative change"""
+    before = dict(flatten({s: baseline.get(s, {}) for s in SECTIONS}))
+    after = dict(flatten({s: results.get(s, {}) for s in SECTIONS}))
+    report(f"\nCompared with {baseline.get('environment', {}).get('commit') or 'baseline'} ({baseline.get('started', '?')})")
+    differing = sorted(key for key, value in results['parameters'].items() if baseline.get('parameters', {}).get(key) != value)
+    if differing:
+        report(f"Parameters differ, so not every change is the code's: {', '.join(differing)}")
+    for key in sorted(before.keys() & after.keys()):
+        old, new = before[key], after[key]
+        change = f'{(new - old) / old * 100:+7.1f}%' if old else '      -'
+        report(f'{key:<60} {old:>14.6g} {new:>14.6g} {change}')
+
+def parse_list(cast):
+    return lambda text: [cast(item) for item in text.split(',') if item.strip()]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sections', type=parse_list(str), default=list(SECTIONS), help=f"comma-separated subset of {','.join(SECTIONS)}")
+    parser.add_argument('--kinds', type=parse_list(str), default=list(KINDS), help=f"comma-separated subset of {','.join(KINDS)}")
+    parser.add_argument('--file-size', type=float, default=16, help='MB per synthetic item (default 16)')
+    parser.add_argument('--fragments', type=int, default=16, help='fragments per HLS / DASH item (default 16)')
+    parser.add_argument('--latency', type=float, default=20, help='ms before every response (default 20)')
+    parser.add_argument('--bandwidth', type=float, default=8192, help='KB/s per connection, 0 = unlimited (default 8192)')
+    parser.add_argument('--error-rate', type=float, default=0, help='share of fragment and range requests that fail (default 0)')
+    parser.add_argument('--stall', type=float, default=30, help='seconds a response hangs in the stalled cancel scenario (default 30)')
+    parser.add_argument('--concurrency', type=parse_list(int), default=[1, 2, 4], help='worker pool sizes to measure (default 1,2,4)')
+    parser.add_argument('--extraction-processes', type=int, default=0, help='extraction worker processes, 0 = in-thread (default 0)')
+    parser.add_argument('--jobs', type=int, help='jobs per throughput run (default: the largest --concurrency)')
+    parser.add_argument('--cancel-runs', type=int, default=3)
+    parser.add_argument('--metadata-runs', type=int, default=5)
+    parser.add_argument('--history-sizes', type=parse_list(int), default=[0, 1000, 10000, 100000])
+    parser.add_argument('--history-writes', type=int, default=50, help='measured writes at each history size')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--quick', action='store_true', help='small files and fewer runs, for a smoke test')
+    parser.add_argument('--json', metavar='PATH', help='write machine-readable results here')
+    parser.add_argument('--compare', metavar='PATH', help='earlier --json output to compare against')
+    parser.add_argument('--keep', action='store_true', help='keep the temporary working directory')
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.file_size = min(args.file_size, 4)
+        args.fragments = min(args.fragments, 8)
+        args.concurrency = args.concurrency[:2]
+        args.cancel_runs = 1
+        args.metadata_runs = 2
+        args.history_sizes = [size for size in args.history_sizes if size <= 1000]
+        args.history_writes = min(args.history_writes, 20)
+        args.stall = min(args.stall, 10)
+    args.jobs = args.jobs or max(args.concurrency)
+    unknown = set(args.sections) - set(SECTIONS) or set(args.kinds) - set(KINDS)
+    if unknown:
+        parser.error(f"unknown section or kind: {', '.join(sorted(unknown))}")
+    return args
+
+def run(args):
+    global app
+    source_dir = os.path.dirname(os.path.abspath(__file__))
+    origin = os.getcwd()
+    output = os.path.abspath(args.json) if args.json else None
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    workdir = tempfile.mkdtemp(prefix='viddl-bench-')
+    # main.py keeps its config, databases, cache and log relative to the working directory
+    os.chdir(workdir)
+    sys.path.insert(0, source_dir)
+    app = importlib.import_module('main')
+
+    profile = ServerProfile(latency=args.latency / 1000, bandwidth=int(args.bandwidth * 1024),
+                            error_rate=args.error_rate, seed=args.seed)
+    server = MediaServer(profile, int(args.file_size * 1024 * 1024), args.fragments, args.seed).start()
+    bench = Benchmark(args, server, workdir)
+    # Fixed transfer settings, so runs are comparable
+    bench.configure(download_path=bench.download_path, adaptive_transfer_tuning=False,
+                    extraction_processes=args.extraction_processes,
+                    max_retries=3, retry_delay=1, bandwidth_limit=0, host_bandwidth_limits={}, bandwidth_schedule=[])
+
+    results = {
+        'benchmark': BENCHMARK_FORMAT,
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'environment': environment(),
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('json', 'compare', 'keep')},
+    }
+    report(f"Media server at {server.base_url}, working directory {workdir}")
+    try:
+        # yt-dlp prints download progress and errors even when quiet
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            for section in SECTIONS:
+                if section in args.sections:
+                    results[section] = getattr(bench, section)()
+        results['server'] = dict(server.stats)
+    finally:
+        server.shutdown()
+        os.chdir(origin)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        report(f"Results written to {output}")
+    if baseline:
+        with open(baseline, 'r', encoding='utf-8') as f:
+            compare(json.load(f), results)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(run(parse_args()))
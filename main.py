@@ -1,39 +1,388 @@
-import eel
-import yt_dlp
+import time
+STARTUP_STARTED = time.perf_counter()
+
+import bottle
 import json
 import os
 import threading
-import urllib.request
+import urllib.parse
+import http.client
+import queue
 import logging
+import logging.handlers
 from datetime import datetime
 from pathlib import Path
-import time
 import re
 import sys
+import heapq
+import itertools
+import hashlib
+import copy
+import sqlite3
+import tempfile
+import random
+import email.utils
+import uuid
+import contextlib
+import argparse
+import socketserver
+import socket
+import ipaddress
+import glob
+import weakref
+import atexit
+import multiprocessing
+from wsgiref.simple_server import make_server, WSGIServer, WSGIRequestHandler
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_EXCEPTION
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict, deque
+from types import MappingProxyType
+STARTUP_STDLIB_LOADED = time.perf_counter()
+
+try:
+    import eel
+except ImportError:  # headless installs can run without the GUI stack
+    eel = None
+STARTUP_EEL_LOADED = time.perf_counter()
 
-# Initialize Eel
-eel.init('web')
+# yt-dlp loads hundreds of extractors; it is imported on first use or warmed in the background
+yt_dlp = None
+yt_dlp_lock = threading.Lock()
+SegmentedHttpFD = None  # built by load_yt_dlp()
+JobYDL = None  # built by load_yt_dlp()
+
+# Startup timing: --startup-timing or STARTUP_TIMING=1 logs import and phase timings
+startup_timing = '--startup-timing' in sys.argv or os.environ.get('STARTUP_TIMING', '') not in ('', '0')
 
 # Configuration
 CONFIG_FILE = 'config.json'
-HISTORY_FILE = 'history.json'
+HISTORY_FILE = 'history.json'  # legacy store, migrated into HISTORY_DB
+HISTORY_DB = 'history.db'
+JOURNAL_DB = 'jobs.db'
 DOWNLOAD_DIR = 'downloads'
-
-# Create necessary directories
-Path(DOWNLOAD_DIR).mkdir(exist_ok=True)
-Path(os.path.join(DOWNLOAD_DIR, 'thumbnails')).mkdir(exist_ok=True)
+METADATA_CACHE_DIR = os.path.join('cache', 'metadata')
+THUMBNAIL_DIR = os.path.join(DOWNLOAD_DIR, 'thumbnails')
 
 # Global download queue and cancellation
-active_downloads = {}  # download_id -> {'thread': thread, 'cancelled': bool}
+active_downloads = {}  # download_id -> DownloadJob
 downloads_lock = threading.Lock()
+job_context = threading.local()  # .job / .phase: what the current thread is working on, for FFmpeg tracking and logs
+
+# Download scheduler: bounded worker pool fed from a priority queue
+download_queue = []  # heap of (priority, seq, download_id)
+download_queue_cond = threading.Condition(downloads_lock)
+download_workers = []
+job_sequence = itertools.count()
+DEFAULT_MAX_CONCURRENT_DOWNLOADS = 3
+download_pool_size = DEFAULT_MAX_CONCURRENT_DOWNLOADS
 
-# Logging setup
-logging.basicConfig(
-    filename='app.log',
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
+# Metadata cache: resolved info dicts shared by get_video_info and downloads
+metadata_cache = OrderedDict()  # cache key -> {'expires_at': float, 'info': dict}
+metadata_aliases = {}  # url -> cache key
+metadata_cache_lock = threading.Lock()
+METADATA_CACHE_SIZE = 64
+DEFAULT_METADATA_CACHE_TTL = 1800
+
+# Format ranking: relative quality per bit compared to H.264 / AAC
+VIDEO_CODEC_EFFICIENCY = {
+    'av01': 2.0,
+    'hev1': 1.6,
+    'hvc1': 1.6,
+    'vp09': 1.5,
+    'vp9': 1.5,
+    'avc1': 1.0,
+    'h264': 1.0,
+}
+AUDIO_CODEC_EFFICIENCY = {
+    'opus': 1.5,
+    'vorbis': 1.2,
+    'mp4a': 1.0,
+    'aac': 1.0,
+    'mp3': 0.8,
+}
+
+# Configuration snapshot: parsed once, reloaded when config.json changes
+config_snapshot = None  # read-only view of the current settings
+config_mtime = None
+config_lock = threading.Lock()
+config_listeners = []  # callables run with the new snapshot after a change
+
+# History database (opened lazily, shared by all threads)
+history_db = None
+history_db_lock = threading.Lock()
+HISTORY_COLUMNS = ('title', 'url', 'video_id', 'thumbnail', 'duration', 'timestamp', 'format', 'filesize')
+
+# Media index: finished downloads keyed by yt-dlp archive id ("<extractor> <video id>") and rendition
+MEDIA_INDEX_COLUMNS = ('archive_id', 'variant', 'format_id', 'path', 'filesize', 'sha256', 'title', 'downloaded_at')
+DUPLICATE_POLICIES = ('skip', 'link', 'download')  # reuse the file, hard-link it into download_path, or fetch again
+# Output names tried in order until one is free or already holds this video and rendition;
+# numbered variants of the last one follow (see output_templates)
+OUTPUT_TEMPLATES = ('%(title)s.%(ext)s', '%(title)s [%(id)s].%(ext)s', '%(title)s [%(id)s %(format_id)s].%(ext)s')
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Retry policy: error classes, backoff and per-host circuit breakers
+ERROR_PERMANENT = 'permanent'
+ERROR_TRANSIENT = 'transient'
+ERROR_RATE_LIMITED = 'rate_limited'
+PERMANENT_ERROR_PATTERNS = (
+    'http error 404', 'http error 410', 'not found', 'private video', 'copyright',
+    'unavailable', 'format not available', 'requested format is not available', 'unsupported url', 'sign in', 'login',
+    'members-only', 'ffmpeg', 'ffprobe',
+)
+RATE_LIMIT_ERROR_PATTERNS = (
+    'http error 429', 'too many requests', 'rate limit', 'rate-limit', "confirm you're not a bot",
 )
+# Checked before the permanent patterns, e.g. "HTTP Error 503: Service Unavailable"
+TRANSIENT_ERROR_PATTERNS = ('http error 5', 'timed out', 'timeout', 'temporarily', 'connection reset')
+MAX_RATE_LIMIT_RETRIES = 10
+DEFAULT_MAX_RETRY_DELAY = 300
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_BASE_COOLDOWN = 30
+CIRCUIT_MAX_COOLDOWN = 900
+host_circuits = {}  # host -> {'failures': int, 'open_until': float, 'cooldown': float}
+host_circuits_lock = threading.Lock()
+
+# Bandwidth governor: fair per-job shares of global and per-host caps
+bandwidth_jobs = {}  # download_id -> {'host': str, 'bucket': TokenBucket, 'speed': float}
+bandwidth_lock = threading.Lock()
+bandwidth_thread = None
+BANDWIDTH_REBALANCE_INTERVAL = 2
+
+# Adaptive transfer tuning: per-host fragment concurrency, chunk size and socket timeout
+TUNING_FILE = 'tuning.json'
+FRAGMENT_LEVELS = (1, 2, 4, 8, 16)
+CHUNK_SIZE_LEVELS = (262144, 524288, 1048576, 2097152, 4194304, 10485760)
+SOCKET_TIMEOUT_LEVELS = (5, 10, 20, 30)
+DEFAULT_TRANSFER_SETTINGS = {'fragments': 8, 'chunk_size': 524288, 'socket_timeout': 5}
+TUNING_MIN_BYTES = 4 * 1024 * 1024  # smaller transfers are dominated by request latency
+TUNING_MIN_SECONDS = 2
+TUNING_EXPLORE_EVERY = 5  # every Nth job on a settled host re-probes a neighbour
+TUNING_SMOOTHING = 0.3
+host_tuning = None  # host -> {'best': key, 'samples': {key: bytes/s}, 'socket_timeout': int, 'jobs': int}
+host_tuning_lock = threading.Lock()
+
+# Post-processing stage: FFmpeg merges and conversions run off the download workers
+postprocess_queue = queue.Queue()
+postprocess_workers = []
+postprocess_lock = threading.Lock()
+postprocess_running = 0
+POSTPROCESS_WORKERS = os.cpu_count() or 2
+
+# Segmented downloads: progressive files fetched as parallel byte ranges
+DEFAULT_SEGMENTED_CONNECTIONS = 4
+SEGMENT_MIN_SIZE = 1024 * 1024
+SEGMENT_MAX_SIZE = 10 * 1024 * 1024  # some sites throttle larger ranged requests
+SEGMENT_BLOCK_SIZE = 65536
+SEGMENT_PROGRESS_INTERVAL = 0.1
+SEGMENT_CHECKPOINT_INTERVAL = 1  # seconds between resume-state writes
+
+# Job journal: unfinished downloads persisted for crash recovery
+journal_db = None
+journal_db_lock = threading.Lock()
+JOURNAL_COLUMNS = ('download_id', 'url', 'title', 'format_choice', 'quality', 'format_id',
+                   'priority', 'seq', 'state', 'output_path', 'created_at', 'updated_at')
+
+# Batch ingestion: playlist expansion and metadata prefetch
+metadata_executor = None
+metadata_executor_lock = threading.Lock()
+DEFAULT_METADATA_WORKERS = 4
+MAX_PLAYLIST_REDIRECTS = 3
+
+# Extraction processes: yt-dlp extraction in worker processes, off the UI process's GIL
+DEFAULT_EXTRACTION_PROCESSES = 0  # 0 = extract on the calling thread
+extraction_pool = None
+extraction_pool_size = 0
+extraction_pool_lock = threading.Lock()
+extraction_channel = None  # multiprocessing queue: worker log records and (task id, status line) pairs
+extraction_listeners = {}  # task id -> callable(status line)
+extraction_tasks = itertools.count()
+EXTRACTION_POLL_INTERVAL = 0.2
+
+# Thumbnail pipeline: small worker pool with per-thread keep-alive connections
+thumbnail_queue = queue.Queue()
+thumbnail_workers = []
+thumbnail_pending = set()  # cache keys queued or being fetched
+thumbnail_failures = {}  # cache key -> time before which a failed fetch is not retried
+thumbnail_lock = threading.Lock()
+thumbnail_connections = threading.local()
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_RETRY_COOLDOWN = 300  # seconds
+THUMBNAIL_URL_PREFIX = '/thumbnails/'
+THUMBNAIL_TYPES = {'image/jpeg': '.jpg', 'image/webp': '.webp', 'image/png': '.png', 'image/gif': '.gif', 'image/avif': '.avif'}
+
+# Job metrics: per-phase timings and transfer stats aggregated across jobs
+METRIC_PHASES = ('queue_wait', 'metadata', 'first_byte', 'transfer', 'postprocess_wait', 'postprocess', 'thumbnail', 'history')
+PHASE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)  # seconds
+THROUGHPUT_BUCKETS = (65536, 262144, 1048576, 4194304, 16777216, 67108864, 268435456)  # bytes/s
+RECENT_JOB_METRICS = 200
+metrics_lock = threading.Lock()
+phase_histograms = {}  # phase -> Histogram of seconds
+throughput_histogram = None  # Histogram of average transfer throughput per job
+metric_counters = {'jobs': {}, 'retries': {}, 'bytes': 0}  # jobs and retries keyed by result / error kind
+peak_throughput = 0
+recent_job_metrics = deque(maxlen=RECENT_JOB_METRICS)
+
+# Event delivery: the Eel window and headless API subscribers
+event_subscribers = []  # one queue.Queue per open /api/events stream
+event_lock = threading.Lock()
+EVENT_SUBSCRIBER_BACKLOG = 1000
+EVENT_KEEPALIVE_INTERVAL = 15
+DEFAULT_API_PORT = 8765
+
+# Progress bus: hooks record the latest state, one flusher pushes batches to the UI
+progress_pending = {}  # download_id -> latest progress dict
+progress_lock = threading.Lock()
+progress_send_lock = threading.Lock()  # keeps batches and terminal events in order
+progress_flusher = None
+DEFAULT_PROGRESS_UPDATE_HZ = 8
+TERMINAL_PROGRESS_STATES = ('completed', 'error', 'cancelled')
+
+# Logging: threads only enqueue records; one listener thread formats and writes them
+LOG_FILE = 'app.log'
+LOG_FORMAT = '%(asctime)s [%(levelname)s] %(message)s'
+LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+LOG_FORMATS = ('text', 'json')
+LOG_FIELDS = ('download_id', 'phase', 'bytes', 'metrics')  # job context carried as JSON fields
+DEFAULT_LOG_MAX_MB = 10
+DEFAULT_LOG_BACKUP_COUNT = 5
+log_queue = queue.SimpleQueue()
+log_listener = None
+log_settings = None  # (format, max bytes, backups, daily) the running listener writes with
+log_lock = threading.Lock()
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """Root handler: stamps a record with the current job's context and queues it without blocking
+    
+    Runs on the logging thread, so the download id, phase and byte count come
+    from job_context there; fields passed with extra= take precedence. Within
+    the app, formatting is left to the writer thread. With render, for queues
+    to another process, the message and traceback are rendered here so the
+    record can be pickled, but kept apart so the JSON format can store them
+    separately.
+    """
+    
+    def __init__(self, queue, render=False):
+        super().__init__(queue)
+        self.render = render
+    
+    def prepare(self, record):
+        if self.render:
+            record = copy.copy(record)
+            record.message = record.getMessage()
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.msg, record.args, record.exc_info = record.message, None, None
+        
+        job = getattr(job_context, 'job', None)
+        if job is not None and not hasattr(record, 'download_id'):
+            record.download_id = job.download_id
+            record.bytes = job.metrics['bytes']
+        phase = getattr(job_context, 'phase', None)
+        if phase is not None and not hasattr(record, 'phase'):
+            record.phase = phase
+        return record
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per line, for log analysis"""
+    
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.processName != 'MainProcess':
+            entry['process'] = record.processName  # forwarded from an extraction process
+        for field in LOG_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class RotatingLogHandler(logging.handlers.RotatingFileHandler):
+    """Log file rotated once it reaches max_bytes and, when daily, on the first record of a new day
+    
+    Backups are numbered, newest first (app.log.1 ... app.log.<backup_count>),
+    so several rotations in one day never overwrite each other.
+    """
+    
+    def __init__(self, filename, max_bytes, backup_count, daily):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+        self.daily = daily
+        try:
+            self.day = datetime.fromtimestamp(os.path.getmtime(filename)).date()
+        except OSError:
+            self.day = datetime.now().date()
+    
+    def shouldRollover(self, record):
+        if self.daily and datetime.fromtimestamp(record.created).date() != self.day:
+            return os.path.isfile(self.baseFilename) and os.path.getsize(self.baseFilename) > 0
+        return super().shouldRollover(record)
+    
+    def emit(self, record):
+        super().emit(record)
+        self.day = datetime.fromtimestamp(record.created).date()
+
+def log_file_handler(settings):
+    """File handler for (format, max bytes, backups, daily) settings"""
+    log_format, max_bytes, backup_count, daily = settings
+    handler = RotatingLogHandler(LOG_FILE, max_bytes, backup_count, daily)
+    handler.setFormatter(JsonLogFormatter() if log_format == 'json' else logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+    return handler
+
+def read_log_settings(config):
+    """Logging settings from a config snapshot, with defaults for missing or invalid values"""
+    log_format = config.get('log_format', 'text')
+    try:
+        max_bytes = int(float(config.get('log_max_mb', DEFAULT_LOG_MAX_MB)) * 1024 * 1024)
+        backup_count = int(config.get('log_backup_count', DEFAULT_LOG_BACKUP_COUNT))
+    except (TypeError, ValueError):
+        max_bytes, backup_count = DEFAULT_LOG_MAX_MB * 1024 * 1024, DEFAULT_LOG_BACKUP_COUNT
+    return (log_format if log_format in LOG_FORMATS else 'text', max(0, max_bytes), max(1, backup_count),
+            bool(config.get('log_rotate_daily', True)))
+
+def configure_logging(config=None):
+    """Start the log writer, or restart it when the logging settings in config changed"""
+    global log_listener, log_settings
+    settings = read_log_settings(config or {})
+    with log_lock:
+        if settings == log_settings:
+            return
+        root = logging.getLogger()
+        if not any(isinstance(handler, LogQueueHandler) for handler in root.handlers):
+            root.setLevel(logging.INFO)
+            root.addHandler(LogQueueHandler(log_queue))
+        if log_listener is not None:
+            # Writes out everything queued so far before the file handler is replaced
+            log_listener.stop()
+            for handler in log_listener.handlers:
+                handler.close()
+        handler = log_file_handler(settings)
+        if log_settings is not None and log_settings[0] != settings[0]:
+            handler.doRollover()  # one format per file, so JSON logs stay parseable
+        log_listener = logging.handlers.QueueListener(log_queue, handler)
+        log_listener.start()
+        log_settings = settings
+
+def stop_logging():
+    """Write out queued records and close the log file, e.g. at exit"""
+    global log_listener, log_settings
+    with log_lock:
+        if log_listener is not None:
+            log_listener.stop()
+            for handler in log_listener.handlers:
+                handler.close()
+        log_listener = log_settings = None
+
+# Worker processes send their records to the app instead of writing the file themselves
+if multiprocessing.parent_process() is None:
+    configure_logging()
+    atexit.register(stop_logging)
 
 # Helper for bundled resources (PyInstaller)
 def get_resource_path(relative_path):
@@ -47,148 +396,2360 @@ def get_resource_path(relative_path):
 
 os.environ["PHANTOMJS_BIN"] = get_resource_path("phantomjs/phantomjs.exe")
 
+# Startup
+def mark_startup(phase):
+    """Log how long startup took to reach phase, when startup timing is enabled"""
+    if startup_timing:
+        logging.info(f"Startup timing: {phase} at {(time.perf_counter() - STARTUP_STARTED) * 1000:.1f} ms")
+
+def load_yt_dlp():
+    """Import yt-dlp on first use and build the classes that extend it"""
+    global yt_dlp, SegmentedHttpFD, JobYDL
+    if yt_dlp is not None:
+        return yt_dlp
+    with yt_dlp_lock:
+        if yt_dlp is None:
+            started = time.perf_counter()
+            import yt_dlp as module
+            SegmentedHttpFD = type('SegmentedHttpFD', (SegmentedDownloadMixin, module.downloader.http.HttpFD), {})
+            JobYDL = type('JobYDL', (InterruptibleMixin, UniqueOutputMixin, DeferredPostProcessingMixin, module.YoutubeDL), {})
+            # Progressive http(s) formats go through the segmented downloader; it defers to HttpFD when off
+            for protocol in ('http', 'https'):
+                module.downloader.PROTOCOL_MAP[protocol] = SegmentedHttpFD
+            # FFmpeg runs started for a job can be killed when it is cancelled
+            JobPopen = type('JobPopen', (JobProcessMixin, module.utils.Popen), {})
+            module.postprocessor.ffmpeg.Popen = JobPopen
+            module.downloader.external.Popen = JobPopen
+            yt_dlp = module
+            if startup_timing:
+                logging.info(f"Startup timing: yt-dlp import took {(time.perf_counter() - started) * 1000:.1f} ms")
+            mark_startup("yt-dlp ready")
+    return yt_dlp
+
+def warm_up():
+    """Startup work that can finish after the window is up"""
+    try:
+        load_yt_dlp()
+        prune_metadata_cache()
+    except Exception:
+        logging.exception("Background startup work failed")
+    mark_startup("background warm-up done")
+
 # Configuration management
-def load_config():
-    """Load configuration from file or return defaults"""
-    if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            logging.exception("Failed loading config, using defaults")
-    
+def default_config():
+    """Settings used when config.json is missing or lacks a key"""
     return {
         'credentials': {},
         'download_path': DOWNLOAD_DIR,
         'max_retries': 5,
-        'retry_delay': 3
+        'retry_delay': 3,
+        'max_concurrent_downloads': DEFAULT_MAX_CONCURRENT_DOWNLOADS,
+        'metadata_cache_ttl': DEFAULT_METADATA_CACHE_TTL,
+        'progress_update_hz': DEFAULT_PROGRESS_UPDATE_HZ,
+        'metadata_workers': DEFAULT_METADATA_WORKERS,
+        'max_retry_delay': DEFAULT_MAX_RETRY_DELAY,
+        'bandwidth_limit': 0,  # KB/s across all downloads, 0 = unlimited
+        'host_bandwidth_limits': {},  # host -> KB/s
+        'bandwidth_schedule': [],  # [{'start': 'HH:MM', 'end': 'HH:MM', 'limit': KB/s}]
+        'adaptive_transfer_tuning': True,
+        'segmented_connections': DEFAULT_SEGMENTED_CONNECTIONS,  # connections per progressive file, 1 = off
+        'extraction_processes': DEFAULT_EXTRACTION_PROCESSES,  # worker processes for metadata extraction, 0 = off
+        'log_format': 'text',  # 'text' or 'json' (one JSON object per line)
+        'log_max_mb': DEFAULT_LOG_MAX_MB,  # app.log is rotated at this size, 0 = no size limit
+        'log_backup_count': DEFAULT_LOG_BACKUP_COUNT,
+        'log_rotate_daily': True,
+        'duplicate_policy': 'skip',  # one of DUPLICATE_POLICIES
+        'hash_downloads': False,  # store a SHA-256 of each finished file in the media index
+        'api_token': ''  # bearer token required by the headless API when set
     }
 
+def freeze_config(value):
+    """Recursively wrap a parsed config so callers cannot mutate the shared snapshot"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze_config(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze_config(v) for v in value)
+    return value
+
+def thaw_config(value):
+    """Plain, JSON-serializable copy of a config snapshot"""
+    if isinstance(value, MappingProxyType):
+        return {k: thaw_config(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [thaw_config(v) for v in value]
+    return value
+
+def config_file_mtime():
+    """Modification time of config.json, or None if it does not exist"""
+    try:
+        return os.stat(CONFIG_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+def load_config():
+    """Return the current configuration snapshot, re-reading the file only when it changed"""
+    global config_snapshot, config_mtime
+    changed = False
+    with config_lock:
+        mtime = config_file_mtime()
+        if config_snapshot is None or mtime != config_mtime:
+            config = default_config()
+            if mtime is not None:
+                try:
+                    with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+                        config.update(json.load(f))
+                except Exception as e:
+                    logging.exception("Failed loading config, using defaults")
+            changed = config_snapshot is not None
+            config_snapshot = freeze_config(config)
+            config_mtime = mtime
+        snapshot = config_snapshot
+    
+    if changed:
+        notify_config_listeners(snapshot)
+    return snapshot
+
+def write_json_atomic(path, data):
+    """Write JSON to a temp file and rename it over path, so readers never see a partial file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '-', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
 def save_config(config):
-    """Save configuration to file"""
+    """Save configuration atomically and publish the new snapshot"""
+    global config_snapshot, config_mtime
     try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2, ensure_ascii=False)
+        config = {**default_config(), **thaw_config(config)}
+        write_json_atomic(CONFIG_FILE, config)
+        
+        with config_lock:
+            config_snapshot = freeze_config(config)
+            config_mtime = config_file_mtime()
+            snapshot = config_snapshot
         logging.info("Configuration saved successfully")
+        notify_config_listeners(snapshot)
     except Exception:
         logging.exception("Failed to save configuration")
 
-# History management
-def load_history():
-    """Load download history from file"""
-    if os.path.exists(HISTORY_FILE):
+def add_config_listener(callback):
+    """Register a callable to run with the new snapshot whenever settings change"""
+    config_listeners.append(callback)
+
+def notify_config_listeners(snapshot):
+    """Run config listeners, isolating their failures"""
+    for callback in list(config_listeners):
         try:
-            with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            callback(snapshot)
         except Exception:
-            logging.exception("Failed loading history, returning empty")
-    return []
+            logging.exception(f"Config listener {getattr(callback, '__name__', callback)} failed")
+
+# History management
+def open_database(path, schema):
+    """Open a SQLite database shared across threads and apply its schema"""
+    db = sqlite3.connect(path, check_same_thread=False)
+    db.row_factory = sqlite3.Row
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=NORMAL')
+    db.executescript(schema)
+    return db
+
+def get_history_db():
+    """Open the history database, creating and migrating it on first use (caller holds history_db_lock)"""
+    global history_db
+    if history_db is not None:
+        return history_db
+    
+    db = open_database(HISTORY_DB, """
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL DEFAULT '',
+            url TEXT NOT NULL DEFAULT '',
+            video_id TEXT NOT NULL DEFAULT '',
+            thumbnail TEXT NOT NULL DEFAULT '',
+            duration REAL NOT NULL DEFAULT 0,
+            timestamp TEXT NOT NULL,
+            format TEXT NOT NULL DEFAULT '',
+            filesize INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_history_url ON history(url);
+        CREATE INDEX IF NOT EXISTS idx_history_video_id ON history(video_id);
+        CREATE INDEX IF NOT EXISTS idx_history_timestamp ON history(timestamp);
+        CREATE TABLE IF NOT EXISTS media_index (
+            archive_id TEXT NOT NULL,
+            variant TEXT NOT NULL,
+            format_id TEXT NOT NULL DEFAULT '',
+            path TEXT NOT NULL,
+            filesize INTEGER NOT NULL DEFAULT 0,
+            sha256 TEXT,
+            title TEXT NOT NULL DEFAULT '',
+            downloaded_at TEXT NOT NULL,
+            PRIMARY KEY (archive_id, variant)
+        );
+        CREATE INDEX IF NOT EXISTS idx_media_index_path ON media_index(path);
+    """)
+    history_db = db
+    migrate_history_file()
+    return db
+
+def migrate_history_file():
+    """Import the legacy history.json once, then rename it out of the way"""
+    if not os.path.exists(HISTORY_FILE):
+        return
+    try:
+        with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        # The JSON file is newest-first; insert oldest-first so ids follow time
+        rows = [tuple(entry.get(col) or ('' if col not in ('duration', 'filesize') else 0)
+                      for col in HISTORY_COLUMNS) for entry in reversed(entries)]
+        with history_db:
+            history_db.executemany(
+                f"INSERT INTO history ({', '.join(HISTORY_COLUMNS)}) VALUES ({', '.join('?' * len(HISTORY_COLUMNS))})",
+                rows
+            )
+        os.replace(HISTORY_FILE, HISTORY_FILE + '.migrated')
+        logging.info(f"Migrated {len(rows)} history entries to {HISTORY_DB}")
+    except Exception:
+        logging.exception("Failed to migrate legacy history file")
+
+def history_search_clause(search, max_id=None):
+    """WHERE clause and parameters for a case-insensitive title/URL search, optionally up to entry max_id"""
+    conditions, params = [], []
+    if search:
+        pattern = '%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        conditions.append("(title LIKE ? ESCAPE '\\' OR url LIKE ? ESCAPE '\\')")
+        params += [pattern, pattern]
+    if max_id is not None:
+        # Pins offsets to a snapshot, so pages stay aligned while new downloads are added
+        conditions.append("id <= ?")
+        params.append(int(max_id))
+    return (" WHERE " + " AND ".join(conditions) if conditions else ''), params
 
-def save_history(history):
-    """Save download history to file"""
+def load_history(offset=0, limit=100, search='', max_id=None):
+    """Load a page of download history, newest first, optionally filtered by text"""
+    where, params = history_search_clause(search, max_id)
+    query = f"SELECT id, {', '.join(HISTORY_COLUMNS)} FROM history{where} ORDER BY id DESC LIMIT ? OFFSET ?"
+    params += [int(limit), int(offset)]
+    
+    try:
+        with history_db_lock:
+            rows = get_history_db().execute(query, params).fetchall()
+        return [dict(row) for row in rows]
+    except Exception:
+        logging.exception("Failed loading history, returning empty")
+        return []
+
+def count_history(search='', max_id=None):
+    """Number of history entries matching the text filter"""
+    where, params = history_search_clause(search, max_id)
     try:
-        with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(history, f, indent=2, ensure_ascii=False)
-        logging.info("History saved successfully")
+        with history_db_lock:
+            return get_history_db().execute(f"SELECT COUNT(*) FROM history{where}", params).fetchone()[0]
     except Exception:
-        logging.exception("Failed to save history")
+        logging.exception("Failed counting history")
+        return 0
 
 def add_to_history(video_info, thumbnail_url):
-    """Add a completed download to history"""
+    """Add a completed download to history; returns the new entry, or None if it could not be saved"""
     try:
-        history = load_history()
-        history.insert(0, {
-            'title': video_info.get('title', 'Unknown'),
-            'url': video_info.get('webpage_url', ''),
-            'thumbnail': thumbnail_url,
-            'duration': video_info.get('duration', 0),
-            'timestamp': datetime.now().isoformat(),
-            'format': video_info.get('format_selected', 'Unknown'),
-            'filesize': video_info.get('filesize', 0)
-        })
-        # Keep only last 100 items
-        history = history[:100]
-        save_history(history)
+        entry = (
+            video_info.get('title', 'Unknown'),
+            video_info.get('webpage_url', ''),
+            video_info.get('id', ''),
+            thumbnail_url or '',
+            video_info.get('duration', 0) or 0,
+            datetime.now().isoformat(),
+            video_info.get('format_selected', 'Unknown'),
+            video_info.get('filesize', 0) or 0
+        )
+        with history_db_lock:
+            db = get_history_db()
+            with db:
+                cursor = db.execute(
+                    f"INSERT INTO history ({', '.join(HISTORY_COLUMNS)}) VALUES ({', '.join('?' * len(HISTORY_COLUMNS))})",
+                    entry
+                )
+        return dict(zip(('id',) + HISTORY_COLUMNS, (cursor.lastrowid,) + entry))
     except Exception:
         logging.exception("Failed to add entry to history")
+        return None
+
+def delete_all_history():
+    """Remove every history entry"""
+    try:
+        with history_db_lock:
+            db = get_history_db()
+            with db:
+                db.execute("DELETE FROM history")
+        logging.info("History cleared successfully")
+    except Exception:
+        logging.exception("Failed to clear history")
+
+def present_history_entry(item):
+    """History entry as the UI shows it: thumbnail served from the local cache when it is there"""
+    item['thumbnail_url'] = item['thumbnail']
+    local_url = cached_thumbnail_url(item['video_id'], item['thumbnail'])
+    if local_url:
+        item['thumbnail'] = local_url
+    else:
+        # Backfill older entries so the next render is served locally
+        request_thumbnail(item['thumbnail'], item['video_id'])
+    return item
+
+# Media index
+def media_variant(format_choice, quality):
+    """Rendition a job produces; another rendition of the same video is not a duplicate"""
+    return 'audio' if format_choice == 'audio' else f"video {quality}p"
+
+def info_archive_id(info):
+    """Download-archive id of an extracted video, or None for playlists and incomplete info"""
+    if not info or info.get('_type', 'video') != 'video':
+        return None
+    extractor = info.get('extractor_key') or info.get('ie_key')
+    if not extractor or not info.get('id'):
+        return None
+    return load_yt_dlp().utils.make_archive_id(extractor, info['id'])
+
+def url_archive_id(url):
+    """Archive id a URL will extract to, worked out from the URL alone as yt-dlp's archive pre-check does"""
+    module = load_yt_dlp()
+    try:
+        for ie in module.extractor.gen_extractor_classes():
+            if ie.suitable(url):
+                video_id = ie.get_temp_id(url)
+                return module.utils.make_archive_id(ie.ie_key(), video_id) if video_id else None
+    except Exception:
+        logging.exception(f"Failed to match an extractor for: {url}")
+    return None
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def find_downloaded(archive_id, variant=None):
+    """Index entries for a video whose files are still on disk; entries for moved or changed files are dropped"""
+    query = f"SELECT {', '.join(MEDIA_INDEX_COLUMNS)} FROM media_index WHERE archive_id = ?"
+    params = [archive_id]
+    if variant is not None:
+        query += " AND variant = ?"
+        params.append(variant)
+    try:
+        with history_db_lock:
+            rows = get_history_db().execute(query, params).fetchall()
+        present, stale = [], []
+        for row in rows:
+            try:
+                size = os.path.getsize(row['path'])
+            except OSError:
+                size = None
+            (present if size == row['filesize'] else stale).append(row)
+        if stale:
+            with history_db_lock:
+                db = get_history_db()
+                with db:
+                    db.executemany("DELETE FROM media_index WHERE archive_id = ? AND variant = ?",
+                                   [(row['archive_id'], row['variant']) for row in stale])
+        return [dict(row) for row in present]
+    except Exception:
+        logging.exception(f"Failed to look up {archive_id} in the media index")
+        return []
+
+def media_index_owner(path):
+    """(archive_id, variant) the index records for a file, or None"""
+    try:
+        with history_db_lock:
+            row = get_history_db().execute(
+                "SELECT archive_id, variant FROM media_index WHERE path = ?", (os.path.abspath(path),)
+            ).fetchone()
+        return tuple(row) if row else None
+    except Exception:
+        logging.exception(f"Failed to look up {path} in the media index")
+        return None
+
+def index_download(job, info):
+    """Record a finished download's file in the media index"""
+    archive_id = info_archive_id(info)
+    path = info.get('filepath')
+    if archive_id is None or not path or not os.path.isfile(path):
+        return
+    try:
+        digest = file_sha256(path) if load_config().get('hash_downloads', False) else None
+        entry = (
+            archive_id,
+            media_variant(job.format_choice, job.quality),
+            info.get('format_id') or '',
+            os.path.abspath(path),
+            os.path.getsize(path),
+            digest,
+            info.get('title') or '',
+            datetime.now().isoformat()
+        )
+        with history_db_lock:
+            db = get_history_db()
+            with db:
+                db.execute(
+                    f"INSERT OR REPLACE INTO media_index ({', '.join(MEDIA_INDEX_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * len(MEDIA_INDEX_COLUMNS))})",
+                    entry
+                )
+    except Exception:
+        logging.exception(f"Failed to index {path}")
+
+def get_duplicate_policy():
+    """What to do with a job whose video and rendition are already downloaded"""
+    policy = load_config().get('duplicate_policy', 'skip')
+    return policy if policy in DUPLICATE_POLICIES else 'skip'
+
+def existing_download(job, archive_id):
+    """Index entry that makes downloading job unnecessary under the duplicate policy, or None"""
+    if archive_id is None or get_duplicate_policy() == 'download':
+        return None
+    matches = find_downloaded(archive_id, media_variant(job.format_choice, job.quality))
+    return matches[0] if matches else None
+
+def link_existing_download(path, download_path):
+    """Hard-link an earlier download into download_path; the original path when that is not possible"""
+    target = os.path.abspath(os.path.join(download_path, os.path.basename(path)))
+    if os.path.exists(target):
+        # Already there, or the name is taken by another file
+        return target if os.path.samefile(target, path) else path
+    try:
+        os.link(path, target)
+        return target
+    except OSError as e:
+        logging.warning(f"Could not link {path} into {download_path}: {e}")
+        return path
+
+def reuse_existing_download(job, archive_id):
+    """Complete job from an earlier download of the same video and rendition; False if there is none"""
+    entry = existing_download(job, archive_id)
+    if entry is None:
+        return False
+    
+    path = entry['path']
+    if get_duplicate_policy() == 'link':
+        path = link_existing_download(path, load_config().get('download_path', DOWNLOAD_DIR))
+    
+    forget_job(job.download_id, 'duplicate')
+    publish_progress(job.download_id, {
+        'percent': 100,
+        'status': 'completed',
+        'message': f"✓ Already downloaded: {os.path.basename(path)}",
+        'path': path,
+        'duplicate': True
+    })
+    logging.info(f"Download {job.download_id} skipped, {archive_id} ({entry['variant']}) is already at {path}")
+    return True
+
+# Job journal
+def get_journal_db():
+    """Open the job journal, creating it on first use (caller holds journal_db_lock)"""
+    global journal_db
+    if journal_db is None:
+        journal_db = open_database(JOURNAL_DB, """
+            CREATE TABLE IF NOT EXISTS jobs (
+                download_id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                title TEXT NOT NULL DEFAULT '',
+                format_choice TEXT NOT NULL,
+                quality TEXT NOT NULL,
+                format_id TEXT,
+                priority INTEGER NOT NULL DEFAULT 0,
+                seq INTEGER NOT NULL DEFAULT 0,
+                state TEXT NOT NULL,
+                output_path TEXT NOT NULL DEFAULT '',
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            );
+        """)
+    return journal_db
+
+def journal_add(job):
+    """Record a newly queued job"""
+    now = datetime.now().isoformat()
+    row = (job.download_id, job.url, job.title or '', job.format_choice, str(job.quality),
+           job.format_id, job.priority, job.seq, job.state, job.output_path or '', now, now)
+    try:
+        with journal_db_lock:
+            db = get_journal_db()
+            with db:
+                db.execute(
+                    f"INSERT OR REPLACE INTO jobs ({', '.join(JOURNAL_COLUMNS)}) VALUES ({', '.join('?' * len(JOURNAL_COLUMNS))})",
+                    row
+                )
+    except Exception:
+        logging.exception(f"Failed to journal download {job.download_id}")
+
+def journal_update(download_id, **fields):
+    """Update columns of a journaled job; a no-op once the job has been forgotten"""
+    fields['updated_at'] = datetime.now().isoformat()
+    assignments = ', '.join(f"{name} = ?" for name in fields)
+    try:
+        with journal_db_lock:
+            db = get_journal_db()
+            with db:
+                db.execute(f"UPDATE jobs SET {assignments} WHERE download_id = ?", (*fields.values(), download_id))
+    except Exception:
+        logging.exception(f"Failed to update journal for download {download_id}")
+
+def journal_remove(download_id):
+    """Drop a finished, failed or cancelled job from the journal"""
+    try:
+        with journal_db_lock:
+            db = get_journal_db()
+            with db:
+                db.execute("DELETE FROM jobs WHERE download_id = ?", (download_id,))
+    except Exception:
+        logging.exception(f"Failed to remove download {download_id} from journal")
+
+def load_journal():
+    """All unfinished jobs, oldest first"""
+    try:
+        with journal_db_lock:
+            rows = get_journal_db().execute("SELECT * FROM jobs ORDER BY seq").fetchall()
+        return [dict(row) for row in rows]
+    except Exception:
+        logging.exception("Failed loading job journal")
+        return []
+
+# Metadata cache
+def metadata_cache_key(info):
+    """Stable cache key for an info dict: extractor + video id"""
+    return f"{info.get('extractor_key', 'Generic')}:{info.get('id', 'unknown')}"
+
+def metadata_cache_path(name, ext):
+    """On-disk location for a cache entry or URL alias"""
+    digest = hashlib.sha1(name.encode('utf-8')).hexdigest()
+    return os.path.join(METADATA_CACHE_DIR, f'{digest}.{ext}')
+
+def stream_expiry(info, ttl):
+    """Earliest expiry of the resolved stream URLs, capped by the configured TTL"""
+    expires_at = time.time() + ttl
+    for f in info.get('formats') or []:
+        match = re.search(r'[?&/]expire[=/](\d+)', f.get('url') or '')
+        if match:
+            # Leave a margin so a download never starts on an almost-dead URL
+            expires_at = min(expires_at, int(match.group(1)) - 60)
+    return expires_at
+
+def trim_metadata_cache():
+    """Evict least recently used entries beyond METADATA_CACHE_SIZE along with their aliases
+    
+    Call with metadata_cache_lock held. Evicted entries stay on disk and are
+    read back through their alias files when asked for again.
+    """
+    evicted = set()
+    while len(metadata_cache) > METADATA_CACHE_SIZE:
+        evicted.add(metadata_cache.popitem(last=False)[0])
+    if evicted:
+        for alias in [a for a, k in metadata_aliases.items() if k in evicted]:
+            del metadata_aliases[alias]
+
+def cache_video_info(url, info):
+    """Store a resolved info dict in memory and on disk"""
+    if info.get('_type', 'video') != 'video':
+        return
+    try:
+        ttl = int(load_config().get('metadata_cache_ttl', DEFAULT_METADATA_CACHE_TTL))
+        if ttl <= 0:
+            return
+        
+        info = load_yt_dlp().YoutubeDL.sanitize_info(info, remove_private_keys=True)
+        key = metadata_cache_key(info)
+        entry = {'expires_at': stream_expiry(info, ttl), 'info': info}
+        aliases = {url, info.get('webpage_url') or url}
+        
+        with metadata_cache_lock:
+            metadata_cache[key] = entry
+            metadata_cache.move_to_end(key)
+            trim_metadata_cache()
+            for alias in aliases:
+                metadata_aliases[alias] = key
+        
+        os.makedirs(METADATA_CACHE_DIR, exist_ok=True)
+        with open(metadata_cache_path(key, 'json'), 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        for alias in aliases:
+            with open(metadata_cache_path(alias, 'alias'), 'w', encoding='utf-8') as f:
+                f.write(key)
+    except Exception:
+        logging.exception(f"Failed to cache metadata for: {url}")
+
+def get_cached_video_info(url):
+    """Return a private copy of the cached info dict for a URL, or None"""
+    try:
+        with metadata_cache_lock:
+            key = metadata_aliases.get(url)
+            entry = metadata_cache.get(key) if key else None
+            if entry is not None:
+                metadata_cache.move_to_end(key)
+        
+        if entry is None:
+            alias_path = metadata_cache_path(url, 'alias')
+            if not os.path.exists(alias_path):
+                return None
+            with open(alias_path, 'r', encoding='utf-8') as f:
+                key = f.read().strip()
+            entry_path = metadata_cache_path(key, 'json')
+            if not os.path.exists(entry_path):
+                return None
+            with open(entry_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            with metadata_cache_lock:
+                metadata_cache[key] = entry
+                metadata_aliases[url] = key
+                trim_metadata_cache()
+        
+        if entry['expires_at'] <= time.time():
+            invalidate_video_info(url)
+            return None
+        
+        # yt-dlp mutates the dict while processing it
+        return copy.deepcopy(entry['info'])
+    except Exception:
+        logging.exception(f"Failed to read cached metadata for: {url}")
+        return None
+
+def invalidate_video_info(url):
+    """Drop the cached info for a URL, e.g. after its stream URLs stopped working"""
+    try:
+        alias_path = metadata_cache_path(url, 'alias')
+        with metadata_cache_lock:
+            key = metadata_aliases.get(url)
+        if key is None and os.path.exists(alias_path):
+            with open(alias_path, 'r', encoding='utf-8') as f:
+                key = f.read().strip()
+        if key is None:
+            return
+        
+        with metadata_cache_lock:
+            metadata_cache.pop(key, None)
+            for alias in [a for a, k in metadata_aliases.items() if k == key]:
+                del metadata_aliases[alias]
+        
+        # Other aliases on disk are left dangling and miss harmlessly
+        for path in (alias_path, metadata_cache_path(key, 'json')):
+            if os.path.exists(path):
+                os.remove(path)
+    except Exception:
+        logging.warning(f"Failed to remove cached metadata for: {url}")
+
+def prune_metadata_cache():
+    """Delete expired cache entries from disk"""
+    if not os.path.isdir(METADATA_CACHE_DIR):
+        return
+    now = time.time()
+    removed = 0
+    for name in os.listdir(METADATA_CACHE_DIR):
+        path = os.path.join(METADATA_CACHE_DIR, name)
+        try:
+            if name.endswith('.json'):
+                with open(path, 'r', encoding='utf-8') as f:
+                    expired = json.load(f).get('expires_at', 0) <= now
+            else:
+                # Aliases are cheap; drop them once they are older than the longest TTL
+                expired = os.path.getmtime(path) < now - 86400
+            if expired:
+                os.remove(path)
+                removed += 1
+        except Exception:
+            logging.warning(f"Failed to prune metadata cache entry: {name}")
+    if removed:
+        logging.info(f"Pruned {removed} expired metadata cache entries")
+
+# Job metrics
+class Histogram:
+    """Fixed-bucket histogram, Prometheus style (callers hold metrics_lock)"""
+    
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)  # observations <= each bucket bound, not cumulative
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+    
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+    
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation (max when past the last bucket)"""
+        if not self.count:
+            return 0
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= q * self.count:
+                return min(bound, self.max)
+        return self.max
+    
+    def summary(self):
+        return {
+            'count': self.count,
+            'total': round(self.sum, 3),
+            'avg': round(self.sum / self.count, 3) if self.count else 0,
+            'p50': round(self.quantile(0.5), 3),
+            'p95': round(self.quantile(0.95), 3),
+            'max': round(self.max, 3)
+        }
+
+def observe_phase(phase, seconds, job=None):
+    """Add a phase duration to the aggregate histograms and to the job's own totals"""
+    with metrics_lock:
+        histogram = phase_histograms.get(phase)
+        if histogram is None:
+            histogram = phase_histograms[phase] = Histogram(PHASE_BUCKETS)
+        histogram.observe(seconds)
+    if job is not None:
+        phases = job.metrics['phases']
+        phases[phase] = phases.get(phase, 0) + seconds
+
+@contextlib.contextmanager
+def timed_phase(phase, job=None):
+    """Time the enclosed block as one phase, whether or not it succeeds"""
+    previous = getattr(job_context, 'phase', None)
+    job_context.phase = phase
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        job_context.phase = previous
+        observe_phase(phase, time.perf_counter() - started, job)
+
+def count_retry(job, kind):
+    """Count a retry scheduled for a job"""
+    job.metrics['retries'] += 1
+    with metrics_lock:
+        metric_counters['retries'][kind] = metric_counters['retries'].get(kind, 0) + 1
+
+def finalize_job_metrics(job, result):
+    """Fold a finished job into the aggregates and log its timeline"""
+    global throughput_histogram, peak_throughput
+    metrics = job.metrics
+    transfer = metrics['phases'].get('transfer', 0)
+    average = metrics['bytes'] / transfer if transfer else 0
+    record = {
+        'download_id': job.download_id,
+        'result': result,
+        'host': job_host(job),
+        'phases': {phase: round(seconds, 3) for phase, seconds in metrics['phases'].items()},
+        'bytes': metrics['bytes'],
+        'avg_throughput': int(average),
+        'peak_throughput': int(metrics['peak_speed']),
+        'retries': metrics['retries'],
+        'finished_at': time.time()
+    }
+    with metrics_lock:
+        metric_counters['jobs'][result] = metric_counters['jobs'].get(result, 0) + 1
+        metric_counters['bytes'] += metrics['bytes']
+        if average:
+            if throughput_histogram is None:
+                throughput_histogram = Histogram(THROUGHPUT_BUCKETS)
+            throughput_histogram.observe(average)
+        peak_throughput = max(peak_throughput, metrics['peak_speed'])
+        recent_job_metrics.append(record)
+    logging.info(f"Job metrics {job.download_id}: {json.dumps(record)}",
+                 extra={'download_id': job.download_id, 'metrics': record})
+
+def metrics_snapshot(recent=20):
+    """Aggregated metrics as plain data"""
+    with metrics_lock:
+        return {
+            'phases': {phase: histogram.summary() for phase, histogram in phase_histograms.items()},
+            'jobs': dict(metric_counters['jobs']),
+            'retries': dict(metric_counters['retries']),
+            'bytes': metric_counters['bytes'],
+            'throughput': throughput_histogram.summary() if throughput_histogram else Histogram(THROUGHPUT_BUCKETS).summary(),
+            'peak_throughput': int(peak_throughput),
+            'recent_jobs': list(recent_job_metrics)[-recent:] if recent else []
+        }
+
+def prometheus_histogram(lines, name, histogram, labels=''):
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels}le="+Inf"}} {histogram.count}')
+    bare = labels.rstrip(',')
+    lines.append(f'{name}_sum{{{bare}}} {histogram.sum}' if bare else f'{name}_sum {histogram.sum}')
+    lines.append(f'{name}_count{{{bare}}} {histogram.count}' if bare else f'{name}_count {histogram.count}')
+
+def metrics_text():
+    """Aggregated metrics in the Prometheus text exposition format"""
+    with downloads_lock:
+        states = {}
+        for job in active_downloads.values():
+            states[job.state] = states.get(job.state, 0) + 1
+    
+    lines = []
+    with metrics_lock:
+        lines.append('# HELP viddl_phase_seconds Time spent in each job phase')
+        lines.append('# TYPE viddl_phase_seconds histogram')
+        for phase in METRIC_PHASES:
+            if phase in phase_histograms:
+                prometheus_histogram(lines, 'viddl_phase_seconds', phase_histograms[phase], f'phase="{phase}",')
+        lines.append('# HELP viddl_jobs_total Jobs that reached a final state')
+        lines.append('# TYPE viddl_jobs_total counter')
+        for result, count in sorted(metric_counters['jobs'].items()):
+            lines.append(f'viddl_jobs_total{{result="{result}"}} {count}')
+        lines.append('# HELP viddl_retries_total Retries scheduled, by error class')
+        lines.append('# TYPE viddl_retries_total counter')
+        for kind, count in sorted(metric_counters['retries'].items()):
+            lines.append(f'viddl_retries_total{{kind="{kind}"}} {count}')
+        lines.append('# HELP viddl_downloaded_bytes_total Bytes transferred by finished jobs')
+        lines.append('# TYPE viddl_downloaded_bytes_total counter')
+        lines.append(f'viddl_downloaded_bytes_total {metric_counters["bytes"]}')
+        if throughput_histogram is not None:
+            lines.append('# HELP viddl_job_throughput_bytes_per_second Average transfer throughput per job')
+            lines.append('# TYPE viddl_job_throughput_bytes_per_second histogram')
+            prometheus_histogram(lines, 'viddl_job_throughput_bytes_per_second', throughput_histogram)
+        lines.append('# HELP viddl_peak_throughput_bytes_per_second Highest transfer speed reported by any job')
+        lines.append('# TYPE viddl_peak_throughput_bytes_per_second gauge')
+        lines.append(f'viddl_peak_throughput_bytes_per_second {int(peak_throughput)}')
+    lines.append('# HELP viddl_active_jobs Jobs currently known, by state')
+    lines.append('# TYPE viddl_active_jobs gauge')
+    for state, count in sorted(states.items()):
+        lines.append(f'viddl_active_jobs{{state="{state}"}} {count}')
+    return '\n'.join(lines) + '\n'
+
+# Event delivery
+def expose(func):
+    """Make a function callable from the web UI when Eel is installed"""
+    if eel is not None:
+        eel.expose(func)
+    return func
+
+def push_event(name, *args):
+    """Call a JavaScript function in the Eel window and forward the event to API subscribers"""
+    if eel is not None:
+        try:
+            getattr(eel, name)(*args)
+        except:
+            pass
+    
+    with event_lock:
+        subscribers = list(event_subscribers)
+    for subscriber in subscribers:
+        try:
+            subscriber.put_nowait((name, args))
+        except queue.Full:
+            # A client that stopped reading loses events rather than stalling the sender
+            pass
+
+# Progress bus
+def publish_progress(download_id, data):
+    """Record progress for the UI; terminal states are delivered immediately"""
+    if data.get('status') in TERMINAL_PROGRESS_STATES:
+        with progress_send_lock:
+            # Anything still pending for this job is superseded
+            with progress_lock:
+                progress_pending.pop(download_id, None)
+            push_event('update_progress', download_id, data)
+        return
+    
+    with progress_lock:
+        progress_pending[download_id] = data
+    ensure_progress_flusher()
+
+def flush_progress():
+    """Push all pending progress updates to the UI as one batch"""
+    with progress_send_lock:
+        with progress_lock:
+            if not progress_pending:
+                return
+            batch = dict(progress_pending)
+            progress_pending.clear()
+        push_event('update_progress_batch', batch)
+
+def ensure_progress_flusher():
+    """Start the progress flusher thread on first use"""
+    global progress_flusher
+    if progress_flusher is not None:
+        return
+    with progress_lock:
+        if progress_flusher is not None:
+            return
+        progress_flusher = threading.Thread(target=progress_flush_loop, daemon=True, name="ProgressFlusher")
+        progress_flusher.start()
+
+def get_progress_interval():
+    """Seconds between progress batches, from the configured rate"""
+    try:
+        hz = float(load_config().get('progress_update_hz', DEFAULT_PROGRESS_UPDATE_HZ))
+    except (TypeError, ValueError):
+        hz = DEFAULT_PROGRESS_UPDATE_HZ
+    return 1 / max(0.5, min(hz, 30))
+
+def progress_flush_loop():
+    """Flush pending progress at the configured rate"""
+    while True:
+        time.sleep(get_progress_interval())
+        try:
+            flush_progress()
+        except Exception:
+            logging.exception("Progress flush failed")
+
+# Format selection
+def estimate_format_bytes(f, duration):
+    """Reported or bitrate-estimated size of a single format in bytes, or None"""
+    size = f.get('filesize') or f.get('filesize_approx')
+    if size:
+        return int(size)
+    tbr = f.get('tbr') or (f.get('vbr') or 0) + (f.get('abr') or 0)
+    if tbr and duration:
+        return int(tbr * duration * 125)  # kbit/s -> bytes
+    return None
+
+def codec_efficiency(codec, table):
+    """Efficiency factor for a codec string such as 'vp09.00.40.08'"""
+    codec = (codec or '').lower()
+    for prefix, factor in table.items():
+        if codec.startswith(prefix):
+            return factor
+    return 1.0
+
+def rank_formats(info):
+    """Score every downloadable video option in a single pass over info['formats']
+    
+    Each candidate carries the exact yt-dlp format spec to download, its estimated
+    size and a quality score (bitrate weighted by codec efficiency). Only the codec
+    string 'none' marks a stream as absent; codecs the extractor did not report
+    count as present, and formats without a height rank below every known one.
+    """
+    duration = info.get('duration') or 0
+    best_audio = None
+    muxed = []
+    video_only = []
+    
+    for f in info.get('formats') or []:
+        vcodec = f.get('vcodec')
+        acodec = f.get('acodec')
+        # Skip storyboards and other non-media entries
+        if vcodec == 'none' and acodec == 'none':
+            continue
+        
+        size = estimate_format_bytes(f, duration)
+        if vcodec == 'none':
+            score = (f.get('abr') or f.get('tbr') or 0) * codec_efficiency(acodec, AUDIO_CODEC_EFFICIENCY)
+            if best_audio is None or score > best_audio['score']:
+                best_audio = {'format': f, 'bytes': size, 'score': score}
+            continue
+        
+        candidate = {
+            'format_id': f['format_id'],
+            'height': f.get('height') or 0,
+            'fps': f.get('fps') or 30,
+            'ext': f.get('ext', 'mp4'),
+            'vcodec': vcodec or 'unknown',
+            'acodec': acodec or 'unknown',
+            'bytes': size,
+            'quality': (f.get('vbr') or f.get('tbr') or 0) * codec_efficiency(vcodec, VIDEO_CODEC_EFFICIENCY)
+        }
+        (muxed if acodec != 'none' else video_only).append(candidate)
+    
+    # Video-only streams are merged with the best audio track into mp4
+    for candidate in video_only:
+        if best_audio is None:
+            continue
+        audio = best_audio['format']
+        candidate['format_id'] = f"{candidate['format_id']}+{audio['format_id']}"
+        candidate['acodec'] = audio.get('acodec', 'unknown')
+        candidate['ext'] = 'mp4'
+        if candidate['bytes'] is not None and best_audio['bytes'] is not None:
+            candidate['bytes'] += best_audio['bytes']
+        elif best_audio['bytes'] is None:
+            candidate['bytes'] = None
+    
+    return muxed + (video_only if best_audio is not None else [])
+
+def candidate_rank(candidate):
+    """Sort key: resolution, then frame rate, then codec-weighted bitrate"""
+    return (candidate['height'], candidate['fps'], candidate['quality'])
+
+def smallest_at_resolution(candidates, height, fps=None):
+    """Cheapest candidate at a resolution (and frame rate, if given)"""
+    matches = [c for c in candidates if c['height'] == height and (fps is None or c['fps'] == fps)]
+    if not matches:
+        return None
+    # Unknown sizes sort last; equal sizes prefer the better stream
+    return min(matches, key=lambda c: (c['bytes'] if c['bytes'] is not None else float('inf'), -c['quality']))
+
+def best_under_size(candidates, max_bytes):
+    """Highest quality candidate whose estimated size fits the budget"""
+    fitting = [c for c in candidates if c['bytes'] is not None and c['bytes'] <= max_bytes]
+    if fitting:
+        return max(fitting, key=candidate_rank)
+    # Nothing fits: fall back to the smallest known option
+    sized = [c for c in candidates if c['bytes'] is not None]
+    return min(sized, key=lambda c: c['bytes']) if sized else None
+
+def format_option(candidate):
+    """Shape a candidate for the UI quality selector"""
+    return {
+        'format_id': candidate['format_id'],
+        'resolution': f"{candidate['height']}p" if candidate['height'] else 'Unknown resolution',
+        'height': candidate['height'],
+        'ext': candidate['ext'],
+        'filesize': candidate['bytes'] or 0,
+        'fps': candidate['fps'],
+        'vcodec': candidate['vcodec'],
+        'acodec': candidate['acodec']
+    }
+
+# Thumbnail pipeline
+def thumbnail_cache_key(video_id, url):
+    """Content-addressed cache key: keyed by video id, or by URL when there is none"""
+    key = f"id:{video_id}" if video_id else f"url:{url}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def cached_thumbnail_name(key):
+    """File name a thumbnail was cached under (the extension follows its image type), or None"""
+    for ext in THUMBNAIL_TYPES.values():
+        if os.path.exists(os.path.join(THUMBNAIL_DIR, key + ext)):
+            return key + ext
+    return None
+
+def cached_thumbnail_url(video_id, url):
+    """URL the UI can load for a cached thumbnail, or None if it is not on disk yet"""
+    name = cached_thumbnail_name(thumbnail_cache_key(video_id, url))
+    return THUMBNAIL_URL_PREFIX + name if name else None
+
+def request_thumbnail(url, video_id):
+    """Queue a thumbnail fetch unless it is cached, already queued or recently failed"""
+    if not url:
+        return
+    key = thumbnail_cache_key(video_id, url)
+    if cached_thumbnail_name(key):
+        return
+    
+    with thumbnail_lock:
+        if key in thumbnail_pending or thumbnail_failures.get(key, 0) > time.time():
+            return
+        thumbnail_pending.add(key)
+        while len(thumbnail_workers) < THUMBNAIL_WORKERS:
+            worker = threading.Thread(
+                target=thumbnail_worker, daemon=True,
+                name=f"Thumbnail-{len(thumbnail_workers) + 1}"
+            )
+            thumbnail_workers.append(worker)
+            worker.start()
+    thumbnail_queue.put((url, key))
+
+def thumbnail_worker():
+    """Fetch queued thumbnails one after another over reused connections"""
+    while True:
+        url, key = thumbnail_queue.get()
+        try:
+            with timed_phase('thumbnail'):
+                fetch_thumbnail(url, os.path.join(THUMBNAIL_DIR, key))
+        except Exception:
+            logging.warning(f"Thumbnail download failed: {url}")
+            record_thumbnail_failure(key)
+        finally:
+            with thumbnail_lock:
+                thumbnail_pending.discard(key)
+
+def record_thumbnail_failure(key):
+    """Hold off refetching a failed thumbnail, so re-rendered history rows do not retry it every time"""
+    now = time.time()
+    with thumbnail_lock:
+        for expired in [k for k, until in thumbnail_failures.items() if until <= now]:
+            del thumbnail_failures[expired]
+        thumbnail_failures[key] = now + THUMBNAIL_RETRY_COOLDOWN
+
+def get_thumbnail_connection(scheme, netloc, fresh=False):
+    """Keep-alive connection to a host, reused by this worker thread"""
+    pool = getattr(thumbnail_connections, 'pool', None)
+    if pool is None:
+        pool = thumbnail_connections.pool = {}
+    key = (scheme, netloc)
+    conn = pool.get(key)
+    if conn is not None and fresh:
+        conn.close()
+        conn = None
+    if conn is None:
+        conn_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        conn = pool[key] = conn_class(netloc, timeout=15)
+    return conn
+
+def thumbnail_extension(content_type, url):
+    """Cache file extension for a thumbnail, from its Content-Type or else its URL"""
+    mime = (content_type or '').split(';', 1)[0].strip().lower()
+    if mime in THUMBNAIL_TYPES:
+        return THUMBNAIL_TYPES[mime]
+    ext = os.path.splitext(urllib.parse.urlsplit(url).path)[1].lower()
+    if ext == '.jpeg':
+        ext = '.jpg'
+    return ext if ext in THUMBNAIL_TYPES.values() else '.jpg'
+
+def fetch_thumbnail(url, dest, redirects=3):
+    """Download a thumbnail into the cache under dest plus its image extension, writing it atomically"""
+    parts = urllib.parse.urlsplit(url)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    headers = {'User-Agent': 'Mozilla/5.0', 'Connection': 'keep-alive'}
+    
+    # A pooled connection may have been closed by the server; retry once on a fresh one
+    for fresh in (False, True):
+        conn = get_thumbnail_connection(parts.scheme, parts.netloc, fresh)
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+            break
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            if fresh:
+                raise
+    
+    if response.status in (301, 302, 303, 307, 308) and redirects > 0:
+        location = urllib.parse.urljoin(url, response.getheader('Location', ''))
+        return fetch_thumbnail(location, dest, redirects - 1)
+    if response.status != 200:
+        raise http.client.HTTPException(f"HTTP {response.status} for {url}")
+    
+    dest += thumbnail_extension(response.getheader('Content-Type'), url)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp_path = dest + '.part'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, dest)
+    logging.info(f"Thumbnail cached: {os.path.basename(dest)}")
+
+@bottle.route(THUMBNAIL_URL_PREFIX + '<name>')
+def serve_thumbnail(name):
+    """Serve cached thumbnails to the UI (registered on the app Eel starts)"""
+    mimetypes = {ext: mime for mime, ext in THUMBNAIL_TYPES.items()}
+    mimetype = mimetypes.get(os.path.splitext(name)[1].lower(), 'image/jpeg')
+    response = bottle.static_file(name, root=os.path.abspath(THUMBNAIL_DIR), mimetype=mimetype)
+    response.set_header('Cache-Control', 'max-age=86400')
+    return response
 
 # Utility functions
-def sanitize_filename(filename):
-    """Remove invalid characters from filename"""
-    # Remove invalid filesystem characters
-    filename = re.sub(r'[<>:"/\\|?*]', '', filename)
-    # Remove leading/trailing spaces and dots
-    filename = filename.strip('. ')
-    return filename[:200]  # Limit length
-
-def download_thumbnail(url, title):
-    """Download thumbnail and save with video title name"""
-    try:
-        if not url:
+def format_error_message(error_str):
+    """Convert technical errors to user-friendly messages"""
+    error_lower = str(error_str).lower()
+    
+    # Check for specific error patterns
+    error_mappings = {
+        ('cancelled', 'canceled', 'killed'): "Download cancelled by user",
+        ('http error 403', 'forbidden'): "Access denied. The video might be private, region-blocked, or require authentication.",
+        ('http error 404', 'not found'): "Video not found. The URL might be incorrect or the video was removed.",
+        ('http error 429', 'too many requests', 'rate limit'): "Too many requests. The website is rate-limiting. Please wait and try again.",
+        ('private video',): "This is a private video. You need proper access permissions.",
+        ('sign in', 'login', 'authentication'): "This video requires login. Please add credentials in Settings.",
+        ('copyright',): "This video is copyright protected and cannot be downloaded.",
+        ('unavailable',): "Video unavailable. It might be deleted, private, or region-restricted.",
+        ('network', 'connection'): "Network error. Check your internet connection.",
+        ('timeout', 'timed out'): "Connection timeout. The server took too long to respond.",
+        ('format not available', 'requested format is not available'): "Requested format not available. Try a different quality.",
+        ('ffmpeg', 'ffprobe'): "FFmpeg error. The video processing failed.",
+    }
+    
+    for keywords, message in error_mappings.items():
+        if any(keyword in error_lower for keyword in keywords):
+            return message
+    
+    # Generic error with truncated message
+    return f"Download failed: {str(error_str)[:150]}"
+
+# Retry policy
+def classify_error(error):
+    """Sort a failure into permanent, transient or rate-limited"""
+    error_lower = str(error).lower()
+    if any(pattern in error_lower for pattern in RATE_LIMIT_ERROR_PATTERNS):
+        return ERROR_RATE_LIMITED
+    if any(pattern in error_lower for pattern in TRANSIENT_ERROR_PATTERNS):
+        return ERROR_TRANSIENT
+    if any(pattern in error_lower for pattern in PERMANENT_ERROR_PATTERNS):
+        return ERROR_PERMANENT
+    return ERROR_TRANSIENT
+
+def retry_after_seconds(error):
+    """Seconds requested by a Retry-After header anywhere in the exception chain, or None"""
+    seen = set()
+    exc = error
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        response = getattr(exc, 'response', None)
+        headers = getattr(response, 'headers', None) or getattr(exc, 'headers', None)
+        value = headers.get('Retry-After') if headers else None
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                try:
+                    return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+        # yt-dlp wraps the original error in DownloadError.exc_info
+        exc_info = getattr(exc, 'exc_info', None)
+        wrapped = exc_info[1] if isinstance(exc_info, tuple) and len(exc_info) > 1 else None
+        exc = wrapped or exc.__cause__ or exc.__context__
+    return None
+
+def backoff_delay(attempt, config):
+    """Exponential backoff from the configured base delay, with jitter"""
+    base = max(0.5, float(config.get('retry_delay', 3)))
+    cap = float(config.get('max_retry_delay', DEFAULT_MAX_RETRY_DELAY))
+    delay = min(cap, base * 2 ** max(0, attempt - 1))
+    # Equal jitter keeps parallel retries from hitting a site in lockstep
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def normalize_host(host):
+    """Lower-case host name without www./m. prefixes"""
+    host = (host or '').strip().lower()
+    for prefix in ('www.', 'm.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    return host
+
+def job_host(job):
+    """Site a job talks to, used for circuit breakers and bandwidth caps"""
+    return normalize_host(urllib.parse.urlsplit(job.url).hostname)
+
+def circuit_blocked_until(host):
+    """Time until which new attempts against a host are held back (0 when closed)"""
+    with host_circuits_lock:
+        circuit = host_circuits.get(host)
+        return circuit['open_until'] if circuit else 0
+
+def record_host_success(host):
+    """Close the host's circuit after a successful transfer"""
+    with host_circuits_lock:
+        host_circuits.pop(host, None)
+
+def record_host_failure(host, kind, retry_after=None):
+    """Count a failure against a host and open its circuit when it is throttling or failing"""
+    if kind == ERROR_PERMANENT:
+        return
+    with host_circuits_lock:
+        circuit = host_circuits.setdefault(host, {'failures': 0, 'open_until': 0, 'cooldown': CIRCUIT_BASE_COOLDOWN})
+        circuit['failures'] += 1
+        now = time.time()
+        if kind == ERROR_RATE_LIMITED:
+            pause = retry_after if retry_after is not None else circuit['cooldown']
+        elif circuit['failures'] >= CIRCUIT_FAILURE_THRESHOLD:
+            pause = circuit['cooldown']
+        else:
+            return
+        circuit['open_until'] = max(circuit['open_until'], now + pause)
+        circuit['cooldown'] = min(CIRCUIT_MAX_COOLDOWN, circuit['cooldown'] * 2)
+    logging.warning(f"Circuit for {host} open for {int(pause)}s after {kind} failure")
+
+# Bandwidth governor
+class TokenBucket:
+    """Thread-safe token bucket; rate is bytes per second and 0 means unlimited"""
+    
+    def __init__(self, rate=0):
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+    
+    def set_rate(self, rate):
+        with self.lock:
+            self.refill()
+            self.rate = rate
+            # Allow at most one second of burst at the new rate
+            self.tokens = min(self.tokens, rate)
+    
+    def refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def consume(self, amount):
+        """Take amount bytes and return how long the caller should sleep"""
+        with self.lock:
+            if not self.rate:
+                return 0
+            self.refill()
+            self.tokens -= amount
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+def kbps_to_rate(value):
+    """KB/s setting to bytes per second, 0 for unlimited or invalid values"""
+    try:
+        return max(0, int(float(value) * 1024))
+    except (TypeError, ValueError):
+        return 0
+
+def current_bandwidth_limit(config):
+    """Global cap in bytes per second, taking the time-of-day schedule into account"""
+    now = datetime.now().strftime('%H:%M')
+    for rule in config.get('bandwidth_schedule') or ():
+        start, end = rule.get('start', ''), rule.get('end', '')
+        # Windows may wrap past midnight, e.g. 22:00-06:00
+        active = start <= now < end if start <= end else (now >= start or now < end)
+        if active:
+            return kbps_to_rate(rule.get('limit', 0))
+    return kbps_to_rate(config.get('bandwidth_limit', 0))
+
+def water_fill(capacity, demands):
+    """Max-min fair split of capacity over {key: demand}; float('inf') means unbounded"""
+    allocation = {}
+    remaining = capacity
+    pending = sorted(demands.items(), key=lambda item: item[1])
+    while pending:
+        share = remaining / len(pending)
+        key, demand = pending.pop(0)
+        allocation[key] = min(demand, share)
+        remaining -= allocation[key]
+    return allocation
+
+def rebalance_bandwidth():
+    """Recompute every running job's share of the global and per-host caps"""
+    config = load_config()
+    global_cap = current_bandwidth_limit(config)
+    host_caps = {normalize_host(host): kbps_to_rate(limit) for host, limit in (config.get('host_bandwidth_limits') or {}).items()}
+    
+    with bandwidth_lock:
+        entries = dict(bandwidth_jobs)
+    if not entries:
+        return
+    
+    # A job running clearly below its share is limited elsewhere; give the slack to others
+    demands = {}
+    for download_id, entry in entries.items():
+        rate = entry['bucket'].rate
+        speed = entry['speed']
+        demands[download_id] = speed * 1.25 + 65536 if rate and speed and speed < rate * 0.8 else float('inf')
+    
+    for host in {entry['host'] for entry in entries.values()}:
+        cap = host_caps.get(host)
+        if cap:
+            members = {k: demands[k] for k, e in entries.items() if e['host'] == host}
+            demands.update(water_fill(cap, members))
+    
+    allocation = water_fill(global_cap, demands) if global_cap else demands
+    for download_id, entry in entries.items():
+        rate = allocation[download_id]
+        entry['bucket'].set_rate(0 if rate == float('inf') else max(1024, int(rate)))
+
+def register_bandwidth_job(download_id, host):
+    """Start governing a job's transfer rate"""
+    global bandwidth_thread
+    with bandwidth_lock:
+        bandwidth_jobs[download_id] = {'host': host, 'bucket': TokenBucket(), 'speed': 0}
+        if bandwidth_thread is None:
+            bandwidth_thread = threading.Thread(target=bandwidth_loop, daemon=True, name="BandwidthGovernor")
+            bandwidth_thread.start()
+    rebalance_bandwidth()
+
+def unregister_bandwidth_job(download_id):
+    """Stop governing a job and hand its share to the others"""
+    with bandwidth_lock:
+        removed = bandwidth_jobs.pop(download_id, None)
+    if removed is not None:
+        rebalance_bandwidth()
+
+def throttle_download(job, nbytes, speed):
+    """Charge transferred bytes to a job's bucket, sleeping when it is over its share"""
+    with bandwidth_lock:
+        entry = bandwidth_jobs.get(job.download_id)
+    if entry is None:
+        return 0
+    if speed:
+        entry['speed'] = speed
+    deadline = time.monotonic() + entry['bucket'].consume(nbytes)
+    # Sleep off the debt on the cancel event, in short naps so pausing stays responsive too
+    while time.monotonic() < deadline and not job.cancelled and not job.paused:
+        job.cancel_event.wait(min(0.25, deadline - time.monotonic()))
+    return entry['bucket'].rate
+
+def bandwidth_loop():
+    """Periodically rebalance shares so schedules and measured speeds take effect"""
+    while True:
+        time.sleep(BANDWIDTH_REBALANCE_INTERVAL)
+        try:
+            rebalance_bandwidth()
+        except Exception:
+            logging.exception("Bandwidth rebalance failed")
+
+add_config_listener(lambda config: rebalance_bandwidth())
+
+# Adaptive transfer tuning
+def tuning_key(fragments, chunk_size):
+    """JSON-friendly key for a fragment concurrency / chunk size pair"""
+    return f"{fragments}:{chunk_size}"
+
+def parse_tuning_key(key):
+    fragments, chunk_size = key.split(':')
+    return int(fragments), int(chunk_size)
+
+def get_host_tuning():
+    """Per-host tuning state, loaded from disk on first use (caller holds host_tuning_lock)"""
+    global host_tuning
+    if host_tuning is None:
+        host_tuning = {}
+        try:
+            with open(TUNING_FILE, 'r', encoding='utf-8') as f:
+                host_tuning = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logging.exception("Failed loading transfer tuning, starting fresh")
+    return host_tuning
+
+def save_host_tuning():
+    """Persist tuning state so each host starts from its best known settings (caller holds host_tuning_lock)"""
+    try:
+        write_json_atomic(TUNING_FILE, host_tuning)
+    except Exception:
+        logging.exception("Failed to save transfer tuning")
+
+def tuning_neighbours(key):
+    """Settings one step away from key on the fragment and chunk size ladders"""
+    fragments, chunk_size = parse_tuning_key(key)
+    f_index = FRAGMENT_LEVELS.index(fragments) if fragments in FRAGMENT_LEVELS else FRAGMENT_LEVELS.index(8)
+    c_index = CHUNK_SIZE_LEVELS.index(chunk_size) if chunk_size in CHUNK_SIZE_LEVELS else CHUNK_SIZE_LEVELS.index(524288)
+    neighbours = []
+    for df, dc in ((1, 0), (0, 1), (-1, 0), (0, -1)):
+        fi, ci = f_index + df, c_index + dc
+        if 0 <= fi < len(FRAGMENT_LEVELS) and 0 <= ci < len(CHUNK_SIZE_LEVELS):
+            neighbours.append(tuning_key(FRAGMENT_LEVELS[fi], CHUNK_SIZE_LEVELS[ci]))
+    return neighbours
+
+def choose_transfer_settings(host):
+    """Pick fragment concurrency, chunk size and socket timeout for a job against host
+    
+    Hill climbing over the ladders: untried neighbours of the best known
+    settings are probed first, and settled hosts re-probe a neighbour now and
+    then so the choice follows changing network conditions.
+    """
+    if not load_config().get('adaptive_transfer_tuning', True):
+        return dict(DEFAULT_TRANSFER_SETTINGS)
+    
+    with host_tuning_lock:
+        state = get_host_tuning().setdefault(host, {
+            'best': tuning_key(DEFAULT_TRANSFER_SETTINGS['fragments'], DEFAULT_TRANSFER_SETTINGS['chunk_size']),
+            'samples': {},
+            'socket_timeout': DEFAULT_TRANSFER_SETTINGS['socket_timeout'],
+            'jobs': 0
+        })
+        state['jobs'] += 1
+        key = state['best']
+        if key in state['samples']:
+            neighbours = tuning_neighbours(key)
+            untried = [n for n in neighbours if n not in state['samples']]
+            if untried:
+                key = untried[0]
+            elif state['jobs'] % TUNING_EXPLORE_EVERY == 0:
+                key = random.choice(neighbours)
+        fragments, chunk_size = parse_tuning_key(key)
+        return {'fragments': fragments, 'chunk_size': chunk_size, 'socket_timeout': state['socket_timeout']}
+
+def record_transfer_sample(host, settings, nbytes, elapsed):
+    """Fold a finished transfer's throughput into the host's tuning state"""
+    if nbytes < TUNING_MIN_BYTES or elapsed < TUNING_MIN_SECONDS:
+        return
+    throughput = nbytes / elapsed
+    key = tuning_key(settings['fragments'], settings['chunk_size'])
+    with host_tuning_lock:
+        state = get_host_tuning().get(host)
+        if state is None:
+            return
+        previous = state['samples'].get(key)
+        state['samples'][key] = throughput if previous is None else previous + TUNING_SMOOTHING * (throughput - previous)
+        best = max(state['samples'], key=state['samples'].get)
+        if best != state['best']:
+            logging.info(f"Transfer tuning for {host}: {state['best']} -> {best} ({state['samples'][best] / 1048576:.1f} MB/s)")
+            state['best'] = best
+        save_host_tuning()
+
+def record_transfer_failure(host, settings, error, kind):
+    """Back off a host's settings after it throttled us or timed out"""
+    if settings is None or kind == ERROR_PERMANENT:
+        return
+    key = tuning_key(settings['fragments'], settings['chunk_size'])
+    with host_tuning_lock:
+        state = get_host_tuning().get(host)
+        if state is None:
+            return
+        if kind == ERROR_RATE_LIMITED:
+            # Too aggressive for this CDN: score the settings as worthless and step concurrency down
+            state['samples'][key] = 0
+            if state['best'] == key:
+                lower = [f for f in FRAGMENT_LEVELS if f < settings['fragments']]
+                state['best'] = tuning_key(lower[-1] if lower else FRAGMENT_LEVELS[0], settings['chunk_size'])
+        elif 'timed out' in str(error).lower() or 'timeout' in str(error).lower():
+            longer = [t for t in SOCKET_TIMEOUT_LEVELS if t > state['socket_timeout']]
+            if not longer:
+                return
+            state['socket_timeout'] = longer[0]
+        else:
+            return
+        logging.info(f"Transfer tuning for {host} backed off after {kind} failure: best {state['best']}, timeout {state['socket_timeout']}s")
+        save_host_tuning()
+
+# Download jobs
+class DownloadJob:
+    """State of one queued, running or post-processing download
+    
+    Scheduling fields are changed under downloads_lock. Cancel and pause
+    requests are events, so progress hooks on every download thread can check
+    them without taking the lock. Setting either one also shuts down the
+    sockets the job has open, and cancelling kills its FFmpeg processes, so a
+    stalled read or a long merge stops straight away instead of at the next
+    progress update.
+    """
+    __slots__ = ('download_id', 'url', 'title', 'format_choice', 'quality', 'format_id', 'priority', 'seq',
+                 'state', 'queued_at', 'not_before', 'output_path', 'files', 'attempt', 'rate_limit_hits',
+                 'transfer_settings', 'postprocess_queued_at', 'metrics',
+                 'cancel_event', 'pause_event', 'pause_requested', 'responses', 'processes', 'resources_lock')
+    
+    def __init__(self, download_id, url, format_choice, quality, seq, title=None, format_id=None,
+                 priority=0, state='queued', output_path=None, paused=False):
+        self.download_id = download_id
+        self.url = url
+        self.title = title
+        self.format_choice = format_choice
+        self.quality = quality
+        self.format_id = format_id
+        self.priority = int(priority)
+        self.seq = seq
+        self.state = state
+        self.queued_at = time.time()
+        self.not_before = 0  # held back until then by a retry backoff
+        self.output_path = output_path
+        self.files = set()  # files this job has written download data to
+        self.attempt = 0
+        self.rate_limit_hits = 0
+        self.transfer_settings = None
+        self.postprocess_queued_at = None
+        self.metrics = {'phases': {}, 'bytes': 0, 'peak_speed': 0, 'retries': 0}
+        self.cancel_event = threading.Event()
+        self.pause_event = threading.Event()
+        if paused:
+            self.pause_event.set()
+        self.pause_requested = False  # paused during the current run, even if resumed since
+        self.responses = weakref.WeakSet()
+        self.processes = weakref.WeakSet()
+        self.resources_lock = threading.Lock()
+    
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+    
+    @property
+    def paused(self):
+        return self.pause_event.is_set()
+    
+    def cancel(self):
+        self.cancel_event.set()
+        self.interrupt(kill=True)
+    
+    def pause(self):
+        self.pause_requested = True
+        self.pause_event.set()
+        self.interrupt()
+    
+    def resume(self):
+        self.pause_event.clear()
+    
+    def check(self):
+        """Abort the yt-dlp call in progress if the job was cancelled or paused"""
+        if self.cancelled:
+            raise load_yt_dlp().utils.DownloadError("CANCELLED")
+        if self.paused:
+            raise load_yt_dlp().utils.DownloadError("PAUSED")
+    
+    def track_response(self, response):
+        with self.resources_lock:
+            self.responses.add(response)
+        # A cancel that raced the request must still see this response
+        if self.cancelled or self.paused:
+            abort_response(response)
+    
+    def track_process(self, process):
+        with self.resources_lock:
+            self.processes.add(process)
+        if self.cancelled:
+            kill_process(process)
+    
+    def interrupt(self, kill=False):
+        """Unblock reads on the job's open responses and, with kill, end its FFmpeg processes"""
+        with self.resources_lock:
+            responses = list(self.responses)
+            processes = list(self.processes) if kill else []
+        for response in responses:
+            abort_response(response)
+        for process in processes:
+            kill_process(process)
+
+def abort_response(response):
+    """Shut down the socket under a yt-dlp response so a read blocked on it returns"""
+    fp = getattr(response, 'fp', None)
+    connection = getattr(fp, '_connection', None)
+    if connection is not None:
+        sock = getattr(connection, 'sock', None)  # urllib3 response (requests handler)
+    else:
+        sock = getattr(getattr(getattr(fp, 'fp', None), 'raw', None), '_sock', None)  # http.client response (urllib handler)
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass  # already closed
+
+def kill_process(process):
+    """Kill a subprocess that may already have exited"""
+    try:
+        if process.poll() is None:
+            process.kill()
+    except OSError:
+        pass
+
+@contextlib.contextmanager
+def running_job(job):
+    """Attribute subprocesses and log records from this thread to job"""
+    previous = getattr(job_context, 'job', None)
+    job_context.job = job
+    try:
+        yield
+    finally:
+        job_context.job = previous
+
+class InterruptibleMixin:
+    """YoutubeDL behaviour that ties the responses it opens to a job
+    
+    Mixed into YoutubeDL as part of JobYDL by load_yt_dlp(); run_download sets
+    job. Cancelling or pausing the job shuts those responses' sockets down, and
+    the retries that follow fail here instead of reconnecting.
+    """
+    job = None
+    
+    def urlopen(self, req):
+        if self.job is None:
+            return super().urlopen(req)
+        self.job.check()
+        response = super().urlopen(req)
+        self.job.track_response(response)
+        return response
+
+class JobProcessMixin:
+    """Popen that registers itself with the job running on the current thread
+    
+    Mixed into yt-dlp's Popen as JobPopen by load_yt_dlp() and used for FFmpeg
+    post-processing and downloads, so cancelling a job can kill them.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        job = getattr(job_context, 'job', None)
+        if job is not None:
+            job.track_process(self)
+
+def output_templates():
+    """OUTPUT_TEMPLATES, then endless numbered variants of the last one"""
+    yield from OUTPUT_TEMPLATES
+    stem, ext = os.path.splitext(OUTPUT_TEMPLATES[-1])
+    for number in itertools.count(2):
+        yield f"{stem} ({number}){ext}"
+
+class UniqueOutputMixin:
+    """YoutubeDL behaviour that keeps a download from landing on another file of the same name
+    
+    Mixed into YoutubeDL as part of JobYDL by load_yt_dlp(). Output is named
+    after the title, so before a video is fetched its final name is checked:
+    when a file is already there and the media index does not record it as
+    this video and rendition, the next of output_templates() is used instead.
+    Under the 'download' duplicate policy every existing file counts as taken,
+    since keeping the name would let yt-dlp skip the download as already done.
+    """
+    job = None
+    
+    def process_info(self, info_dict):
+        if self.job is not None:
+            self.choose_output_template(info_dict)
+        return super().process_info(info_dict)
+    
+    def choose_output_template(self, info_dict):
+        owner = (info_archive_id(info_dict), media_variant(self.job.format_choice, self.job.quality))
+        directory = os.path.dirname(self.params['outtmpl']['default'])
+        reuse_name = get_duplicate_policy() != 'download'
+        utils = load_yt_dlp().utils
+        for template in output_templates():
+            template = os.path.join(directory, template)
+            filename = self.prepare_filename(info_dict, outtmpl=template)
+            outputs = [filename]
+            if self.job.format_choice == 'audio':
+                outputs.append(utils.replace_extension(filename, 'mp3'))
+            if all(not os.path.exists(path) or (reuse_name and media_index_owner(path) == owner) for path in outputs):
+                break
+        if template != self.params['outtmpl']['default']:
+            logging.info(f"Download {self.job.download_id}: name taken by another file, saving as {filename}")
+            self.params['outtmpl']['default'] = template
+
+def remove_partial_files(job):
+    """Delete what a cancelled job leaves on disk: partial and unmerged downloads and their resume state"""
+    paths = set(job.files)
+    candidates = set()
+    for filename in job.files | {job.output_path}:
+        if not filename:
+            continue
+        candidates.update((filename + '.part', filename + '.ytdl', filename + '.part.segments'))
+        candidates.update(glob.glob(glob.escape(filename) + '.part-Frag*'))
+    for path in paths | candidates:
+        try:
+            os.remove(path)
+            logging.info(f"Removed partial file {path}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"Could not remove partial file {path}: {e}")
+
+def is_cancelled(download_id):
+    """Check if download has been cancelled (or is no longer known)"""
+    job = active_downloads.get(download_id)
+    return job is None or job.cancelled
+
+def is_paused(download_id):
+    """Check if download has been asked to pause"""
+    job = active_downloads.get(download_id)
+    return job is not None and job.paused
+
+# Download scheduler
+def get_max_concurrent_downloads():
+    """Configured size of the download worker pool"""
+    try:
+        return max(1, int(load_config().get('max_concurrent_downloads', DEFAULT_MAX_CONCURRENT_DOWNLOADS)))
+    except (TypeError, ValueError):
+        return DEFAULT_MAX_CONCURRENT_DOWNLOADS
+
+def enqueue_job(job):
+    """Push a job onto the priority queue (caller holds downloads_lock)"""
+    heapq.heappush(download_queue, (job.priority, job.seq, job.download_id))
+    download_queue_cond.notify()
+
+def pop_next_job():
+    """Pop the highest priority runnable job (caller holds downloads_lock)
+    
+    Stale heap entries are dropped. Jobs waiting out a retry backoff or an open
+    host circuit stay queued without taking a worker. Returns (job, wake_at),
+    where wake_at is when the earliest held-back job becomes runnable.
+    """
+    now = time.time()
+    held = []
+    wake_at = None
+    job = None
+    while download_queue:
+        entry = heapq.heappop(download_queue)
+        priority, seq, download_id = entry
+        candidate = active_downloads.get(download_id)
+        if candidate is None or candidate.state != 'queued':
+            continue
+        if (candidate.priority, candidate.seq) != (priority, seq):
+            continue
+        ready_at = max(candidate.not_before, circuit_blocked_until(job_host(candidate)))
+        if ready_at > now:
+            held.append(entry)
+            wake_at = ready_at if wake_at is None else min(wake_at, ready_at)
+            continue
+        job = candidate
+        break
+    for entry in held:
+        heapq.heappush(download_queue, entry)
+    return job, wake_at
+
+def schedule_retry(job, not_before):
+    """Return a failed job to the queue, runnable again at not_before"""
+    with downloads_lock:
+        if active_downloads.get(job.download_id) is not job:
+            return
+        job.not_before = not_before
+        job.state = 'queued'
+        job.queued_at = time.time()
+        enqueue_job(job)
+    journal_update(job.download_id, state='queued')
+
+def ensure_download_workers():
+    """Resize the worker pool to match the configured concurrency"""
+    global download_pool_size
+    limit = get_max_concurrent_downloads()
+    with downloads_lock:
+        download_pool_size = limit
+        while len(download_workers) < limit:
+            worker = threading.Thread(
+                target=download_worker, daemon=True,
+                name=f"DownloadWorker-{len(download_workers) + 1}"
+            )
+            download_workers.append(worker)
+            worker.start()
+        # Wake idle workers so surplus ones can retire
+        download_queue_cond.notify_all()
+
+add_config_listener(lambda config: ensure_download_workers())
+
+def download_worker():
+    """Worker loop: take the next queued job and run it to completion"""
+    me = threading.current_thread()
+    while True:
+        with download_queue_cond:
+            job = None
+            while job is None:
+                if download_workers.index(me) >= download_pool_size:
+                    download_workers.remove(me)
+                    return
+                job, wake_at = pop_next_job()
+                if job is None:
+                    download_queue_cond.wait(None if wake_at is None else max(0.05, wake_at - time.time()))
+            job.state = 'running'
+            job.pause_requested = False
+        
+        observe_phase('queue_wait', max(0, time.time() - job.queued_at), job)
+        journal_update(job.download_id, state='running')
+        try:
+            with running_job(job):
+                run_download(job)
+        except Exception:
+            logging.exception(f"Unhandled error in download {job.download_id}")
+            cleanup_download(job.download_id, 'error')
+
+# Extraction processes
+class ExtractionProcessError(Exception):
+    """A failed extraction carried back from a worker process
+    
+    yt-dlp errors hold tracebacks and responses, which cannot be pickled, so
+    only the message and any Retry-After delay come back; the retry policy
+    reads both the same way it does from the original error.
+    """
+    
+    def __init__(self, message, retry_after=None):
+        super().__init__(message, retry_after)
+        self.headers = {'Retry-After': str(retry_after)} if retry_after is not None else {}
+    
+    def __str__(self):
+        return self.args[0]
+
+class ExtractionStatusLogger:
+    """yt-dlp logger for worker processes that sends status lines back as they are printed"""
+    
+    def __init__(self, task_id):
+        self.task_id = task_id
+    
+    def debug(self, message):
+        # to_screen output, e.g. "[youtube] abc: Downloading webpage"
+        if message.startswith('[') and not message.startswith('[debug]'):
+            extraction_channel.put((self.task_id, message))
+    
+    def info(self, message):
+        self.debug(message)
+    
+    def warning(self, message):
+        logging.warning(message)
+    
+    def error(self, message):
+        logging.error(message)
+
+def init_extraction_process(channel):
+    """Set up a worker process: its log records and status lines go back through channel"""
+    global extraction_channel
+    extraction_channel = channel
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(LogQueueHandler(channel, render=True))
+    load_yt_dlp()
+
+def extract_in_process(task_id, url, ydl_opts):
+    """Worker-process side of run_extraction: resolve a URL and return a picklable info dict"""
+    try:
+        with load_yt_dlp().YoutubeDL({**ydl_opts, 'logger': ExtractionStatusLogger(task_id)}) as ydl:
+            info = ydl.extract_info(url, download=False)
+    except Exception as e:
+        raise ExtractionProcessError(str(e), retry_after_seconds(e)) from None
+    # Videos come back in the shape the metadata cache stores; playlists keep their entries
+    return yt_dlp.YoutubeDL.sanitize_info(info, remove_private_keys=info.get('_type', 'video') == 'video')
+
+def extraction_channel_loop(channel):
+    """Pass worker log records to the app's logging and status lines to whoever waits on the task"""
+    while True:
+        item = channel.get()
+        if isinstance(item, logging.LogRecord):
+            logging.getLogger(item.name).handle(item)
+            continue
+        task_id, message = item
+        listener = extraction_listeners.get(task_id)
+        if listener is not None:
+            try:
+                listener(message)
+            except Exception:
+                logging.exception("Extraction status listener failed")
+
+def get_extraction_pool():
+    """Process pool for extraction, or None when extraction_processes is 0"""
+    global extraction_pool, extraction_pool_size, extraction_channel
+    try:
+        processes = max(0, int(load_config().get('extraction_processes', DEFAULT_EXTRACTION_PROCESSES)))
+    except (TypeError, ValueError):
+        processes = DEFAULT_EXTRACTION_PROCESSES
+    
+    with extraction_pool_lock:
+        if extraction_pool is not None and processes != extraction_pool_size:
+            # Resized or turned off: extractions already submitted finish on the old pool
+            extraction_pool.shutdown(wait=False)
+            extraction_pool = None
+        if processes == 0:
+            return None
+        if extraction_pool is None:
+            # Spawned, not forked: a fork would copy the UI process's threads, locks and sockets
+            context = multiprocessing.get_context('spawn')
+            if extraction_channel is None:
+                extraction_channel = context.Queue()
+                threading.Thread(target=extraction_channel_loop, args=(extraction_channel,),
+                                 daemon=True, name="ExtractionChannel").start()
+            extraction_pool = ProcessPoolExecutor(max_workers=processes, mp_context=context,
+                                                  initializer=init_extraction_process, initargs=(extraction_channel,))
+            extraction_pool_size = processes
+            logging.info(f"Started {processes} extraction processes")
+        return extraction_pool
+
+def discard_extraction_pool(pool):
+    """Drop a pool whose worker died, so the next extraction starts a fresh one"""
+    global extraction_pool
+    with extraction_pool_lock:
+        if extraction_pool is pool:
+            extraction_pool = None
+    pool.shutdown(wait=False)
+
+def run_extraction(pool, url, ydl_opts, job=None, on_status=None):
+    """Resolve a URL in a worker process; a cancelled or paused job stops waiting for it"""
+    task_id = next(extraction_tasks)
+    if on_status is not None:
+        extraction_listeners[task_id] = on_status
+    try:
+        future = pool.submit(extract_in_process, task_id, url, ydl_opts)
+        while job is not None and not wait([future], timeout=EXTRACTION_POLL_INTERVAL).done:
+            if job.cancelled or job.paused:
+                # Only a queued task can be withdrawn; a running one finishes and is thrown away
+                future.cancel()
+                job.check()
+        return future.result()
+    except BrokenProcessPool:
+        logging.error("An extraction process died, restarting the pool")
+        discard_extraction_pool(pool)
+        raise
+    finally:
+        extraction_listeners.pop(task_id, None)
+
+# Exposed Eel functions
+def base_ydl_options(config):
+    """yt-dlp options shared by every metadata extraction"""
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': False,
+        'socket_timeout': 30,
+        'no_check_certificate': False,
+    }
+    
+    # Set FFmpeg location for bundled app
+    ffmpeg_path = get_resource_path('ffmpeg')
+    if os.path.exists(ffmpeg_path):
+        ydl_opts['ffmpeg_location'] = ffmpeg_path
+    
+    # Add credentials if available
+    if config.get('credentials', {}).get('username'):
+        ydl_opts['username'] = config['credentials']['username']
+        ydl_opts['password'] = config['credentials']['password']
+    
+    return ydl_opts
+
+def resolve_video_info(url):
+    """Return the info dict for a URL from the metadata cache, extracting it on a miss"""
+    info = get_cached_video_info(url)
+    if info is not None:
+        return info
+    
+    pool = get_extraction_pool()
+    with timed_phase('metadata'):
+        if pool is not None:
+            info = run_extraction(pool, url, base_ydl_options(load_config()))
+        else:
+            with load_yt_dlp().YoutubeDL(base_ydl_options(load_config())) as ydl:
+                info = ydl.extract_info(url, download=False)
+    cache_video_info(url, info)
+    return info
+
+@expose
+def get_video_info(url):
+    """Fetch video metadata without downloading"""
+    try:
+        info = resolve_video_info(url)
+        
+        video_id = info.get('id', 'unknown')
+        thumbnail_url = info.get('thumbnail', '')
+        
+        # Offer the smallest stream for each resolution / frame rate
+        candidates = rank_formats(info)
+        tiers = sorted({(c['height'], c['fps']) for c in candidates})
+        formats = [format_option(smallest_at_resolution(candidates, height, fps)) for height, fps in tiers]
+        
+        logging.info(f"Fetched info for: {info.get('title', 'Unknown')}")
+        
+        return {
+            'success': True,
+            'title': info.get('title', 'Unknown'),
+            'thumbnail': thumbnail_url,
+            'duration': info.get('duration', 0),
+            'uploader': info.get('uploader', 'Unknown'),
+            'description': info.get('description', '')[:300],
+            'formats': formats,
+            'url': url,
+            'video_id': video_id,
+            'view_count': info.get('view_count', 0),
+            'upload_date': info.get('upload_date', ''),
+            'downloaded': [{'variant': entry['variant'], 'path': entry['path'], 'filesize': entry['filesize'],
+                            'downloaded_at': entry['downloaded_at']}
+                           for entry in find_downloaded(info_archive_id(info) or '')]
+        }
+        
+    except Exception as e:
+        logging.exception(f"Failed to fetch video info for: {url}")
+        error_msg = format_error_message(str(e))
+        return {
+            'success': False,
+            'error': error_msg,
+            'technical_error': str(e)
+        }
+
+@expose
+def pick_format(url, max_size_mb):
+    """Choose the best quality stream whose estimated size fits within max_size_mb"""
+    try:
+        candidates = rank_formats(resolve_video_info(url))
+        choice = best_under_size(candidates, float(max_size_mb) * 1024 * 1024)
+        if choice is None:
+            return {'success': False, 'error': 'No format with a known size is available'}
+        return {'success': True, 'format': format_option(choice)}
+    except Exception as e:
+        logging.exception(f"Failed to pick format for: {url}")
+        return {
+            'success': False,
+            'error': format_error_message(str(e)),
+            'technical_error': str(e)
+        }
+
+# Segmented HTTP downloads
+class RangeNotSupported(Exception):
+    """The server stopped honouring byte ranges part way through a segmented download"""
+
+class SegmentedDownloadMixin:
+    """HttpFD behaviour that fetches files of known length as byte ranges over several connections
+    
+    Mixed into yt-dlp's HttpFD as SegmentedHttpFD by load_yt_dlp().
+    
+    Enabled per YoutubeDL instance by the 'segmented_connections' param.
+    Anything it cannot split (unknown length, no range support, a Range header
+    set by the extractor, a partial file left by the single-connection
+    downloader) goes through HttpFD unchanged.
+    """
+    
+    def real_download(self, filename, info_dict):
+        connections = int(self.params.get('segmented_connections') or 0)
+        headers = info_dict.get('http_headers') or {}
+        if (connections < 2 or self.params.get('test') or info_dict.get('request_data')
+                or any(name.lower() == 'range' for name in headers)):
+            return super().real_download(filename, info_dict)
+        
+        tmpfilename = self.temp_name(filename)
+        state_path = tmpfilename + '.segments'
+        if os.path.isfile(tmpfilename) and not os.path.isfile(state_path):
+            # Partial file from the single-connection downloader; let it resume
+            return super().real_download(filename, info_dict)
+        
+        total = self.probe_length(info_dict)
+        if total is None or total < 2 * SEGMENT_MIN_SIZE:
+            return super().real_download(filename, info_dict)
+        
+        try:
+            return self.download_segments(filename, tmpfilename, state_path, info_dict, total, connections)
+        except RangeNotSupported:
+            logging.warning(f"Range requests stopped working for {filename}, falling back to one connection")
+            self.try_remove(state_path)
+            self.try_remove(tmpfilename)
+            return super().real_download(filename, info_dict)
+    
+    def range_request(self, info_dict, start, end):
+        headers = {**(info_dict.get('http_headers') or {}), 'Accept-Encoding': 'identity', 'Range': f'bytes={start}-{end}'}
+        extensions = {}
+        # Impersonation arrived in yt-dlp 2024.03; older releases have no such helper
+        get_impersonate_target = getattr(self, '_get_impersonate_target', None)
+        impersonate_target = get_impersonate_target(info_dict) if get_impersonate_target else None
+        if impersonate_target is not None:
+            extensions['impersonate'] = impersonate_target
+        return yt_dlp.networking.Request(info_dict['url'], headers=headers, extensions=extensions)
+    
+    def probe_length(self, info_dict):
+        """Total size in bytes when the server honours byte ranges, else None"""
+        errors = yt_dlp.networking.exceptions
+        try:
+            response = self.ydl.urlopen(self.range_request(info_dict, 0, 0))
+        except (errors.HTTPError, errors.TransportError):
             return None
+        try:
+            if response.status != 206:
+                return None
+            return yt_dlp.utils.parse_http_range(response.headers.get('Content-Range'))[2]
+        finally:
+            response.close()
+    
+    @staticmethod
+    def load_segments(tmpfilename, state_path, total):
+        """Segment list saved by an interrupted run, or None if it does not match this file"""
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('total') == total and os.path.getsize(tmpfilename) == total:
+                return state['segments']
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+    
+    def download_segments(self, filename, tmpfilename, state_path, info_dict, total, connections):
+        # Each segment is [first byte, last byte, next byte to fetch]
+        segments = self.load_segments(tmpfilename, state_path, total) if self.params.get('continuedl', True) else None
+        if segments is None:
+            size = min(SEGMENT_MAX_SIZE, max(SEGMENT_MIN_SIZE, total // (connections * 4)))
+            segments = [[start, min(start + size, total) - 1, start] for start in range(0, total, size)]
+            with open(tmpfilename, 'wb') as f:
+                f.truncate(total)
+        write_json_atomic(state_path, {'total': total, 'segments': segments})
+        self.report_destination(filename)
+        
+        pending = queue.Queue()
+        for segment in segments:
+            if segment[2] <= segment[1]:
+                pending.put(segment)
+        stop = threading.Event()
+        counter_lock = threading.Lock()
+        hook_lock = threading.Lock()  # one hook call at a time, so throttling stalls every connection
+        resumed = sum(segment[2] - segment[0] for segment in segments)
+        progress = {'bytes': resumed, 'reported': 0}
+        start_time = time.time()
         
-        thumb_dir = os.path.join(DOWNLOAD_DIR, 'thumbnails')
-        Path(thumb_dir).mkdir(exist_ok=True)
+        def report(downloaded):
+            now = time.time()
+            self._hook_progress({
+                'status': 'downloading',
+                'downloaded_bytes': downloaded,
+                'total_bytes': total,
+                'tmpfilename': tmpfilename,
+                'filename': filename,
+                'eta': self.calc_eta(start_time, now, total - resumed, downloaded - resumed),
+                'speed': self.calc_speed(start_time, now, downloaded - resumed),
+                'elapsed': now - start_time,
+                'ctx_id': info_dict.get('ctx_id'),
+            }, info_dict)
+        
+        def on_data(nbytes):
+            with counter_lock:
+                progress['bytes'] += nbytes
+            if time.time() - progress['reported'] < SEGMENT_PROGRESS_INTERVAL:
+                return
+            with hook_lock:
+                if time.time() - progress['reported'] >= SEGMENT_PROGRESS_INTERVAL:
+                    progress['reported'] = time.time()
+                    report(progress['bytes'])
         
-        safe_title = sanitize_filename(title)
-        thumb_path = os.path.join(thumb_dir, f'{safe_title}.jpg')
+        def worker():
+            # Unbuffered, so checkpointed offsets never run ahead of the bytes handed to the OS
+            with open(tmpfilename, 'r+b', buffering=0) as f:
+                while not stop.is_set():
+                    try:
+                        segment = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    self.fetch_segment(info_dict, segment, f, stop, on_data)
+        
+        workers = max(1, min(connections, pending.qsize()))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='Segment') as pool:
+            futures = [pool.submit(worker) for _ in range(workers)]
+            try:
+                while True:
+                    done, running = wait(futures, timeout=SEGMENT_CHECKPOINT_INTERVAL, return_when=FIRST_EXCEPTION)
+                    for future in done:
+                        future.result()
+                    write_json_atomic(state_path, {'total': total, 'segments': segments})
+                    if not running:
+                        break
+            finally:
+                stop.set()
+                wait(futures)
+                write_json_atomic(state_path, {'total': total, 'segments': segments})
+        
+        # Progress is sampled, so make sure the hooks see the last bytes arrive
+        report(progress['bytes'])
+        self.try_remove(state_path)
+        self.try_rename(tmpfilename, filename)
+        self._hook_progress({
+            'downloaded_bytes': total,
+            'total_bytes': total,
+            'filename': filename,
+            'status': 'finished',
+            'elapsed': time.time() - start_time,
+            'ctx_id': info_dict.get('ctx_id'),
+        }, info_dict)
+        return True
+    
+    def fetch_segment(self, info_dict, segment, f, stop, on_data):
+        """Fetch the rest of one segment into its place in the file, retrying dropped connections"""
+        errors = yt_dlp.networking.exceptions
+        retries = self.params.get('retries', 10)
+        attempt = 0
+        while segment[2] <= segment[1] and not stop.is_set():
+            try:
+                response = self.ydl.urlopen(self.range_request(info_dict, segment[2], segment[1]))
+                try:
+                    if response.status != 206 or yt_dlp.utils.parse_http_range(response.headers.get('Content-Range'))[0] != segment[2]:
+                        raise RangeNotSupported()
+                    f.seek(segment[2])
+                    while segment[2] <= segment[1] and not stop.is_set():
+                        block = response.read(min(SEGMENT_BLOCK_SIZE, segment[1] - segment[2] + 1))
+                        if not block:
+                            break
+                        f.write(block)
+                        segment[2] += len(block)
+                        on_data(len(block))
+                finally:
+                    response.close()
+                if segment[2] <= segment[1] and not stop.is_set():
+                    raise errors.TransportError(f'Connection closed with {segment[1] - segment[2] + 1} bytes of the segment left')
+            except (errors.HTTPError, errors.TransportError) as err:
+                if isinstance(err, errors.HTTPError) and err.status < 500:
+                    raise
+                attempt += 1
+                # A cancelled or paused job shut this connection down; don't wait to retry it
+                job = getattr(self.ydl, 'job', None)
+                if attempt > retries or (job is not None and (job.cancelled or job.paused)):
+                    raise
+                self.report_retry(err, attempt, retries)
+                stop.wait(min(30, 2 ** attempt) * random.uniform(0.5, 1))
+
+def run_download(job):
+    """Execute a scheduled download job on the current worker thread"""
+    download_id = job.download_id
+    url = job.url
+    format_choice = job.format_choice
+    quality = job.quality
+    
+    transferred = {}  # filename -> bytes already charged to the bandwidth governor
+    measured = {'bytes': 0, 'started': None, 'last': None, 'throttled': False}  # throughput sample for the tuner
+    metrics = job.metrics
+    timeline = {'transfer_started': None, 'first_byte': False}
+    
+    def progress_hook(d):
+        """Called by yt-dlp during download to report progress"""
+        # Check cancellation and pause on every progress update
+        job.check()
         
-        if not os.path.exists(thumb_path):
-            urllib.request.urlretrieve(url, thumb_path)
-            logging.info(f"Thumbnail downloaded: {safe_title}.jpg")
+        # Remember where partial data lives so a restart can resume it
+        filename = d.get('filename')
+        if filename and filename != job.output_path:
+            job.output_path = filename
+            title = (d.get('info_dict') or {}).get('title') or job.title or ''
+            job.title = title
+            journal_update(download_id, output_path=filename, title=title)
         
-        return thumb_path
-    except Exception:
-        logging.warning(f"Thumbnail download failed for: {title}")
-        return None
-
-def format_error_message(error_str):
-    """Convert technical errors to user-friendly messages"""
-    error_lower = str(error_str).lower()
+        if d['status'] == 'downloading':
+            if filename and filename not in job.files:
+                job.files.add(filename)
+            downloaded = d.get('downloaded_bytes', 0)
+            total = d.get('total_bytes', 0) or d.get('total_bytes_estimate', 0)
+            speed = d.get('speed', 0)
+            eta = d.get('eta', 0)
+            
+            # Bytes since the last callback for this file, charged to the job's bandwidth share
+            previous = transferred.get(filename, 0)
+            transferred[filename] = downloaded or previous
+            delta = max(0, (downloaded or 0) - previous)
+            rate_limit = throttle_download(job, delta, speed)
+            
+            now = time.monotonic()
+            if measured['started'] is None:
+                measured['started'] = now
+            measured['bytes'] += delta
+            measured['last'] = now
+            # Capped transfers say nothing about what the host can do
+            measured['throttled'] = measured['throttled'] or bool(rate_limit)
+            
+            metrics['bytes'] += delta
+            metrics['peak_speed'] = max(metrics['peak_speed'], speed or 0)
+            if not timeline['first_byte'] and downloaded and timeline['transfer_started'] is not None:
+                timeline['first_byte'] = True
+                observe_phase('first_byte', time.perf_counter() - timeline['transfer_started'], job)
+            
+            if total > 0:
+                percent = (downloaded / total) * 100
+                publish_progress(download_id, {
+                    'percent': percent,
+                    'downloaded': downloaded,
+                    'total': total,
+                    'speed': speed or 0,
+                    'eta': eta or 0,
+                    'rate_limit': rate_limit,
+                    'status': 'downloading'
+                })
     
-    # Check for specific error patterns
-    error_mappings = {
-        ('cancelled', 'canceled', 'killed'): "Download cancelled by user",
-        ('http error 403', 'forbidden'): "Access denied. The video might be private, region-blocked, or require authentication.",
-        ('http error 404', 'not found'): "Video not found. The URL might be incorrect or the video was removed.",
-        ('http error 429', 'too many requests', 'rate limit'): "Too many requests. The website is rate-limiting. Please wait and try again.",
-        ('private video',): "This is a private video. You need proper access permissions.",
-        ('sign in', 'login', 'authentication'): "This video requires login. Please add credentials in Settings.",
-        ('copyright',): "This video is copyright protected and cannot be downloaded.",
-        ('unavailable',): "Video unavailable. It might be deleted, private, or region-restricted.",
-        ('network', 'connection'): "Network error. Check your internet connection.",
-        ('timeout', 'timed out'): "Connection timeout. The server took too long to respond.",
-        ('format not available',): "Requested format not available. Try a different quality.",
-        ('ffmpeg', 'ffprobe'): "FFmpeg error. The video processing failed.",
-    }
+    # Settings are read per attempt so retry policy and paths follow live changes
+    config = load_config()
+    attempt = job.attempt
     
-    for keywords, message in error_mappings.items():
-        if any(keyword in error_lower for keyword in keywords):
-            return message
+    # Check if cancelled or paused before starting attempt
+    if is_cancelled(download_id):
+        logging.info(f"Download {download_id} cancelled before attempt {attempt + 1}")
+        cleanup_download(download_id, 'cancelled')
+        return
+    if is_paused(download_id):
+        park_download(download_id)
+        return
+    
+    host = job_host(job)
+    job.transfer_settings = settings = choose_transfer_settings(host)
     
-    # Generic error with truncated message
-    return f"Download failed: {str(error_str)[:150]}"
-
-def is_cancelled(download_id):
-    """Check if download has been cancelled"""
-    with downloads_lock:
-        if download_id not in active_downloads:
-            return True
-        return active_downloads[download_id].get('cancelled', False)
-
-# Exposed Eel functions
-@eel.expose
-def get_video_info(url):
-    """Fetch video metadata without downloading"""
     try:
-        config = load_config()
+        download_path = config.get('download_path', DOWNLOAD_DIR)
+        Path(download_path).mkdir(parents=True, exist_ok=True)
         
+        # Configure yt-dlp options
         ydl_opts = {
+            'format': f'bestvideo[height<={quality}][ext=mp4]+bestaudio[ext=m4a]/best[height<={quality}]',
+            'outtmpl': os.path.join(download_path, '%(title)s.%(ext)s'),
+            'progress_hooks': [progress_hook],
+            'merge_output_format': 'mp4',
+            'concurrent_fragment_downloads': settings['fragments'],
+            'http_chunk_size': settings['chunk_size'],
+            'continuedl': True,  # resume .part files and fragment state left by earlier attempts or runs
+            'nopart': False,
+            'retries': 10,
+            'fragment_retries': 10,
+            'skip_unavailable_fragments': True,
+            'socket_timeout': settings['socket_timeout'],
+            'segmented_connections': config.get('segmented_connections', DEFAULT_SEGMENTED_CONNECTIONS),
             'quiet': True,
             'no_warnings': True,
-            'extract_flat': False,
-            'socket_timeout': 30,
-            'no_check_certificate': False,
+            'prefer_ffmpeg': True,
+            'noprogress': False,
+            'restrictfilenames': False,
         }
         
         # Set FFmpeg location for bundled app
@@ -196,352 +2757,717 @@ def get_video_info(url):
         if os.path.exists(ffmpeg_path):
             ydl_opts['ffmpeg_location'] = ffmpeg_path
         
-        # Add credentials if available
+        # Exact stream chosen by the format ranking, with the height-based spec as fallback
+        if format_choice != 'audio' and job.format_id:
+            ydl_opts['format'] = f"{job.format_id}/{ydl_opts['format']}"
+        
+        # Audio-only configuration; the mp3 conversion happens in the post-processing stage
+        if format_choice == 'audio':
+            ydl_opts['format'] = 'bestaudio/best'
+        
+        # Add credentials if configured
         if config.get('credentials', {}).get('username'):
             ydl_opts['username'] = config['credentials']['username']
             ydl_opts['password'] = config['credentials']['password']
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            
-            video_id = info.get('id', 'unknown')
-            thumbnail_url = info.get('thumbnail', '')
-            
-            # Extract available formats
-            formats = []
-            format_dict = {}
-            
-            # First pass: Look for combined video+audio formats
-            for f in info.get('formats', []):
-                if f.get('vcodec') != 'none' and f.get('acodec') != 'none':
-                    resolution = f.get('height', 0)
-                    if resolution >= 720:
-                        key = f"{resolution}p"
-                        if key not in format_dict:
-                            format_dict[key] = {
-                                'format_id': f['format_id'],
-                                'resolution': key,
-                                'ext': f.get('ext', 'mp4'),
-                                'filesize': f.get('filesize', 0) or f.get('filesize_approx', 0),
-                                'fps': f.get('fps', 30),
-                                'vcodec': f.get('vcodec', 'unknown'),
-                                'acodec': f.get('acodec', 'unknown')
-                            }
-            
-            # Second pass: If no combined formats, estimate from separate streams
-            if not format_dict:
-                video_formats = {}
-                best_audio_size = 0
-                
-                for f in info.get('formats', []):
-                    resolution = f.get('height', 0)
-                    
-                    # Collect video streams
-                    if f.get('vcodec') != 'none' and resolution >= 720:
-                        key = f"{resolution}p"
-                        if key not in video_formats:
-                            video_formats[key] = {
-                                'format_id': f['format_id'],
-                                'resolution': key,
-                                'ext': f.get('ext', 'mp4'),
-                                'filesize': f.get('filesize', 0) or f.get('filesize_approx', 0),
-                                'fps': f.get('fps', 30),
-                                'vcodec': f.get('vcodec', 'unknown'),
-                                'acodec': 'merged'
-                            }
-                    
-                    # Find best audio stream size
-                    elif f.get('acodec') != 'none' and f.get('vcodec') == 'none':
-                        fsize = f.get('filesize', 0) or f.get('filesize_approx', 0)
-                        if fsize > best_audio_size:
-                            best_audio_size = fsize
-                
-                # Combine video + audio sizes
-                for key, fmt in video_formats.items():
-                    fmt['filesize'] = fmt.get('filesize', 0) + best_audio_size
-                    format_dict[key] = fmt
-            
-            # Sort formats by resolution
-            formats = sorted(format_dict.values(), key=lambda x: int(x['resolution'][:-1]))
-            
-            logging.info(f"Fetched info for: {info.get('title', 'Unknown')}")
-            
-            return {
-                'success': True,
-                'title': info.get('title', 'Unknown'),
-                'thumbnail': thumbnail_url,
-                'duration': info.get('duration', 0),
-                'uploader': info.get('uploader', 'Unknown'),
-                'description': info.get('description', '')[:300],
-                'formats': formats,
-                'url': url,
-                'video_id': video_id,
-                'view_count': info.get('view_count', 0),
-                'upload_date': info.get('upload_date', '')
-            }
-            
+        if job.output_path and os.path.exists(job.output_path + '.part'):
+            logging.info(f"Download {download_id} resuming partial file {job.output_path}.part")
+        
+        # Execute download, reusing the info resolved by get_video_info when still fresh
+        cached_info = get_cached_video_info(url)
+        
+        # An earlier download of this video and rendition makes the transfer unnecessary
+        if reuse_existing_download(job, info_archive_id(cached_info) if cached_info else url_archive_id(url)):
+            return
+        
+        # With extraction processes the info is resolved off this process's GIL and cached for retries
+        pool = get_extraction_pool() if cached_info is None else None
+        if pool is not None:
+            with timed_phase('metadata', job):
+                cached_info = run_extraction(pool, url, base_ydl_options(config), job, lambda line: publish_progress(
+                    download_id, {'status': 'extracting', 'message': line.split('] ', 1)[-1]}))
+            cache_video_info(url, cached_info)
+            if reuse_existing_download(job, info_archive_id(cached_info)):
+                return
+        
+        register_bandwidth_job(download_id, host)
+        try:
+            load_yt_dlp()
+            with running_job(job), JobYDL(ydl_opts) as ydl:
+                ydl.job = job
+                logging.info(f"Starting download {download_id} (attempt {attempt + 1}, "
+                             f"{settings['fragments']} fragments, {settings['chunk_size'] // 1024}KB chunks)")
+                if cached_info is None:
+                    # Same as extract_info(download=True), split so extraction is timed on its own
+                    with timed_phase('metadata', job):
+                        cached_info = ydl.extract_info(url, download=False, process=False)
+                    # The URL alone does not always give the id (redirects, short links)
+                    if reuse_existing_download(job, info_archive_id(cached_info)):
+                        return
+                timeline['transfer_started'] = time.perf_counter()
+                with timed_phase('transfer', job):
+                    info = ydl.process_ie_result(cached_info, download=True)
+        finally:
+            unregister_bandwidth_job(download_id)
+        record_host_success(host)
+        if measured['started'] is not None and not measured['throttled']:
+            record_transfer_sample(host, settings, measured['bytes'], measured['last'] - measured['started'])
+        
+        # Check if cancelled after download completes
+        if is_cancelled(download_id):
+            logging.info(f"Download {download_id} cancelled after completion")
+            cleanup_download(download_id, 'cancelled')
+            return
+        
+        # Bytes are on disk: free this download slot and leave FFmpeg work to its own pool
+        job.postprocess_queued_at = time.perf_counter()
+        queue_postprocessing(job, info, ydl.deferred)
+        
     except Exception as e:
-        logging.exception(f"Failed to fetch video info for: {url}")
-        error_msg = format_error_message(str(e))
-        return {
-            'success': False,
-            'error': error_msg,
+        error_str = str(e)
+        
+        # Check if it was a cancellation
+        if 'CANCELLED' in error_str or is_cancelled(download_id):
+            logging.info(f"Download {download_id} cancelled during execution")
+            cleanup_download(download_id, 'cancelled')
+            return
+        
+        # Paused jobs keep their partial files and go back to the queue on resume; a pause
+        # that was resumed before the interrupted transfer unwound still ends this run
+        if 'PAUSED' in error_str or is_paused(download_id) or job.pause_requested:
+            park_download(download_id)
+            return
+        
+        handle_download_failure(job, e, config)
+
+def finish_download(job, info):
+    """Record a fully processed download in history and report it to the UI"""
+    download_id = job.download_id
+    
+    # Thumbnail is fetched by the thumbnail pipeline, off this worker
+    thumbnail_url = info.get('thumbnail', '')
+    request_thumbnail(thumbnail_url, info.get('id'))
+    
+    # Prepare info for history
+    info['format_selected'] = f"{job.quality}p {job.format_choice}"
+    info['filesize'] = info.get('filesize', 0) or info.get('filesize_approx', 0)
+    
+    # Save to history; an open history view inserts the entry without reloading
+    with timed_phase('history', job):
+        entry = add_to_history(info, thumbnail_url)
+        index_download(job, info)
+    if entry is not None:
+        push_event('history_added', present_history_entry(entry))
+    
+    # Notify completion
+    publish_progress(download_id, {
+        'percent': 100,
+        'status': 'completed',
+        'message': '✓ Download completed successfully!'
+    })
+    
+    # Cleanup
+    forget_job(download_id, 'completed')
+    
+    logging.info(f"Download {download_id} completed successfully")
+
+# Post-processing stage
+class DeferredPostProcessingMixin:
+    """YoutubeDL behaviour that stops once a file is downloaded and records the post-processing still owed
+    
+    Mixed into YoutubeDL as part of JobYDL by load_yt_dlp(). Each entry in deferred is the (filename, info, files_to_move) triple that
+    YoutubeDL.post_process would have run the merger, fixups and configured
+    postprocessors on.
+    """
+    
+    def __init__(self, params=None, auto_init=True):
+        super().__init__(params, auto_init)
+        self.deferred = []
+    
+    def post_process(self, filename, info, files_to_move=None):
+        info['filepath'] = filename
+        # Snapshot: process_video_result strips keys shared with the parent info once we return
+        self.deferred.append((filename, dict(info), files_to_move))
+        return info
+
+def postprocessing_options(job, threads):
+    """yt-dlp options for the FFmpeg stage of a job"""
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'prefer_ffmpeg': True,
+        'keepvideo': False,
+        'merge_output_format': 'mp4',
+        'postprocessor_args': {'default': ['-threads', str(threads)]},
+    }
+    
+    # Set FFmpeg location for bundled app
+    ffmpeg_path = get_resource_path('ffmpeg')
+    if os.path.exists(ffmpeg_path):
+        ydl_opts['ffmpeg_location'] = ffmpeg_path
+    
+    if job.format_choice == 'audio':
+        ydl_opts['postprocessors'] = [{
+            'key': 'FFmpegExtractAudio',
+            'preferredcodec': 'mp3',
+            'preferredquality': '192',
+        }]
+    return ydl_opts
+
+def queue_postprocessing(job, info, deferred):
+    """Hand a downloaded job to the post-processing pool"""
+    download_id = job.download_id
+    with downloads_lock:
+        job.state = 'queued_processing'
+    journal_update(download_id, state='queued_processing')
+    publish_progress(download_id, {
+        'percent': 100,
+        'status': 'queued_processing',
+        'message': 'Queued for processing...'
+    })
+    
+    with postprocess_lock:
+        while len(postprocess_workers) < POSTPROCESS_WORKERS:
+            worker = threading.Thread(
+                target=postprocess_worker, daemon=True,
+                name=f"PostProcess-{len(postprocess_workers) + 1}"
+            )
+            postprocess_workers.append(worker)
+            worker.start()
+    postprocess_queue.put((job, info, deferred))
+
+def postprocess_worker():
+    """Run queued FFmpeg work one job at a time"""
+    while True:
+        job, info, deferred = postprocess_queue.get()
+        try:
+            with running_job(job):
+                run_postprocessing(job, info, deferred)
+        except Exception:
+            logging.exception(f"Unhandled error post-processing {job.download_id}")
+            cleanup_download(job.download_id, 'error')
+
+def run_postprocessing(job, info, deferred):
+    """Merge, fix up and convert a job's downloaded files, then complete it"""
+    global postprocess_running
+    download_id = job.download_id
+    with downloads_lock:
+        # Cancelled while queued: cancel_download already cleaned up
+        if job.cancelled or active_downloads.get(download_id) is not job:
+            return
+        job.state = 'processing'
+    observe_phase('postprocess_wait', time.perf_counter() - (job.postprocess_queued_at or time.perf_counter()), job)
+    journal_update(download_id, state='processing')
+    publish_progress(download_id, {
+        'percent': 100,
+        'status': 'processing',
+        'message': 'Converting to MP3...' if job.format_choice == 'audio' else 'Merging video and audio streams...'
+    })
+    
+    # Split the cores between the jobs processing right now instead of each asking for all of them
+    with postprocess_lock:
+        postprocess_running += 1
+        threads = max(1, POSTPROCESS_WORKERS // postprocess_running)
+    
+    # Outputs a killed FFmpeg run would leave half written, so cancelling can remove them
+    utils = load_yt_dlp().utils
+    for filename, _, _ in deferred:
+        outputs = [utils.prepend_extension(filename, 'temp')]
+        if job.format_choice == 'audio':
+            outputs.append(utils.replace_extension(filename, 'mp3'))
+        job.files.update(output for output in outputs if not os.path.exists(output))
+    
+    try:
+        with timed_phase('postprocess', job), running_job(job), load_yt_dlp().YoutubeDL(postprocessing_options(job, threads)) as ydl:
+            for filename, file_info, files_to_move in deferred:
+                # The merger and fixups were created by the download instance; run them with ours
+                for pp in file_info.get('__postprocessors') or ():
+                    pp.set_downloader(ydl)
+                processed = ydl.post_process(filename, file_info, files_to_move)
+                info['filepath'] = processed.get('filepath') or filename
+    except Exception as e:
+        if job.cancelled:
+            # cancel_download killed FFmpeg
+            logging.info(f"Download {download_id} cancelled during post-processing")
+            cleanup_download(download_id, 'cancelled')
+            return
+        logging.exception(f"Post-processing failed for {download_id}")
+        publish_progress(download_id, {
+            'status': 'error',
+            'message': format_error_message(str(e)),
             'technical_error': str(e)
-        }
+        })
+        forget_job(download_id, 'error')
+        return
+    finally:
+        with postprocess_lock:
+            postprocess_running -= 1
+    
+    if is_cancelled(download_id):
+        logging.info(f"Download {download_id} cancelled during post-processing")
+        cleanup_download(download_id, 'cancelled')
+        return
+    
+    finish_download(job, info)
 
-@eel.expose
-def download_video(url, format_choice, quality, download_id):
-    """Start video download in background thread"""
+def handle_download_failure(job, error, config):
+    """Classify a failed attempt and either schedule a backed-off retry or fail the job"""
+    download_id = job.download_id
+    attempt = job.attempt
+    error_str = str(error)
+    error_msg = format_error_message(error_str)
+    kind = classify_error(error)
+    host = job_host(job)
+    retry_after = retry_after_seconds(error)
+    logging.error(f"Download {download_id} attempt {attempt + 1} failed ({kind}): {error_str}")
     
-    def progress_hook(d):
-        """Called by yt-dlp during download to report progress"""
-        # Check cancellation on every progress update
-        if is_cancelled(download_id):
-            raise yt_dlp.utils.DownloadError("CANCELLED")
-        
-        if d['status'] == 'downloading':
-            downloaded = d.get('downloaded_bytes', 0)
-            total = d.get('total_bytes', 0) or d.get('total_bytes_estimate', 0)
-            speed = d.get('speed', 0)
-            eta = d.get('eta', 0)
-            
-            if total > 0:
-                percent = (downloaded / total) * 100
-                try:
-                    eel.update_progress(download_id, {
-                        'percent': percent,
-                        'downloaded': downloaded,
-                        'total': total,
-                        'speed': speed or 0,
-                        'eta': eta or 0,
-                        'status': 'downloading'
-                    })
-                except:
-                    pass
-                    
-        elif d['status'] == 'finished':
+    record_host_failure(host, kind, retry_after)
+    record_transfer_failure(host, job.transfer_settings, error, kind)
+    
+    # Stream URLs may have expired or been revoked; re-extract on the next attempt
+    invalidate_video_info(job.url)
+    
+    max_retries = config.get('max_retries', 5)
+    if kind == ERROR_RATE_LIMITED:
+        # Throttling is the site's state, not this job's fault: it does not use up retries
+        job.rate_limit_hits += 1
+        can_retry = job.rate_limit_hits <= MAX_RATE_LIMIT_RETRIES
+    else:
+        can_retry = kind == ERROR_TRANSIENT and attempt < max_retries - 1
+    
+    if not can_retry:
+        publish_progress(download_id, {
+            'status': 'error',
+            'message': error_msg,
+            'technical_error': error_str,
+            'retry_count': attempt + 1
+        })
+        forget_job(download_id, 'error')
+        logging.error(f"Download {download_id} failed after {attempt + 1} attempts")
+        return
+    
+    if kind == ERROR_TRANSIENT:
+        job.attempt = attempt + 1
+        delay = backoff_delay(job.attempt, config)
+    else:
+        delay = retry_after or backoff_delay(job.rate_limit_hits, config)
+    delay = max(delay, circuit_blocked_until(host) - time.time())
+    count_retry(job, kind)
+    
+    publish_progress(download_id, {
+        'status': 'retrying',
+        'message': (f"Rate limited by {host}, retrying in {int(delay)}s..." if kind == ERROR_RATE_LIMITED
+                    else f"Retry attempt {job.attempt + 1} of {max_retries} in {int(delay)}s..."),
+        'retry_count': job.attempt + 1
+    })
+    schedule_retry(job, time.time() + delay)
+
+@expose
+def download_video(url, format_choice, quality, download_id, format_id=None, priority=0, title=None):
+    """Queue a video download for the worker pool"""
+    job = DownloadJob(download_id, url, format_choice, quality, next(job_sequence),
+                      title=title, format_id=format_id, priority=priority)
+    
+    journal_add(job)
+    with downloads_lock:
+        active_downloads[download_id] = job
+        enqueue_job(job)
+    
+    ensure_download_workers()
+    logging.info(f"Download {download_id} queued (priority {job.priority})")
+    
+    publish_progress(download_id, {
+        'status': 'queued',
+        'message': 'Waiting for a free download slot...'
+    })
+    
+    return {'success': True, 'download_id': download_id}
+
+# Batch ingestion
+def get_metadata_executor():
+    """Shared pool that resolves playlist entries ahead of the download workers"""
+    global metadata_executor
+    with metadata_executor_lock:
+        if metadata_executor is None:
             try:
-                eel.update_progress(download_id, {
-                    'percent': 100,
-                    'status': 'processing',
-                    'message': 'Merging video and audio streams...'
-                })
-            except:
-                pass
-    
-    def download_thread():
-        """Background thread for download execution"""
-        config = load_config()
-        max_retries = config.get('max_retries', 5)
-        retry_delay = config.get('retry_delay', 3)
-        
-        for attempt in range(max_retries):
-            # Check if cancelled before starting attempt
-            if is_cancelled(download_id):
-                logging.info(f"Download {download_id} cancelled before attempt {attempt + 1}")
-                cleanup_download(download_id, 'cancelled')
-                return
+                workers = max(1, int(load_config().get('metadata_workers', DEFAULT_METADATA_WORKERS)))
+            except (TypeError, ValueError):
+                workers = DEFAULT_METADATA_WORKERS
+            metadata_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Metadata")
+        return metadata_executor
+
+def prefetch_video_info(url, download_id):
+    """Resolve an entry into the metadata cache unless its job already finished or started"""
+    with downloads_lock:
+        job = active_downloads.get(download_id)
+        if job is None or job.state != 'queued':
+            return
+    # Already downloaded: the worker will skip it without needing metadata
+    if existing_download(job, url_archive_id(url)) is not None:
+        return
+    try:
+        resolve_video_info(url)
+    except Exception as e:
+        # The download attempt will extract again and report the error properly
+        logging.warning(f"Metadata prefetch failed for {url}: {e}")
+
+def iter_batch_entries(ydl, url, depth=0):
+    """Yield (url, title) for every video behind a URL, expanding playlists lazily"""
+    info = ydl.extract_info(url, download=False, process=False)
+    kind = info.get('_type', 'video')
+    
+    if kind == 'video':
+        # Single video: the extraction is already done, so keep it for the download
+        info = ydl.process_ie_result(info, download=False)
+        cache_video_info(url, info)
+        yield url, info.get('title', 'Unknown')
+    
+    elif kind in ('url', 'url_transparent'):
+        # Redirect (e.g. channel -> uploads tab): follow it a bounded number of times
+        if depth < MAX_PLAYLIST_REDIRECTS:
+            yield from iter_batch_entries(ydl, info['url'], depth + 1)
+        else:
+            yield info['url'], info.get('title') or info['url']
+    
+    else:
+        for entry in info.get('entries') or []:
+            if not entry:
+                continue
+            entry_url = entry.get('webpage_url') or entry.get('url')
+            if not entry_url:
+                continue
+            title = entry.get('title') or entry_url
             
-            try:
-                # Show retry message if not first attempt
-                if attempt > 0:
-                    try:
-                        eel.update_progress(download_id, {
-                            'status': 'retrying',
-                            'message': f'Retry attempt {attempt + 1} of {max_retries}...',
-                            'retry_count': attempt + 1
-                        })
-                    except:
-                        pass
-                    time.sleep(retry_delay)
-                
-                download_path = config.get('download_path', DOWNLOAD_DIR)
-                Path(download_path).mkdir(parents=True, exist_ok=True)
-                
-                # Configure yt-dlp options
-                ydl_opts = {
-                    'format': f'bestvideo[height<={quality}][ext=mp4]+bestaudio[ext=m4a]/best[height<={quality}]',
-                    'outtmpl': os.path.join(download_path, '%(title)s.%(ext)s'),
-                    'progress_hooks': [progress_hook],
-                    'merge_output_format': 'mp4',
-                    'concurrent_fragment_downloads': 8,
-                    'http_chunk_size': 524288,  # 512KB chunks for faster cancellation response
-                    'retries': 10,
-                    'fragment_retries': 10,
-                    'skip_unavailable_fragments': True,
-                    'socket_timeout': 5,
-                    'quiet': True,
-                    'no_warnings': True,
-                    'prefer_ffmpeg': True,
-                    'keepvideo': False,
-                    'postprocessor_args': ['-threads', '4'],
-                    'noprogress': False,
-                    'restrictfilenames': False,
-                }
-                
-                # Set FFmpeg location for bundled app
-                ffmpeg_path = get_resource_path('ffmpeg')
-                if os.path.exists(ffmpeg_path):
-                    ydl_opts['ffmpeg_location'] = ffmpeg_path
-                
-                # Audio-only configuration
-                if format_choice == 'audio':
-                    ydl_opts['format'] = 'bestaudio/best'
-                    ydl_opts['postprocessors'] = [{
-                        'key': 'FFmpegExtractAudio',
-                        'preferredcodec': 'mp3',
-                        'preferredquality': '192',
-                    }]
-                
-                # Add credentials if configured
-                if config.get('credentials', {}).get('username'):
-                    ydl_opts['username'] = config['credentials']['username']
-                    ydl_opts['password'] = config['credentials']['password']
-                
-                # Execute download
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    logging.info(f"Starting download {download_id} (attempt {attempt + 1})")
-                    info = ydl.extract_info(url, download=True)
-                
-                # Check if cancelled after download completes
-                if is_cancelled(download_id):
-                    logging.info(f"Download {download_id} cancelled after completion")
-                    cleanup_download(download_id, 'cancelled')
-                    return
-                
-                # Download thumbnail
-                title = info.get('title', 'Unknown')
-                thumbnail_url = info.get('thumbnail', '')
-                if thumbnail_url:
-                    download_thumbnail(thumbnail_url, title)
-                
-                # Prepare info for history
-                info['format_selected'] = f"{quality}p {format_choice}"
-                info['filesize'] = info.get('filesize', 0) or info.get('filesize_approx', 0)
-                
-                # Save to history
-                add_to_history(info, thumbnail_url)
-                
-                # Notify completion
+            if entry.get('_type') == 'playlist':
+                if depth < MAX_PLAYLIST_REDIRECTS:
+                    yield from iter_batch_entries(ydl, entry_url, depth + 1)
+                continue
+            
+            if (entry.get('_type') in ('url', 'url_transparent') and depth < MAX_PLAYLIST_REDIRECTS
+                    and not is_single_video_url(ydl, entry_url, entry.get('ie_key'))):
+                # Flat entry that may be a nested playlist or channel tab: extract it to find out
+                expanded = False
                 try:
-                    eel.update_progress(download_id, {
-                        'percent': 100,
-                        'status': 'completed',
-                        'message': '✓ Download completed successfully!'
-                    })
-                except:
-                    pass
-                
-                # Cleanup
-                with downloads_lock:
-                    active_downloads.pop(download_id, None)
-                
-                logging.info(f"Download {download_id} completed successfully")
-                return
-                    
-            except Exception as e:
-                error_str = str(e)
-                
-                # Check if it was a cancellation
-                if 'CANCELLED' in error_str or is_cancelled(download_id):
-                    logging.info(f"Download {download_id} cancelled during execution")
-                    cleanup_download(download_id, 'cancelled')
-                    return
-                
-                error_msg = format_error_message(error_str)
-                logging.error(f"Download {download_id} attempt {attempt + 1} failed: {error_str}")
-                
-                # Retry or fail
-                if attempt < max_retries - 1:
+                    for item in iter_batch_entries(ydl, entry_url, depth + 1):
+                        expanded = True
+                        yield item
                     continue
-                else:
-                    # Max retries reached
-                    try:
-                        eel.update_progress(download_id, {
-                            'status': 'error',
-                            'message': error_msg,
-                            'technical_error': error_str,
-                            'retry_count': attempt + 1
-                        })
-                    except:
-                        pass
-                    
-                    with downloads_lock:
-                        active_downloads.pop(download_id, None)
-                    
-                    logging.error(f"Download {download_id} failed after {attempt + 1} attempts")
-                    return
+                except Exception as e:
+                    logging.warning(f"Failed to expand playlist entry {entry_url}: {e}")
+                    if expanded:
+                        continue
+            
+            # Videos, and entries that failed to expand, are queued; the download reports any error
+            yield entry_url, title
+
+def is_single_video_url(ydl, url, ie_key=None):
+    """Whether the extractor behind a flat playlist entry is known to return a single video"""
+    try:
+        if ie_key:
+            ie = ydl.get_info_extractor(ie_key)
+            if ie.suitable(url):
+                return ie.is_single_video(url) is True
+        for ie in load_yt_dlp().extractor.gen_extractor_classes():
+            if ie.suitable(url):
+                return ie.is_single_video(url) is True
+    except Exception:
+        logging.exception(f"Failed to match an extractor for: {url}")
+    return False
+
+def ingest_batch(urls, format_choice, quality, batch_id):
+    """Expand a batch of URLs and queue each video the moment it is discovered"""
+    ydl_opts = base_ydl_options(load_config())
+    ydl_opts.update({
+        'extract_flat': 'in_playlist',
+        'lazy_playlist': True,
+    })
     
-    # Start download thread
-    thread = threading.Thread(target=download_thread, daemon=True, name=f"Download-{download_id}")
+    executor = get_metadata_executor()
+    count = 0
+    with load_yt_dlp().YoutubeDL(ydl_opts) as ydl:
+        for url in urls:
+            try:
+                for entry_url, title in iter_batch_entries(ydl, url):
+                    count += 1
+                    download_id = f"{batch_id}_{count}"
+                    push_event('download_added', download_id, {'title': title, 'url': entry_url})
+                    download_video(entry_url, format_choice, quality, download_id, title=title)
+                    executor.submit(prefetch_video_info, entry_url, download_id)
+            except Exception as e:
+                logging.exception(f"Failed to expand batch URL: {url}")
+                push_event('batch_error', batch_id, {
+                    'url': url,
+                    'message': format_error_message(str(e)),
+                    'technical_error': str(e)
+                })
     
-    with downloads_lock:
-        active_downloads[download_id] = {'thread': thread, 'cancelled': False}
+    logging.info(f"Batch {batch_id} queued {count} downloads")
+    push_event('batch_finished', batch_id, {'count': count})
+
+@expose
+def download_batch(urls, format_choice, quality, batch_id):
+    """Queue every video behind a list of URLs, playlists and channels"""
+    if isinstance(urls, str):
+        urls = urls.split()
+    urls = [u.strip() for u in urls if u and u.strip()]
+    if not urls:
+        return {'success': False, 'error': 'No URLs given'}
     
+    thread = threading.Thread(
+        target=ingest_batch, args=(urls, format_choice, quality, batch_id),
+        daemon=True, name=f"Batch-{batch_id}"
+    )
     thread.start()
-    logging.info(f"Download thread started for {download_id}")
-    
-    return {'success': True, 'download_id': download_id}
+    logging.info(f"Batch {batch_id} started with {len(urls)} URL(s)")
+    return {'success': True, 'batch_id': batch_id}
+
+def forget_job(download_id, result):
+    """Drop a job that reached a final state from memory and from the journal; returns the job"""
+    with downloads_lock:
+        job = active_downloads.pop(download_id, None)
+    journal_remove(download_id)
+    if job is not None:
+        finalize_job_metrics(job, result)
+    return job
 
 def cleanup_download(download_id, status='cancelled'):
     """Clean up download and notify UI"""
+    job = forget_job(download_id, status)
+    if job is not None and status == 'cancelled':
+        remove_partial_files(job)
+    
+    publish_progress(download_id, {
+        'status': status,
+        'message': 'Download cancelled by user' if status == 'cancelled' else 'Download stopped'
+    })
+
+def requeue_job(job):
+    """Put a paused or parked job back into the queue; call with downloads_lock held"""
+    job.state = 'queued'
+    job.queued_at = time.time()
+    enqueue_job(job)
+
+def announce_requeued(download_id):
+    """Journal and report a job that went back into the queue"""
+    journal_update(download_id, state='queued')
+    ensure_download_workers()
+    publish_progress(download_id, {
+        'status': 'queued',
+        'message': 'Waiting for a free download slot...'
+    })
+
+def park_download(download_id):
+    """Move a running job into the paused state, keeping partial data
+    
+    A job resumed while its worker was still unwinding the paused transfer is
+    queued again instead, since resume_download left that to this call.
+    """
     with downloads_lock:
-        active_downloads.pop(download_id, None)
+        job = active_downloads.get(download_id)
+        if job is None:
+            return
+        resumed = not job.paused
+        if resumed:
+            requeue_job(job)
+        else:
+            job.state = 'paused'
     
-    try:
-        eel.update_progress(download_id, {
-            'status': status,
-            'message': 'Download cancelled by user' if status == 'cancelled' else 'Download stopped'
-        })
-    except:
-        pass
+    if resumed:
+        logging.info(f"Download {download_id} was resumed while pausing, queued again")
+        announce_requeued(download_id)
+        return
+    
+    journal_update(download_id, state='paused')
+    logging.info(f"Download {download_id} paused")
+    publish_progress(download_id, {
+        'status': 'paused',
+        'message': 'Paused'
+    })
+
+def restore_jobs():
+    """Re-enqueue jobs left unfinished by a previous run; partial files are resumed"""
+    global job_sequence
+    rows = load_journal()
+    if not rows:
+        return
+    
+    job_sequence = itertools.count(max(row['seq'] for row in rows) + 1)
+    with downloads_lock:
+        for row in rows:
+            paused = row['state'] == 'paused'
+            job = DownloadJob(row['download_id'], row['url'], row['format_choice'], row['quality'], row['seq'],
+                              title=row['title'] or None, format_id=row['format_id'], priority=row['priority'],
+                              state='paused' if paused else 'queued', output_path=row['output_path'] or None,
+                              paused=paused)
+            active_downloads[job.download_id] = job
+            if not paused:
+                enqueue_job(job)
+    
+    for row in rows:
+        if row['state'] != 'paused':
+            journal_update(row['download_id'], state='queued')
+    
+    ensure_download_workers()
+    logging.info(f"Restored {len(rows)} unfinished download(s) from the journal")
 
-@eel.expose
+@expose
 def cancel_download(download_id):
     """Cancel an active download"""
     with downloads_lock:
-        if download_id in active_downloads:
-            # Mark as cancelled
-            active_downloads[download_id]['cancelled'] = True
+        job = active_downloads.get(download_id)
+        if job is not None:
+            # Mark as cancelled and cut off its open connections and FFmpeg runs
+            job.cancel()
             logging.info(f"Download {download_id} marked for cancellation")
-            
-            try:
-                eel.update_progress(download_id, {
-                    'status': 'cancelling',
-                    'message': 'Cancelling download...'
-                })
-            except:
-                pass
-            
-            return {'success': True}
+            # Jobs without a worker are dropped right away
+            waiting = job.state not in ('running', 'processing')
         else:
             logging.warning(f"Cancel requested for unknown download: {download_id}")
             return {'success': False, 'error': 'Download not found'}
+    
+    if waiting:
+        cleanup_download(download_id, 'cancelled')
+        return {'success': True}
+    
+    publish_progress(download_id, {
+        'status': 'cancelling',
+        'message': 'Cancelling download...'
+    })
+    
+    return {'success': True}
+
+@expose
+def pause_download(download_id):
+    """Pause a queued or running download"""
+    with downloads_lock:
+        job = active_downloads.get(download_id)
+        if job is None or job.state == 'paused':
+            return {'success': False, 'error': 'Download not found'}
+        if job.state in ('queued_processing', 'processing'):
+            return {'success': False, 'error': 'Download already finished transferring'}
+        job.pause()
+        # A running job is parked by its worker once its interrupted transfer returns
+        waiting = job.state == 'queued'
+        if waiting:
+            job.state = 'paused'
+    
+    if waiting:
+        park_download(download_id)
+    else:
+        logging.info(f"Download {download_id} marked for pause")
+    return {'success': True}
+
+@expose
+def resume_download(download_id):
+    """Put a paused download back into the queue"""
+    with downloads_lock:
+        job = active_downloads.get(download_id)
+        if job is None or not job.paused:
+            return {'success': False, 'error': 'Download not paused'}
+        job.resume()
+        # Not parked yet: the worker is still unwinding the paused transfer, and
+        # park_download queues the job again once it sees the pause was lifted
+        parked = job.state == 'paused'
+        if parked:
+            requeue_job(job)
+    
+    logging.info(f"Download {download_id} resumed")
+    if parked:
+        announce_requeued(download_id)
+    return {'success': True}
+
+@expose
+def set_download_priority(download_id, priority):
+    """Change the priority of a queued job (lower runs first)"""
+    with downloads_lock:
+        job = active_downloads.get(download_id)
+        if job is None:
+            return {'success': False, 'error': 'Download not found'}
+        job.priority = int(priority)
+        if job.state == 'queued':
+            enqueue_job(job)
+    journal_update(download_id, priority=int(priority))
+    return {'success': True}
 
-@eel.expose
-def get_history():
-    """Get download history"""
-    return load_history()
+@expose
+def reorder_downloads(download_ids):
+    """Run queued jobs in the given order, ahead of unlisted ones"""
+    changed = []
+    with downloads_lock:
+        base = min([j.priority for j in active_downloads.values()] + [0]) - len(download_ids)
+        for position, download_id in enumerate(download_ids):
+            job = active_downloads.get(download_id)
+            if job is None:
+                continue
+            job.priority = base + position
+            changed.append((download_id, job.priority))
+            if job.state == 'queued':
+                enqueue_job(job)
+    for download_id, priority in changed:
+        journal_update(download_id, priority=priority)
+    return {'success': True}
+
+@expose
+def get_download_queue():
+    """List known jobs in scheduling order"""
+    with downloads_lock:
+        jobs = sorted(active_downloads.values(), key=lambda j: (j.priority, j.seq))
+        return [{
+            'download_id': j.download_id,
+            'url': j.url,
+            'title': j.title or j.url,
+            'state': j.state,
+            'priority': j.priority
+        } for j in jobs]
 
-@eel.expose
+@expose
+def get_history(offset=0, limit=100, search='', max_id=None):
+    """Get a page of download history, pointing thumbnails at the local cache
+    
+    With max_id, only entries up to that id are paged through, so offsets do
+    not shift when downloads finish while the UI is scrolling.
+    """
+    return [present_history_entry(item) for item in load_history(offset, limit, search, max_id)]
+
+@expose
+def get_history_count(search='', max_id=None):
+    """Get the number of history entries matching a search"""
+    return count_history(search, max_id)
+
+@expose
 def clear_history():
     """Clear all download history"""
-    save_history([])
+    delete_all_history()
     logging.info("Download history cleared")
     return {'success': True}
 
-@eel.expose
+@expose
 def get_settings():
     """Get current settings"""
-    return load_config()
+    return thaw_config(load_config())
 
-@eel.expose
+@expose
 def save_settings(settings):
-    """Save user settings"""
-    save_config(settings)
+    """Save user settings, keeping keys the caller did not send"""
+    save_config({**thaw_config(load_config()), **settings})
     return {'success': True}
 
-@eel.expose
+@expose
+def get_metrics(recent=20):
+    """Per-phase timings, throughput and retry counts aggregated across jobs"""
+    return metrics_snapshot(int(recent))
+
+@expose
+def get_metrics_text():
+    """The same metrics in Prometheus text format"""
+    return metrics_text()
+
+@expose
+def ui_ready():
+    """Called by the page once it has loaded, closing the startup timeline"""
+    mark_startup("UI ready")
+
+@expose
 def select_folder():
     """Open native folder selection dialog"""
     try:
@@ -568,17 +3494,221 @@ def select_folder():
         logging.exception("Error opening folder dialog")
         return None
 
+# Headless HTTP/JSON API
+api = bottle.Bottle()
+
+def api_body():
+    """JSON object sent with an API request"""
+    body = bottle.request.json
+    if not isinstance(body, dict):
+        bottle.abort(400, 'Expected a JSON object')
+    return body
+
+@api.hook('before_request')
+def check_api_token():
+    """Require the configured bearer token, if any"""
+    token = load_config().get('api_token')
+    if token and bottle.request.get_header('Authorization', '') != f'Bearer {token}':
+        bottle.abort(401, 'Missing or invalid API token')
+
+@api.error(400)
+@api.error(401)
+@api.error(404)
+@api.error(405)
+@api.error(500)
+def api_error(error):
+    bottle.response.content_type = 'application/json'
+    return json.dumps({'success': False, 'error': error.body or error.status_line})
+
+@api.get('/api/video-info')
+def api_video_info():
+    url = bottle.request.query.getunicode('url')
+    if not url:
+        bottle.abort(400, 'Missing url parameter')
+    return get_video_info(url)
+
+@api.get('/api/downloads')
+def api_list_downloads():
+    return {'success': True, 'downloads': get_download_queue()}
+
+@api.post('/api/downloads')
+def api_download_video():
+    body = api_body()
+    if not body.get('url'):
+        bottle.abort(400, 'Missing url')
+    return download_video(
+        body['url'],
+        body.get('format_choice', 'video'),
+        str(body.get('quality', '1080')),
+        body.get('download_id') or f"api_{uuid.uuid4().hex[:12]}",
+        format_id=body.get('format_id'),
+        priority=body.get('priority', 0),
+        title=body.get('title')
+    )
+
+@api.post('/api/batches')
+def api_download_batch():
+    body = api_body()
+    return download_batch(
+        body.get('urls') or [],
+        body.get('format_choice', 'video'),
+        str(body.get('quality', '1080')),
+        body.get('batch_id') or f"api_{uuid.uuid4().hex[:12]}"
+    )
+
+@api.delete('/api/downloads/<download_id>')
+def api_cancel_download(download_id):
+    return cancel_download(download_id)
+
+@api.post('/api/downloads/<download_id>/pause')
+def api_pause_download(download_id):
+    return pause_download(download_id)
+
+@api.post('/api/downloads/<download_id>/resume')
+def api_resume_download(download_id):
+    return resume_download(download_id)
+
+@api.get('/api/history')
+def api_history():
+    query = bottle.request.query
+    try:
+        offset, limit = int(query.get('offset', 0)), int(query.get('limit', 100))
+        max_id = int(query['max_id']) if query.get('max_id') else None
+    except ValueError:
+        bottle.abort(400, 'offset, limit and max_id must be integers')
+    search = query.getunicode('search', '')
+    return {
+        'success': True,
+        'total': get_history_count(search, max_id),
+        'items': get_history(offset, limit, search, max_id)
+    }
+
+@api.delete('/api/history')
+def api_clear_history():
+    return clear_history()
+
+@api.get('/api/settings')
+def api_get_settings():
+    return get_settings()
+
+@api.put('/api/settings')
+def api_save_settings():
+    return save_settings(api_body())
+
+@api.get('/api/metrics')
+def api_metrics():
+    try:
+        recent = int(bottle.request.query.get('recent', 20))
+    except ValueError:
+        recent = -1
+    if recent < 0:
+        bottle.abort(400, 'recent must be a non-negative integer')
+    return get_metrics(recent)
+
+@api.get('/metrics')
+def api_metrics_text():
+    bottle.response.content_type = 'text/plain; version=0.0.4; charset=utf-8'
+    return metrics_text()
+
+@api.get('/api/events')
+def api_events():
+    """Server-sent events: each UI event as `event: <name>` with its arguments as a JSON array"""
+    subscriber = queue.Queue(maxsize=EVENT_SUBSCRIBER_BACKLOG)
+    with event_lock:
+        event_subscribers.append(subscriber)
+    bottle.response.content_type = 'text/event-stream'
+    bottle.response.set_header('Cache-Control', 'no-cache')
+    
+    def stream():
+        try:
+            yield ': connected\n\n'
+            while True:
+                try:
+                    name, args = subscriber.get(timeout=EVENT_KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    # Comment lines keep proxies from timing out and reveal dropped clients
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f'event: {name}\ndata: {json.dumps(args, ensure_ascii=False)}\n\n'
+        finally:
+            with event_lock:
+                event_subscribers.remove(subscriber)
+    return stream()
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    """wsgiref server with a thread per request, so event streams do not block other calls"""
+    daemon_threads = True
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        logging.debug(f"API {self.address_string()} {format % args}")
+
+def is_loopback_host(host):
+    """Whether every address a bind host resolves to is a loopback address"""
+    if not host:
+        return False  # all interfaces
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+        return all(ipaddress.ip_address(address).is_loopback for address in addresses)
+    except (socket.gaierror, ValueError):
+        return False
+
+def run_headless(host, port):
+    """Serve the JSON API and thumbnails until interrupted"""
+    # Without a token anyone who can reach the port could change settings or read stored credentials
+    if not is_loopback_host(host) and not load_config().get('api_token'):
+        logging.error(f"Refusing to serve the API on {host}: no api_token is set")
+        raise SystemExit(f"Refusing to serve the API on {host} without an api_token; "
+                         f"set one in {CONFIG_FILE} or bind to 127.0.0.1")
+    api.merge(bottle.default_app())
+    server = make_server(host, port, api, server_class=ThreadingWSGIServer, handler_class=QuietWSGIRequestHandler)
+    logging.info(f"Headless API listening on http://{host}:{port}/api/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
 # Application entry point
 if __name__ == '__main__':
+    multiprocessing.freeze_support()  # extraction processes in the frozen Windows build
+    configure_logging(load_config())
+    add_config_listener(configure_logging)
+    parser = argparse.ArgumentParser(description='Video downloader')
+    parser.add_argument('--headless', action='store_true', help='run without a window, serving a local HTTP/JSON API')
+    parser.add_argument('--host', default='127.0.0.1', help='API bind address in headless mode')
+    parser.add_argument('--port', type=int, default=DEFAULT_API_PORT, help='API port in headless mode')
+    parser.add_argument('--startup-timing', action='store_true', help='log import and startup phase timings')
+    args = parser.parse_args()
+    
     try:
         logging.info("=" * 50)
         logging.info("Application starting...")
         logging.info(f"Download directory: {os.path.abspath(DOWNLOAD_DIR)}")
         logging.info(f"Config file: {os.path.abspath(CONFIG_FILE)}")
-        logging.info(f"History file: {os.path.abspath(HISTORY_FILE)}")
+        logging.info(f"History database: {os.path.abspath(HISTORY_DB)}")
         logging.info("=" * 50)
         
-        eel.start('index.html', size=(1400, 900), port=8080)
+        if startup_timing:
+            logging.info(f"Startup timing: standard library imports took {(STARTUP_STDLIB_LOADED - STARTUP_STARTED) * 1000:.1f} ms, "
+                         f"eel {(STARTUP_EEL_LOADED - STARTUP_STDLIB_LOADED) * 1000:.1f} ms")
+        mark_startup("module loaded")
+        
+        restore_jobs()
+        mark_startup("jobs restored")
+        
+        # yt-dlp import and cache pruning happen while the window loads
+        threading.Thread(target=warm_up, daemon=True, name="WarmUp").start()
+        
+        if args.headless:
+            run_headless(args.host, args.port)
+        elif eel is None:
+            raise SystemExit("Eel is not installed; run with --headless or install the GUI requirements")
+        else:
+            eel.init('web')
+            mark_startup("eel initialized")
+            eel.start('index.html', size=(1400, 900), port=8080)
         
     except Exception:
         logging.exception("Failed to start application")
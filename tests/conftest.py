@@ -0,0 +1,36 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark  # noqa: E402
+
+FILE_SIZE = 1024 * 1024
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """main.py, running in an empty working directory so config, history and downloads stay isolated"""
+    monkeypatch.chdir(tmp_path)
+    module = importlib.import_module('main')
+    monkeypatch.setattr(module, 'config_snapshot', None)
+    monkeypatch.setattr(module, 'config_mtime', None)
+    monkeypatch.setattr(module, 'history_db', None)
+    monkeypatch.setattr(module, 'journal_db', None)
+    return module
+
+
+@pytest.fixture
+def media(app):
+    """Local media server plus a recorder for the events jobs push"""
+    benchmark.app = app
+    server = benchmark.MediaServer(benchmark.ServerProfile(), FILE_SIZE, 4).start()
+    events = benchmark.EventRecorder().start()
+    yield server, events
+    with app.event_lock:
+        app.event_subscribers.remove(events.queue)
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,33 @@
+def test_formats_without_codecs_are_ranked_as_muxed(app):
+    info = {'duration': 10, 'formats': [
+        {'format_id': 'a', 'height': 720, 'tbr': 1000},
+        {'format_id': 'b', 'height': 1080, 'vcodec': 'avc1.640028', 'acodec': 'none', 'tbr': 3000},
+        {'format_id': 'c', 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 128},
+    ]}
+
+    candidates = {c['format_id']: c for c in app.rank_formats(info)}
+
+    assert set(candidates) == {'a', 'b+c'}
+    assert candidates['a']['vcodec'] == candidates['a']['acodec'] == 'unknown'
+    assert candidates['a']['quality'] == 1000
+
+
+def test_unknown_audio_codec_is_not_merged(app):
+    info = {'formats': [
+        {'format_id': 'v', 'height': 480, 'vcodec': 'vp9', 'tbr': 500},
+        {'format_id': 'audio', 'vcodec': 'none', 'acodec': 'opus', 'abr': 160},
+    ]}
+
+    assert [c['format_id'] for c in app.rank_formats(info)] == ['v']
+
+
+def test_storyboards_and_heightless_formats(app):
+    info = {'formats': [
+        {'format_id': 'sb0', 'vcodec': 'none', 'acodec': 'none', 'ext': 'mhtml'},
+        {'format_id': 'direct', 'ext': 'mp4'},
+    ]}
+
+    candidates = app.rank_formats(info)
+
+    assert [c['format_id'] for c in candidates] == ['direct']
+    assert app.format_option(candidates[0])['resolution'] == 'Unknown resolution'
@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+
+def download(app, events, url, download_id):
+    format_id = app.resolve_video_info(url)['formats'][-1]['format_id']
+    app.download_video(url, 'video', '1080', download_id, format_id=format_id)
+    status, _, data = events.wait_for_terminal([download_id], timeout=60)[download_id]
+    return status, data
+
+
+def test_skip_policy_reuses_the_file(app, media, tmp_path):
+    server, events = media
+    download_path = tmp_path / 'downloads'
+    app.save_settings({'download_path': str(download_path), 'duplicate_policy': 'skip'})
+    url = server.url('progressive', 'clip')
+
+    assert download(app, events, url, 'first')[0] == 'completed'
+    sent = server.stats['bytes_sent']
+    status, data = download(app, events, url, 'second')
+
+    assert status == 'completed' and data.get('duplicate')
+    assert server.stats['bytes_sent'] == sent
+    assert os.listdir(download_path) == ['clip.mp4']
+
+
+def test_download_policy_fetches_again(app, media, tmp_path):
+    server, events = media
+    download_path = tmp_path / 'downloads'
+    app.save_settings({'download_path': str(download_path), 'duplicate_policy': 'download'})
+    url = server.url('progressive', 'clip')
+
+    assert download(app, events, url, 'first')[0] == 'completed'
+    sent = server.stats['bytes_sent']
+    status, data = download(app, events, url, 'second')
+
+    assert status == 'completed' and not data.get('duplicate')
+    assert server.stats['bytes_sent'] - sent >= server.file_size
+    assert sorted(os.listdir(download_path)) == ['clip [clip].mp4', 'clip.mp4']
+    assert app.find_downloaded(app.info_archive_id(app.resolve_video_info(url)))[0]['path'] == str(download_path / 'clip [clip].mp4')
@@ -0,0 +1,11 @@
+def test_eviction_drops_aliases(app, monkeypatch):
+    monkeypatch.setattr(app, 'metadata_cache', type(app.metadata_cache)())
+    monkeypatch.setattr(app, 'metadata_aliases', {})
+    for n in range(app.METADATA_CACHE_SIZE * 3):
+        info = {'id': f'v{n}', 'extractor_key': 'Generic', 'webpage_url': f'http://127.0.0.1/watch/{n}', 'title': 'Clip'}
+        app.cache_video_info(f'http://127.0.0.1/{n}', info)
+
+    assert len(app.metadata_cache) == app.METADATA_CACHE_SIZE
+    assert set(app.metadata_aliases.values()) == set(app.metadata_cache)
+    # Evicted entries are still read back from disk
+    assert app.get_cached_video_info('http://127.0.0.1/0')['id'] == 'v0'
@@ -0,0 +1,33 @@
+import pytest
+
+
+def requested_format_error(app):
+    """The error yt-dlp itself raises when a format selector matches nothing"""
+    yt_dlp = app.load_yt_dlp()
+    info = {
+        'id': 'clip', 'title': 'Clip', 'extractor': 'generic', 'extractor_key': 'Generic',
+        'webpage_url': 'http://127.0.0.1/clip', 'formats': [
+            {'format_id': 'mp4', 'url': 'http://127.0.0.1/clip.mp4', 'ext': 'mp4'},
+        ],
+    }
+    with yt_dlp.YoutubeDL({'format': 'missing', 'quiet': True, 'no_warnings': True}) as ydl:
+        with pytest.raises(yt_dlp.utils.YoutubeDLError) as caught:
+            ydl.process_ie_result(info, download=False)
+    return caught.value
+
+
+def test_requested_format_is_permanent(app):
+    error = requested_format_error(app)
+    assert 'Requested format is not available' in str(error)
+    assert app.classify_error(error) == app.ERROR_PERMANENT
+    assert app.format_error_message(str(error)) == "Requested format not available. Try a different quality."
+
+
+@pytest.mark.parametrize('message, kind', [
+    ('ERROR: [youtube] abc: Private video. Sign in if you have been granted access', 'permanent'),
+    ('ERROR: Unable to download webpage: HTTP Error 503: Service Unavailable', 'transient'),
+    ('ERROR: Unable to download webpage: HTTP Error 429: Too Many Requests', 'rate_limited'),
+    ('ERROR: Unable to download webpage: The read operation timed out', 'transient'),
+])
+def test_classify_error(app, message, kind):
+    assert app.classify_error(Exception(message)) == kind
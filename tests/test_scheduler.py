@@ -0,0 +1,24 @@
+def test_resume_while_the_paused_worker_unwinds(app, media, tmp_path, monkeypatch):
+    server, events = media
+    server.profile.bandwidth = 256 * 1024
+    app.save_settings({'download_path': str(tmp_path / 'downloads')})
+    url = server.url('progressive', 'clip')
+
+    park_download = app.park_download
+
+    def resume_then_park(download_id):
+        # The resume lands after the transfer was interrupted but before the worker parks the job
+        assert app.resume_download(download_id)['success']
+        park_download(download_id)
+
+    monkeypatch.setattr(app, 'park_download', resume_then_park)
+    format_id = app.get_video_info(url)['formats'][-1]['format_id']
+    app.download_video(url, 'video', '1080', 'job', format_id=format_id)
+    events.wait_for_progress('job', timeout=30)
+    assert app.pause_download('job')['success']
+
+    status, _, data = events.wait_for_terminal(['job'], timeout=30)['job']
+
+    assert status == 'completed'
+    assert 'job' not in app.active_downloads
+
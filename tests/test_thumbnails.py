@@ -0,0 +1,38 @@
+import http.server
+import threading
+
+
+def test_failed_thumbnail_is_not_refetched_during_cooldown(app, monkeypatch):
+    monkeypatch.setattr(app, 'thumbnail_failures', {})
+    requests = []
+    fetched = threading.Event()
+
+    class Missing(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(self.path)
+            self.send_error(404)
+
+        def log_message(self, *args):
+            pass
+
+    def record_failure(key):
+        record_thumbnail_failure(key)
+        fetched.set()
+
+    record_thumbnail_failure = app.record_thumbnail_failure
+    monkeypatch.setattr(app, 'record_thumbnail_failure', record_failure)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Missing)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/missing.jpg'
+    try:
+        app.request_thumbnail(url, 'missing')
+        assert fetched.wait(10)
+        for _ in range(5):
+            app.present_history_entry({'video_id': 'missing', 'thumbnail': url})
+            assert not app.thumbnail_pending
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert requests == ['/missing.jpg']
+    assert app.cached_thumbnail_url('missing', url) is None
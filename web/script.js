@@ -1,5 +1,8 @@
 let currentVideoInfo = null;
 let downloadCounter = 0;
+let batchCounter = 0;
+// Ids must stay unique across restarts because unfinished jobs are restored
+const sessionId = Date.now().toString(36);
 
 // Tab navigation
 function showTab(tabName) {
@@ -14,7 +17,13 @@ function showTab(tabName) {
     event.target.closest('.nav-links').classList.add('active');
 
     if (tabName === 'history') {
-        loadHistory();
+        // Kept up to date by pushed inserts once loaded; it only needs drawing again
+        if (historyView.loaded) {
+            historyView.rowHeight = 0;
+            scheduleHistoryRender();
+        } else {
+            loadHistory();
+        }
     } else if (tabName === 'settings') {
         loadSettings();
     }
@@ -114,14 +123,27 @@ function displayVideoPreview(info) {
     description.textContent = info.description || 'No description available';
     duration.textContent = formatDuration(info.duration);
 
+    // Renditions already on disk; downloading one of them again is skipped
+    const downloaded = document.getElementById('video-downloaded');
+    if (info.downloaded && info.downloaded.length > 0) {
+        downloaded.textContent = `✓ Already downloaded: ${info.downloaded.map(d => d.variant).join(', ')}`;
+        downloaded.title = info.downloaded.map(d => d.path).join('\n');
+        downloaded.style.display = 'inline-block';
+    } else {
+        downloaded.style.display = 'none';
+    }
+
     // Populate quality options with file sizes
     qualitySelect.innerHTML = '';
     if (info.formats && info.formats.length > 0) {
         info.formats.forEach(format => {
             const option = document.createElement('option');
-            option.value = format.resolution.replace('p', '');
+            option.value = format.height;
+            option.dataset.formatId = format.format_id;
+            const fpsText = format.fps > 30 ? Math.round(format.fps) : '';
+            const codecText = format.vcodec.split('.')[0];
             const sizeText = format.filesize ? ` - ${formatFileSize(format.filesize)}` : '';
-            option.textContent = `${format.resolution} (${format.ext})${sizeText}`;
+            option.textContent = `${format.resolution}${fpsText} (${format.ext}, ${codecText})${sizeText}`;
             qualitySelect.appendChild(option);
         });
         qualitySelect.selectedIndex = qualitySelect.options.length - 1;
@@ -144,8 +166,24 @@ async function startDownload() {
     if (!currentVideoInfo) return;
 
     const format = document.getElementById('format-select').value;
-    const quality = document.getElementById('quality-select').value;
-    const downloadId = `download_${++downloadCounter}`;
+    const qualitySelect = document.getElementById('quality-select');
+    const maxSize = parseFloat(document.getElementById('max-size').value);
+    let quality = qualitySelect.value;
+    let formatId = qualitySelect.selectedOptions[0]?.dataset.formatId || null;
+
+    // A size budget overrides the resolution picked in the list
+    if (format === 'video' && maxSize > 0) {
+        const picked = await eel.pick_format(currentVideoInfo.url, maxSize)();
+        if (picked.success) {
+            quality = picked.format.height;
+            formatId = picked.format.format_id;
+        } else {
+            showNotification(picked.error, 'error');
+            return;
+        }
+    }
+
+    const downloadId = `download_${sessionId}_${++downloadCounter}`;
 
     createDownloadItem(downloadId, currentVideoInfo);
 
@@ -154,7 +192,10 @@ async function startDownload() {
             currentVideoInfo.url,
             format,
             quality,
-            downloadId
+            downloadId,
+            formatId,
+            0,
+            currentVideoInfo.title
         )();
 
         if (!result.success) {
@@ -165,6 +206,45 @@ async function startDownload() {
     }
 }
 
+// Queue every video behind the pasted URLs, playlists or channels
+async function queueBatch() {
+    const urls = document.getElementById('input-url').value.trim().split(/\s+/).filter(Boolean);
+    if (urls.length === 0) return;
+
+    const format = document.getElementById('format-select').value;
+    const quality = document.getElementById('quality-select').value || '1080';
+    const batchId = `batch_${sessionId}_${++batchCounter}`;
+
+    try {
+        const result = await eel.download_batch(urls, format, quality, batchId)();
+        if (result.success) {
+            showNotification('Expanding links and queueing downloads...', 'info');
+        } else {
+            showNotification(result.error, 'error');
+        }
+    } catch (err) {
+        showNotification(err.toString(), 'error');
+    }
+}
+
+// A batch entry was discovered and queued (called from Python)
+eel.expose(download_added);
+function download_added(downloadId, info) {
+    if (!document.getElementById(downloadId)) {
+        createDownloadItem(downloadId, info);
+    }
+}
+
+eel.expose(batch_error);
+function batch_error(batchId, data) {
+    showNotification(`${data.message} (${data.url})`, 'error');
+}
+
+eel.expose(batch_finished);
+function batch_finished(batchId, data) {
+    showNotification(`Queued ${data.count} download(s)`, 'success');
+}
+
 // Create download item UI
 function createDownloadItem(downloadId, videoInfo) {
     const container = document.getElementById('downloads-container');
@@ -178,6 +258,7 @@ function createDownloadItem(downloadId, videoInfo) {
             <div class="download-title">${videoInfo.title}</div>
             <div class="download-actions">
                 <span class="download-status">Initializing...</span>
+                <button class="pause-btn" onclick="togglePause('${downloadId}')">Pause</button>
                 <button class="cancel-btn" onclick="cancelDownload('${downloadId}')">
                     <svg xmlns="http://www.w3.org/2000/svg" width="14" height="14" fill="currentColor" viewBox="0 0 16 16">
                         <path d="M16 8A8 8 0 1 1 0 8a8 8 0 0 1 16 0M5.354 4.646a.5.5 0 1 0-.708.708L7.293 8l-2.647 2.646a.5.5 0 0 0 .708.708L8 8.707l2.646 2.647a.5.5 0 0 0 .708-.708L8.707 8l2.647-2.646a.5.5 0 0 0-.708-.708L8 7.293z"/>
@@ -200,9 +281,30 @@ function createDownloadItem(downloadId, videoInfo) {
     container.insertBefore(item, container.firstChild);
 }
 
+// Progress is drawn once per animation frame; a download that changed several times since
+// the last frame is drawn once, in its latest state
+const pendingProgress = new Map();
+let progressFrame = null;
+
 // Update progress (called from Python)
 eel.expose(update_progress);
 function update_progress(downloadId, data) {
+    pendingProgress.set(downloadId, data);
+    if (progressFrame === null) {
+        progressFrame = requestAnimationFrame(flushProgress);
+    }
+}
+
+function flushProgress() {
+    progressFrame = null;
+    const updates = [...pendingProgress];
+    pendingProgress.clear();
+    for (const [downloadId, data] of updates) {
+        drawProgress(downloadId, data);
+    }
+}
+
+function drawProgress(downloadId, data) {
     const item = document.getElementById(downloadId);
     if (!item) return;
 
@@ -213,12 +315,34 @@ function update_progress(downloadId, data) {
     const eta = item.querySelector('.download-eta');
     const percent = item.querySelector('.download-percent');
 
-    if (data.status === 'downloading') {
+    const pauseBtn = item.querySelector('.pause-btn');
+
+    if (data.status === 'queued') {
+        status.textContent = 'Queued';
+        status.style.color = '#94a3b8';
+        status.style.background = 'rgba(148, 163, 184, 0.1)';
+        item.dataset.paused = '';
+        pauseBtn.textContent = 'Pause';
+
+    } else if (data.status === 'paused') {
+        status.textContent = 'Paused';
+        status.style.color = '#94a3b8';
+        status.style.background = 'rgba(148, 163, 184, 0.1)';
+        item.dataset.paused = 'true';
+        pauseBtn.textContent = 'Resume';
+
+    } else if (data.status === 'extracting') {
+        status.textContent = data.message || 'Fetching video info...';
+        status.style.color = '#94a3b8';
+        status.style.background = 'rgba(148, 163, 184, 0.1)';
+
+    } else if (data.status === 'downloading') {
         const percentValue = data.percent.toFixed(1);
         progressFill.style.width = percentValue + '%';
         
         const speedMB = (data.speed / 1024 / 1024).toFixed(2);
-        speed.textContent = `⚡ Speed: ${speedMB} MB/s`;
+        const capText = data.rate_limit ? ` (limit ${(data.rate_limit / 1024 / 1024).toFixed(2)})` : '';
+        speed.textContent = `⚡ Speed: ${speedMB} MB/s${capText}`;
         
         const downloaded = formatFileSize(data.downloaded);
         const total = formatFileSize(data.total);
@@ -234,11 +358,19 @@ function update_progress(downloadId, data) {
         status.style.color = '#3b82f6';
         status.style.background = 'rgba(59, 130, 246, 0.1)';
         
+    } else if (data.status === 'queued_processing') {
+        progressFill.style.width = '100%';
+        status.textContent = 'Queued for processing';
+        status.style.color = '#a78bfa';
+        status.style.background = 'rgba(167, 139, 250, 0.1)';
+        pauseBtn.style.display = 'none';
+        
     } else if (data.status === 'processing') {
         progressFill.style.width = '100%';
-        status.textContent = 'Processing...';
+        status.textContent = data.message || 'Processing...';
         status.style.color = '#f59e0b';
         status.style.background = 'rgba(245, 158, 11, 0.1)';
+        pauseBtn.style.display = 'none';
         
     } else if (data.status === 'retrying') {
         status.textContent = data.message || `Retrying (${data.retry_count})...`;
@@ -247,12 +379,13 @@ function update_progress(downloadId, data) {
         
     } else if (data.status === 'completed') {
         progressFill.style.width = '100%';
-        status.textContent = '✓ Completed!';
+        status.textContent = data.duplicate ? '✓ Already downloaded' : '✓ Completed!';
         status.style.color = '#10b981';
         status.style.background = 'rgba(16, 185, 129, 0.1)';
         item.querySelector('.cancel-btn').style.display = 'none';
+        pauseBtn.style.display = 'none';
         
-        showNotification('Download completed successfully!', 'success');
+        showNotification(data.duplicate ? data.message : 'Download completed successfully!', 'success');
         
         setTimeout(() => {
             item.style.opacity = '0';
@@ -275,12 +408,21 @@ function update_progress(downloadId, data) {
         item.appendChild(errorMsg);
         
         showNotification(data.message, 'error');
+        pauseBtn.style.display = 'none';
         
         item.querySelector('.cancel-btn').textContent = 'Remove';
         item.querySelector('.cancel-btn').onclick = () => item.remove();
     }
 }
 
+// Batched progress updates (called from Python at a fixed rate)
+eel.expose(update_progress_batch);
+function update_progress_batch(updates) {
+    for (const [downloadId, data] of Object.entries(updates)) {
+        update_progress(downloadId, data);
+    }
+}
+
 // Cancel download
 async function cancelDownload(downloadId) {
     await eel.cancel_download(downloadId)();
@@ -294,64 +436,71 @@ async function cancelDownload(downloadId) {
     }
 }
 
+// Pause or resume a queued/running download
+async function togglePause(downloadId) {
+    const item = document.getElementById(downloadId);
+    if (!item) return;
+
+    const result = item.dataset.paused
+        ? await eel.resume_download(downloadId)()
+        : await eel.pause_download(downloadId)();
+
+    if (!result.success) {
+        showNotification(result.error, 'error');
+    }
+}
+
+// History: a virtual list over the history table. Only the rows near the viewport are in
+// the DOM, pages are fetched as they scroll into range, and downloads that finish while
+// the list is open are pushed in from Python.
+const HISTORY_PAGE_SIZE = 50;
+const HISTORY_OVERSCAN = 4;     // rows kept rendered above and below the viewport
+const HISTORY_ROW_GAP = 24;     // px between rows
+const HISTORY_MAX_PAGES = 20;   // fetched pages kept in memory
+const THUMBNAIL_PLACEHOLDER = 'data:image/svg+xml,%3Csvg xmlns="http://www.w3.org/2000/svg" width="280" height="158"%3E%3Crect fill="%231a1a1a" width="280" height="158"/%3E%3C/svg%3E';
+const THUMBNAIL_MISSING = 'data:image/svg+xml,%3Csvg xmlns="http://www.w3.org/2000/svg" width="280" height="158"%3E%3Crect fill="%231a1a1a" width="280" height="158"/%3E%3Ctext fill="%23666" x="50%25" y="50%25" text-anchor="middle" dy=".3em" font-family="sans-serif"%3ENo Image%3C/text%3E%3C/svg%3E';
+
+const historyView = {
+    loaded: false,
+    generation: 0,      // bumped on reload; page responses for older generations are dropped
+    anchorId: 0,        // newest entry when the list was loaded; pages are fetched up to it
+    total: 0,           // entries up to anchorId
+    head: [],           // entries pushed since, newest first
+    inserted: 0,        // pushed entries not yet compensated for in the scroll position
+    pages: new Map(),   // page index -> entries
+    pending: new Set(), // page indexes being fetched
+    rows: new Map(),    // entry id (or "pending-<index>") -> row element
+    rowHeight: 0,
+    frame: null
+};
+let thumbnailObserver = null;
+
 // Load history
 async function loadHistory() {
-    const historyList = document.getElementById('history-list');
-    historyList.innerHTML = '<div style="text-align: center; padding: 2rem; color: var(--text-secondary);">Loading history...</div>';
-    
-    try {
-        const history = await eel.get_history()();
-        
-        if (history.length === 0) {
-            historyList.innerHTML = `
-                <div style="text-align: center; padding: 4rem; color: var(--text-secondary);">
-                    <svg xmlns="http://www.w3.org/2000/svg" width="64" height="64" fill="currentColor" viewBox="0 0 16 16" style="opacity: 0.3; margin-bottom: 1rem;">
-                        <path d="M8.515 1.019A7 7 0 0 0 8 1V0a8 8 0 0 1 .589.022zm2.004.45a7 7 0 0 0-.985-.299l.219-.976q.576.129 1.126.342zm1.37.71a7 7 0 0 0-.439-.27l.493-.87a8 8 0 0 1 .979.654l-.615.789a7 7 0 0 0-.418-.302zm1.834 1.79a7 7 0 0 0-.653-.796l.724-.69q.406.429.747.91zm.744 1.352a7 7 0 0 0-.214-.468l.893-.45a8 8 0 0 1 .45 1.088l-.95.313a7 7 0 0 0-.179-.483m.53 2.507a7 7 0 0 0-.1-1.025l.985-.17q.1.58.116 1.17zm-.131 1.538q.05-.254.081-.51l.993.123a8 8 0 0 1-.23 1.155l-.964-.267q.069-.247.12-.501m-.952 2.379q.276-.436.486-.908l.914.405q-.24.54-.555 1.038zm-.964 1.205q.183-.183.35-.378l.758.653a8 8 0 0 1-.401.432z"/>
-                        <path d="M8 1a7 7 0 1 0 4.95 11.95l.707.707A8.001 8.001 0 1 1 8 0z"/>
-                        <path d="M7.5 3a.5.5 0 0 1 .5.5v5.21l3.248 1.856a.5.5 0 0 1-.496.868l-3.5-2A.5.5 0 0 1 7 9V3.5a.5.5 0 0 1 .5-.5"/>
-                    </svg>
-                    <p style="font-size: 1.1rem; margin-bottom: 0.5rem;">No download history yet</p>
-                    <p style="font-size: 0.9rem;">Your completed downloads will appear here</p>
-                </div>
-            `;
-            return;
-        }
+    const list = document.getElementById('history-list');
+    const generation = ++historyView.generation;
+    Object.assign(historyView, {
+        loaded: false, anchorId: 0, total: 0, head: [], inserted: 0,
+        pages: new Map(), pending: new Set(), rows: new Map()
+    });
+    list.style.height = '';
+    list.innerHTML = '<div style="text-align: center; padding: 2rem; color: var(--text-secondary);">Loading history...</div>';
 
-        historyList.innerHTML = '';
-        history.forEach(item => {
-            const historyItem = document.createElement('div');
-            historyItem.className = 'history-item';
-            
-            const date = new Date(item.timestamp);
-            const dateStr = date.toLocaleDateString('en-US', { 
-                month: 'short', 
-                day: 'numeric', 
-                year: 'numeric',
-                hour: '2-digit',
-                minute: '2-digit'
-            });
-            
-            const duration = formatDuration(item.duration);
-            const filesize = item.filesize ? formatFileSize(item.filesize) : 'Unknown size';
-            
-            // Thumbnail is stored as original URL, display it directly
-            const thumbSrc = item.thumbnail || 'data:image/svg+xml,%3Csvg xmlns="http://www.w3.org/2000/svg" width="280" height="158"%3E%3Crect fill="%231a1a1a" width="280" height="158"/%3E%3Ctext fill="%23666" x="50%25" y="50%25" text-anchor="middle" dy=".3em" font-family="sans-serif"%3ENo Image%3C/text%3E%3C/svg%3E';
-            
-            historyItem.innerHTML = `
-                <img src="${thumbSrc}" alt="Thumbnail" onerror="this.src='data:image/svg+xml,%3Csvg xmlns=%22http://www.w3.org/2000/svg%22 width=%22280%22 height=%22158%22%3E%3Crect fill=%22%231a1a1a%22 width=%22280%22 height=%22158%22/%3E%3Ctext fill=%22%23666%22 x=%2250%25%22 y=%2250%25%22 text-anchor=%22middle%22 dy=%22.3em%22 font-family=%22sans-serif%22%3ENo Image%3C/text%3E%3C/svg%3E'">
-                <div class="history-item-info">
-                    <h3>${item.title}</h3>
-                    <p>📊 Format: ${item.format} • 💾 ${filesize}</p>
-                    <p>⏱️ Duration: ${duration}</p>
-                    <p>📅 Downloaded: ${dateStr}</p>
-                    <p style="word-break: break-all; font-size: 0.85em; opacity: 0.6;">🔗 ${item.url}</p>
-                </div>
-            `;
-            
-            historyList.appendChild(historyItem);
-        });
+    try {
+        const firstPage = await eel.get_history(0, HISTORY_PAGE_SIZE)();
+        const anchorId = firstPage.length > 0 ? firstPage[0].id : 0;
+        const total = firstPage.length < HISTORY_PAGE_SIZE ? firstPage.length : await eel.get_history_count('', anchorId)();
+        if (generation !== historyView.generation) return;
+
+        Object.assign(historyView, { loaded: true, anchorId, total });
+        // Entries pushed while this was loading are already in the first page
+        historyView.head = historyView.head.filter(item => item.id > anchorId);
+        historyView.pages.set(0, firstPage);
+        list.innerHTML = '';
+        renderHistory();
     } catch (err) {
-        historyList.innerHTML = `
+        if (generation !== historyView.generation) return;
+        list.innerHTML = `
             <div style="text-align: center; padding: 2rem; color: var(--danger);">
                 Error loading history. Please try again.
             </div>
@@ -359,6 +508,221 @@ async function loadHistory() {
     }
 }
 
+// A download finished (called from Python)
+eel.expose(history_added);
+function history_added(item) {
+    // Nothing to update until the history tab has been opened
+    if (historyView.generation === 0) return;
+    if (item.id <= historyView.anchorId || historyView.head.some(entry => entry.id === item.id)) return;
+    historyView.head.unshift(item);
+    historyView.inserted++;
+    scheduleHistoryRender();
+}
+
+function scheduleHistoryRender() {
+    if (historyView.frame === null) {
+        historyView.frame = requestAnimationFrame(renderHistory);
+    }
+}
+
+// Entry shown at a position in the list, or undefined while its page is being fetched
+function historyEntry(index) {
+    if (index < historyView.head.length) return historyView.head[index];
+    const offset = index - historyView.head.length;
+    const page = Math.floor(offset / HISTORY_PAGE_SIZE);
+    const entries = historyView.pages.get(page);
+    if (entries) return entries[offset % HISTORY_PAGE_SIZE];
+    fetchHistoryPage(page);
+    return undefined;
+}
+
+async function fetchHistoryPage(page) {
+    if (historyView.pending.has(page)) return;
+    const generation = historyView.generation;
+    historyView.pending.add(page);
+    try {
+        const entries = await eel.get_history(page * HISTORY_PAGE_SIZE, HISTORY_PAGE_SIZE, '', historyView.anchorId)();
+        if (generation !== historyView.generation) return;
+        historyView.pages.set(page, entries);
+        scheduleHistoryRender();
+    } catch (err) {
+        console.error('Failed to load history page', err);
+    } finally {
+        if (generation === historyView.generation) historyView.pending.delete(page);
+    }
+}
+
+// Rows all have the same height, so positions are computed instead of laid out
+function renderHistory() {
+    historyView.frame = null;
+    const list = document.getElementById('history-list');
+    // Skipped while the tab is hidden; showing it renders again
+    if (!historyView.loaded || list.offsetParent === null) return;
+
+    const count = historyView.head.length + historyView.total;
+    if (count === 0) {
+        list.style.height = '';
+        if (!list.querySelector('.history-empty')) showEmptyHistory(list);
+        return;
+    }
+    list.querySelector('.history-empty')?.remove();
+
+    if (!historyView.rowHeight) historyView.rowHeight = measureHistoryRow(list);
+    const slot = historyView.rowHeight + HISTORY_ROW_GAP;
+    list.style.height = `${count * slot - HISTORY_ROW_GAP}px`;
+
+    // Keep the rows on screen in place when entries are inserted above them
+    const scroller = historyScroller();
+    let listTop = list.getBoundingClientRect().top;
+    const viewTop = Math.max(0, scroller === document.scrollingElement ? 0 : scroller.getBoundingClientRect().top);
+    if (historyView.inserted > 0) {
+        if (listTop < viewTop) {
+            scroller.scrollTop += historyView.inserted * slot;
+            listTop = list.getBoundingClientRect().top;
+        }
+        historyView.inserted = 0;
+    }
+
+    const visibleTop = viewTop - listTop;
+    const first = Math.max(0, Math.floor(visibleTop / slot) - HISTORY_OVERSCAN);
+    const last = Math.min(count - 1, Math.ceil((visibleTop + window.innerHeight) / slot) + HISTORY_OVERSCAN);
+
+    const wanted = new Map();
+    for (let index = first; index <= last; index++) {
+        const item = historyEntry(index);
+        wanted.set(item ? item.id : `pending-${index}`, [index, item]);
+    }
+    for (const [key, row] of historyView.rows) {
+        if (!wanted.has(key)) {
+            if (thumbnailObserver) thumbnailObserver.unobserve(row.querySelector('img'));
+            row.remove();
+            historyView.rows.delete(key);
+        }
+    }
+    for (const [key, [index, item]] of wanted) {
+        const position = `translateY(${index * slot}px)`;
+        let row = historyView.rows.get(key);
+        if (!row) {
+            // Positioned before insertion, so new rows do not slide in from the top
+            row = createHistoryRow(item);
+            row.style.transform = position;
+            list.appendChild(row);
+            historyView.rows.set(key, row);
+        } else if (row.style.transform !== position) {
+            row.style.transform = position;
+        }
+    }
+
+    pruneHistoryPages(Math.floor((first + last) / 2 / HISTORY_PAGE_SIZE));
+}
+
+// Drop the fetched pages furthest from the viewport
+function pruneHistoryPages(currentPage) {
+    const excess = historyView.pages.size - HISTORY_MAX_PAGES;
+    if (excess <= 0) return;
+    [...historyView.pages.keys()]
+        .sort((a, b) => Math.abs(b - currentPage) - Math.abs(a - currentPage))
+        .slice(0, excess)
+        .forEach(page => historyView.pages.delete(page));
+}
+
+// The element that scrolls the history list: the page itself unless #main scrolls on its own
+function historyScroller() {
+    const main = document.getElementById('main');
+    return main.scrollHeight > main.clientHeight ? main : document.scrollingElement;
+}
+
+function measureHistoryRow(list) {
+    const probe = createHistoryRow(undefined);
+    probe.style.visibility = 'hidden';
+    list.appendChild(probe);
+    const height = probe.offsetHeight;
+    probe.remove();
+    return height;
+}
+
+function createHistoryRow(item) {
+    const row = document.createElement('div');
+    row.className = 'history-item';
+    if (!item) {
+        // Placeholder with the same layout, shown until its page arrives
+        row.classList.add('history-item-loading');
+        row.innerHTML = `
+            <img src="${THUMBNAIL_PLACEHOLDER}" alt="">
+            <div class="history-item-info">
+                <h3>Loading...</h3>
+                <p>&nbsp;</p>
+                <p>&nbsp;</p>
+                <p>&nbsp;</p>
+                <p>&nbsp;</p>
+            </div>
+        `;
+        return row;
+    }
+
+    const date = new Date(item.timestamp);
+    const dateStr = date.toLocaleDateString('en-US', { 
+        month: 'short', 
+        day: 'numeric', 
+        year: 'numeric',
+        hour: '2-digit',
+        minute: '2-digit'
+    });
+    
+    const duration = formatDuration(item.duration);
+    const filesize = item.filesize ? formatFileSize(item.filesize) : 'Unknown size';
+    
+    row.innerHTML = `
+        <img src="${THUMBNAIL_PLACEHOLDER}" alt="Thumbnail">
+        <div class="history-item-info">
+            <h3>${item.title}</h3>
+            <p>📊 Format: ${item.format} • 💾 ${filesize}</p>
+            <p>⏱️ Duration: ${duration}</p>
+            <p>📅 Downloaded: ${dateStr}</p>
+            <p class="history-item-url">🔗 ${item.url}</p>
+        </div>
+    `;
+
+    // Thumbnail points at the local cache once fetched, otherwise the original URL; loaded when it comes into view
+    const img = row.querySelector('img');
+    img.onerror = () => { img.onerror = null; img.src = THUMBNAIL_MISSING; };
+    if (item.thumbnail) {
+        img.dataset.src = item.thumbnail;
+        observeThumbnail(img);
+    } else {
+        img.src = THUMBNAIL_MISSING;
+    }
+    return row;
+}
+
+function observeThumbnail(img) {
+    if (!thumbnailObserver) {
+        thumbnailObserver = new IntersectionObserver(entries => {
+            entries.forEach(entry => {
+                if (entry.isIntersecting) {
+                    entry.target.src = entry.target.dataset.src;
+                    thumbnailObserver.unobserve(entry.target);
+                }
+            });
+        }, { rootMargin: '200px 0px' });
+    }
+    thumbnailObserver.observe(img);
+}
+
+function showEmptyHistory(list) {
+    list.innerHTML = `
+        <div class="history-empty" style="text-align: center; padding: 4rem; color: var(--text-secondary);">
+            <svg xmlns="http://www.w3.org/2000/svg" width="64" height="64" fill="currentColor" viewBox="0 0 16 16" style="opacity: 0.3; margin-bottom: 1rem;">
+                <path d="M8.515 1.019A7 7 0 0 0 8 1V0a8 8 0 0 1 .589.022zm2.004.45a7 7 0 0 0-.985-.299l.219-.976q.576.129 1.126.342zm1.37.71a7 7 0 0 0-.439-.27l.493-.87a8 8 0 0 1 .979.654l-.615.789a7 7 0 0 0-.418-.302zm1.834 1.79a7 7 0 0 0-.653-.796l.724-.69q.406.429.747.91zm.744 1.352a7 7 0 0 0-.214-.468l.893-.45a8 8 0 0 1 .45 1.088l-.95.313a7 7 0 0 0-.179-.483m.53 2.507a7 7 0 0 0-.1-1.025l.985-.17q.1.58.116 1.17zm-.131 1.538q.05-.254.081-.51l.993.123a8 8 0 0 1-.23 1.155l-.964-.267q.069-.247.12-.501m-.952 2.379q.276-.436.486-.908l.914.405q-.24.54-.555 1.038zm-.964 1.205q.183-.183.35-.378l.758.653a8 8 0 0 1-.401.432z"/>
+                <path d="M8 1a7 7 0 1 0 4.95 11.95l.707.707A8.001 8.001 0 1 1 8 0z"/>
+                <path d="M7.5 3a.5.5 0 0 1 .5.5v5.21l3.248 1.856a.5.5 0 0 1-.496.868l-3.5-2A.5.5 0 0 1 7 9V3.5a.5.5 0 0 1 .5-.5"/>
+            </svg>
+            <p style="font-size: 1.1rem; margin-bottom: 0.5rem;">No download history yet</p>
+            <p style="font-size: 0.9rem;">Your completed downloads will appear here</p>
+        </div>
+    `;
+}
+
 // Clear history
 async function clearHistory() {
     if (confirm('Are you sure you want to clear all download history? This cannot be undone.')) {
@@ -376,6 +740,14 @@ async function loadSettings() {
         document.getElementById('download-path').value = settings.download_path || 'downloads';
         document.getElementById('max-retries').value = settings.max_retries || 5;
         document.getElementById('retry-delay').value = settings.retry_delay || 3;
+        document.getElementById('max-concurrent-downloads').value = settings.max_concurrent_downloads || 3;
+        document.getElementById('bandwidth-limit').value = settings.bandwidth_limit || 0;
+        document.getElementById('host-bandwidth-limits').value = Object.entries(settings.host_bandwidth_limits || {})
+            .map(([host, limit]) => `${host} = ${limit}`)
+            .join('\n');
+        document.getElementById('bandwidth-schedule').value = (settings.bandwidth_schedule || [])
+            .map(rule => `${rule.start}-${rule.end} = ${rule.limit}`)
+            .join('\n');
         
         if (settings.credentials) {
             document.getElementById('username').value = settings.credentials.username || '';
@@ -405,6 +777,10 @@ async function saveSettings() {
         download_path: document.getElementById('download-path').value || 'downloads',
         max_retries: parseInt(document.getElementById('max-retries').value) || 5,
         retry_delay: parseInt(document.getElementById('retry-delay').value) || 3,
+        max_concurrent_downloads: parseInt(document.getElementById('max-concurrent-downloads').value) || 3,
+        bandwidth_limit: parseInt(document.getElementById('bandwidth-limit').value) || 0,
+        host_bandwidth_limits: parseHostLimits(document.getElementById('host-bandwidth-limits').value),
+        bandwidth_schedule: parseBandwidthSchedule(document.getElementById('bandwidth-schedule').value),
         credentials: {
             username: document.getElementById('username').value,
             password: document.getElementById('password').value
@@ -419,6 +795,30 @@ async function saveSettings() {
     }
 }
 
+// Parse "host = KB/s" lines
+function parseHostLimits(text) {
+    const limits = {};
+    text.split('\n').forEach(line => {
+        const [host, limit] = line.split('=').map(part => part.trim());
+        if (host && parseInt(limit) > 0) {
+            limits[host] = parseInt(limit);
+        }
+    });
+    return limits;
+}
+
+// Parse "HH:MM-HH:MM = KB/s" lines
+function parseBandwidthSchedule(text) {
+    const rules = [];
+    text.split('\n').forEach(line => {
+        const match = line.match(/^\s*(\d{1,2}:\d{2})\s*-\s*(\d{1,2}:\d{2})\s*=\s*(\d+)\s*$/);
+        if (match) {
+            rules.push({ start: match[1].padStart(5, '0'), end: match[2].padStart(5, '0'), limit: parseInt(match[3]) });
+        }
+    });
+    return rules;
+}
+
 // Helper functions
 function formatDuration(seconds) {
     if (!seconds) return 'Unknown';
@@ -502,6 +902,29 @@ style.textContent = `
 document.head.appendChild(style);
 
 // Initialize
+// Show jobs restored from the journal or still queued from before a reload
+async function restoreDownloads() {
+    try {
+        const jobs = await eel.get_download_queue()();
+        jobs.forEach(job => {
+            if (!document.getElementById(job.download_id)) {
+                createDownloadItem(job.download_id, job);
+                update_progress(job.download_id, { status: job.state === 'running' ? 'queued' : job.state });
+            }
+        });
+    } catch (err) {
+        console.error('Failed to restore downloads', err);
+    }
+}
+
 document.addEventListener('DOMContentLoaded', () => {
     console.log('ytdlp WebUI loaded - Enhanced version');
+    // Scroll events do not bubble; capture catches the page and #main alike
+    document.addEventListener('scroll', scheduleHistoryRender, { capture: true, passive: true });
+    window.addEventListener('resize', () => {
+        historyView.rowHeight = 0;
+        scheduleHistoryRender();
+    });
+    eel.ui_ready();
+    restoreDownloads();
 });
\ No newline at end of file